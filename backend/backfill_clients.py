@@ -0,0 +1,156 @@
+"""
+Script pentru reconstruirea colectiei `clients` din fise.
+
+Pentru fiecare tenant, grupeaza fisele dupa (client_name, client_phone) si scrie
+in `clients`: ticket_count, first_seen, last_seen si lifetime_estimated_cost.
+Documentele existente sunt suprascrise cu valorile recalculate, iar
+`search_tokens` (folosit de cautarea de clienti) este regenerat.
+"""
+import os
+import re
+import asyncio
+import unicodedata
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.getenv("DB_NAME", "fixgsm_db")
+
+# Must match server.py
+CLIENT_SEARCH_MIN_TOKEN = 2
+CLIENT_SEARCH_MAX_TOKEN = 15
+
+def fold_text(value):
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def phone_digits(value):
+    digits = re.sub(r"\D", "", value or "")
+    if (value or "").strip().startswith("+40") or (digits.startswith("40") and len(digits) == 11):
+        return "0" + digits[2:]
+    if digits.startswith("0040"):
+        return "0" + digits[4:]
+    return digits
+
+def client_search_tokens(name, phone):
+    tokens = set()
+    for word in re.split(r"[^a-z0-9]+", fold_text(name)):
+        for end in range(CLIENT_SEARCH_MIN_TOKEN, min(len(word), CLIENT_SEARCH_MAX_TOKEN) + 1):
+            tokens.add(word[:end])
+    digits = phone_digits(phone)
+    for number in {digits, digits.lstrip("0")}:
+        for end in range(CLIENT_SEARCH_MIN_TOKEN, min(len(number), CLIENT_SEARCH_MAX_TOKEN) + 1):
+            tokens.add(number[:end])
+    return sorted(tokens)
+
+def clients_pipeline(tenant_id):
+    """Aggregate one tenant's tickets into client documents (same shape as server.py)"""
+    name_expr = {"$cond": [{"$in": ["$client_name", [None, ""]]}, "-", "$client_name"]}
+    phone_expr = {"$cond": [{"$in": ["$client_phone", [None, ""]]}, "-", "$client_phone"]}
+    return [
+        {"$match": {"tenant_id": tenant_id}},
+        {"$group": {
+            "_id": {"name": name_expr, "phone": phone_expr},
+            "ticket_count": {"$sum": 1},
+            "lifetime_estimated_cost": {"$sum": {"$ifNull": ["$estimated_cost", 0]}},
+            "first_seen": {"$min": "$created_at"},
+            "last_seen": {"$max": "$created_at"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "tenant_id": {"$literal": tenant_id},
+            "client_id": {"$concat": ["$_id.name", "|", "$_id.phone"]},
+            "name": "$_id.name",
+            "phone": "$_id.phone",
+            "email": None,
+            "ticket_count": 1,
+            "lifetime_estimated_cost": 1,
+            "first_seen": 1,
+            "last_seen": 1,
+            "created_at": "$first_seen"
+        }}
+    ]
+
+async def backfill_clients(apply_changes: bool):
+    """Rebuild materialized clients for every tenant"""
+
+    print("Conectare la MongoDB...")
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    try:
+        tenant_ids = await db["tickets"].distinct("tenant_id")
+        print(f"\nGasit {len(tenant_ids)} tenant(s) cu fise\n")
+
+        total_clients = 0
+        total_removed = 0
+
+        for tenant_id in tenant_ids:
+            pipeline = clients_pipeline(tenant_id)
+
+            if not apply_changes:
+                rows = await db["tickets"].aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+                print(f"   DRY-RUN: {tenant_id} -> {len(rows)} clienti")
+                total_clients += len(rows)
+                continue
+
+            pipeline.append({"$merge": {
+                "into": "clients",
+                "on": ["tenant_id", "client_id"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }})
+            await db["tickets"].aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+
+            # Drop clients whose tickets no longer exist
+            rows = await db["tickets"].aggregate(clients_pipeline(tenant_id), allowDiskUse=True).to_list(length=None)
+            client_ids = [row["client_id"] for row in rows]
+
+            # Rebuild typeahead tokens
+            operations = [
+                UpdateOne(
+                    {"tenant_id": tenant_id, "client_id": row["client_id"]},
+                    {"$set": {"search_tokens": client_search_tokens(row["name"], row["phone"])}}
+                )
+                for row in rows
+            ]
+            if operations:
+                await db["clients"].bulk_write(operations, ordered=False)
+            removed = await db["clients"].delete_many({"tenant_id": tenant_id, "client_id": {"$nin": client_ids}})
+
+            print(f"   SUCCESS: {tenant_id} -> {len(client_ids)} clienti ({removed.deleted_count} stersi)")
+            total_clients += len(client_ids)
+            total_removed += removed.deleted_count
+
+        print(f"\n{'='*60}")
+        print(f"Backfill finalizat!" if apply_changes else "Dry-run finalizat!")
+        print(f"Total clienti: {total_clients}")
+        print(f"Total clienti stersi: {total_removed}")
+        print(f"{'='*60}\n")
+
+    except Exception as e:
+        print(f"\nERROR: {e}")
+    finally:
+        client.close()
+        print("Conexiune inchisa")
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print("RECONSTRUIRE COLECTIE CLIENTI")
+    print("="*60)
+    print("\nColectia `clients` va fi recalculata din fisele fiecarui tenant.\n")
+
+    # Check for --confirm flag
+    if "--confirm" in sys.argv:
+        print("Start backfill...\n")
+        asyncio.run(backfill_clients(apply_changes=True))
+    else:
+        print("Rulare in mod dry-run. Pentru a aplica modificarile:")
+        print("  python backfill_clients.py --confirm\n")
+        asyncio.run(backfill_clients(apply_changes=False))
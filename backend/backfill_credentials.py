@@ -0,0 +1,109 @@
+"""
+Script pentru popularea colectiei `credentials` (index de login dupa email).
+
+Pentru fiecare admin, tenant (owner) si angajat scrie un document
+{email (lowercase), principal_type, principal_id, tenant_id}. La emailuri
+duplicate se pastreaza aceeasi prioritate ca la login: admin > tenant > angajat.
+Dupa rulare scrie flag-ul `credentials_backfill` in job_state; cu
+CREDENTIALS_LEGACY_FALLBACK=auto (implicit) serverul nu mai cauta in
+colectiile vechi la login (in cel mult un minut).
+"""
+import os
+import asyncio
+from datetime import datetime, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.getenv("DB_NAME", "fixgsm_db")
+
+async def backfill_credentials(apply_changes: bool):
+    """Build the credentials index from admin_users, tenants and users"""
+
+    print("Conectare la MongoDB...")
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    try:
+        entries = {}
+        conflicts = []
+
+        sources = [
+            ("admin", db["admin_users"].find({}, {"_id": 0, "email": 1, "admin_id": 1}), "admin_id", None),
+            ("tenant_owner", db["tenants"].find({}, {"_id": 0, "email": 1, "tenant_id": 1}), "tenant_id", "tenant_id"),
+            ("employee", db["users"].find({}, {"_id": 0, "email": 1, "user_id": 1, "tenant_id": 1}), "user_id", "tenant_id"),
+        ]
+
+        for principal_type, cursor, id_field, tenant_field in sources:
+            async for doc in cursor:
+                email = (doc.get("email") or "").strip().lower()
+                if not email or not doc.get(id_field):
+                    continue
+                if email in entries:
+                    conflicts.append((email, entries[email]["principal_type"], principal_type))
+                    continue
+                entries[email] = {
+                    "principal_type": principal_type,
+                    "principal_id": doc[id_field],
+                    "tenant_id": doc.get(tenant_field) if tenant_field else None
+                }
+
+        print(f"\nGasit {len(entries)} emailuri de login")
+        for email, kept, skipped in conflicts:
+            print(f"   WARNING: {email} exista ca {kept} si {skipped} - se pastreaza {kept}")
+
+        if not apply_changes:
+            print(f"\n   DRY-RUN: {len(entries)} documente ar fi scrise in credentials")
+        else:
+            now = datetime.now(timezone.utc).isoformat()
+            operations = [
+                UpdateOne(
+                    {"email": email},
+                    {"$set": {**entry, "updated_at": now}, "$setOnInsert": {"created_at": now}},
+                    upsert=True
+                )
+                for email, entry in entries.items()
+            ]
+            if operations:
+                result = await db["credentials"].bulk_write(operations, ordered=False)
+                print(f"\n   SUCCESS: {result.upserted_count} adaugate, {result.modified_count} actualizate")
+
+            # Must match server.py (credentials_legacy_fallback)
+            await db["job_state"].update_one(
+                {"job_id": "credentials_backfill"},
+                {"$set": {"completed_at": now, "entries": len(entries)}},
+                upsert=True
+            )
+            print("   Fallback-ul de login pe colectiile vechi este oprit")
+
+        print(f"\n{'='*60}")
+        print(f"Backfill finalizat!" if apply_changes else "Dry-run finalizat!")
+        print(f"Conflicte de email: {len(conflicts)}")
+        print(f"{'='*60}\n")
+
+    except Exception as e:
+        print(f"\nERROR: {e}")
+    finally:
+        client.close()
+        print("Conexiune inchisa")
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print("POPULARE INDEX CREDENTIALS")
+    print("="*60)
+    print("\nFiecare email de login va fi mapat la contul care il foloseste.\n")
+
+    # Check for --confirm flag
+    if "--confirm" in sys.argv:
+        print("Start backfill...\n")
+        asyncio.run(backfill_credentials(apply_changes=True))
+    else:
+        print("Rulare in mod dry-run. Pentru a aplica modificarile:")
+        print("  python backfill_credentials.py --confirm\n")
+        asyncio.run(backfill_credentials(apply_changes=False))
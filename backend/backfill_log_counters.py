@@ -0,0 +1,111 @@
+"""
+Script pentru reconstruirea colectiei `log_counters` din loguri.
+
+Serverul incrementeaza contoarele orare si zilnice (pe nivel si categorie) la
+fiecare scriere de log; /admin/logs/stats citeste doar aceste contoare.
+Scriptul le recalculeaza din colectia `logs`, de exemplu dupa prima
+instalare sau daca au fost sterse. Bucket-urile existente sunt suprascrise.
+"""
+import os
+import asyncio
+from datetime import timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.getenv("DB_NAME", "fixgsm_db")
+
+# Must match server.py
+LOG_COUNTER_HOURLY_KEEP_DAYS = 7
+LOG_RETENTION_MAX_DAYS = max(
+    int(os.getenv("LOG_RETENTION_INFO_DAYS", 30)),
+    int(os.getenv("LOG_RETENTION_WARNING_DAYS", 90)),
+    int(os.getenv("LOG_RETENTION_ERROR_DAYS", 180)),
+    int(os.getenv("LOG_RETENTION_CRITICAL_DAYS", 180)),
+)
+
+def stats_key(label):
+    key = (label or "Unknown").replace(".", "\uff0e")
+    return "\uff04" + key[1:] if key.startswith("$") else key
+
+HOURLY_PIPELINE = [
+    {"$match": {"timestamp": {"$type": "number"}}},
+    {"$group": {
+        "_id": {
+            "hour": {"$dateTrunc": {"date": {"$toDate": {"$multiply": ["$timestamp", 1000]}}, "unit": "hour"}},
+            "level": "$level",
+            "category": "$category"
+        },
+        "count": {"$sum": 1}
+    }}
+]
+
+async def backfill_log_counters(apply_changes: bool):
+    """Rebuild hourly and daily log counter buckets"""
+
+    print("Conectare la MongoDB...")
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    try:
+        rows = await db["logs"].aggregate(HOURLY_PIPELINE, allowDiskUse=True).to_list(length=None)
+        print(f"\nGasit {len(rows)} grupuri (ora, nivel, categorie)\n")
+
+        buckets = {}
+        for row in rows:
+            hour = row["_id"]["hour"].replace(tzinfo=timezone.utc)
+            level_key = stats_key(row["_id"].get("level"))
+            category_key = stats_key(row["_id"].get("category"))
+            for bucket, start in (("hour", hour), ("day", hour.replace(hour=0))):
+                counts = buckets.setdefault((bucket, start), {}).setdefault(level_key, {})
+                counts[category_key] = counts.get(category_key, 0) + row["count"]
+
+        keep_days = {"hour": LOG_COUNTER_HOURLY_KEEP_DAYS, "day": LOG_RETENTION_MAX_DAYS + 1}
+        hourly = sum(1 for bucket, _ in buckets if bucket == "hour")
+        print(f"   {hourly} bucket-uri orare, {len(buckets) - hourly} zilnice")
+
+        if not apply_changes:
+            print(f"\n   DRY-RUN: {len(buckets)} bucket-uri ar fi scrise in log_counters")
+        else:
+            operations = [
+                UpdateOne(
+                    {"bucket": bucket, "start": start},
+                    {"$set": {"counts": counts, "expire_at": start + timedelta(days=keep_days[bucket])}},
+                    upsert=True
+                )
+                for (bucket, start), counts in buckets.items()
+            ]
+            if operations:
+                result = await db["log_counters"].bulk_write(operations, ordered=False)
+                print(f"\n   SUCCESS: {result.upserted_count} adaugate, {result.modified_count} actualizate")
+
+        print(f"\n{'='*60}")
+        print(f"Backfill finalizat!" if apply_changes else "Dry-run finalizat!")
+        print(f"{'='*60}\n")
+
+    except Exception as e:
+        print(f"\nERROR: {e}")
+    finally:
+        client.close()
+        print("Conexiune inchisa")
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print("RECONSTRUIRE CONTOARE LOGURI")
+    print("="*60)
+    print("\nContoarele orare si zilnice vor fi recalculate din loguri.\n")
+
+    # Check for --confirm flag
+    if "--confirm" in sys.argv:
+        print("Start backfill...\n")
+        asyncio.run(backfill_log_counters(apply_changes=True))
+    else:
+        print("Rulare in mod dry-run. Pentru a aplica modificarile:")
+        print("  python backfill_log_counters.py --confirm\n")
+        asyncio.run(backfill_log_counters(apply_changes=False))
@@ -0,0 +1,81 @@
+"""
+Script pentru completarea campului `problem_category` pe fisele existente.
+
+Fisele noi primesc categoria la creare (classify_problem din server.py);
+pagina de statistici grupeaza dupa acest camp in loc sa analizeze textul
+problemei raportate.
+"""
+import os
+import re
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.getenv("DB_NAME", "fixgsm_db")
+
+# Must match PROBLEM_CATEGORIES in server.py (checked in order)
+PROBLEM_CATEGORIES = [
+    ("Ecran spart", ("ecran", "display")),
+    ("Probleme baterie", ("baterie",)),
+    ("Probleme software", ("software",)),
+]
+
+async def backfill_problem_category(apply_changes: bool):
+    """Classify tickets that do not have a problem_category yet"""
+
+    print("Conectare la MongoDB...")
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    try:
+        pending = {"problem_category": {"$exists": False}}
+        total_pending = await db["tickets"].count_documents(pending)
+        print(f"\nGasit {total_pending} fise fara categorie\n")
+
+        for category, keywords in PROBLEM_CATEGORIES:
+            pattern = "|".join(re.escape(keyword) for keyword in keywords)
+            query = {**pending, "reported_issue": {"$regex": pattern, "$options": "i"}}
+
+            if not apply_changes:
+                count = await db["tickets"].count_documents(query)
+                print(f"   DRY-RUN: {count} fise ar primi categoria '{category}'")
+                continue
+
+            result = await db["tickets"].update_many(query, {"$set": {"problem_category": category}})
+            print(f"   SUCCESS: {result.modified_count} fise -> '{category}'")
+
+        if apply_changes:
+            # Everything left is unclassified; mark it so it is not scanned again
+            result = await db["tickets"].update_many(pending, {"$set": {"problem_category": None}})
+            print(f"   SUCCESS: {result.modified_count} fise fara categorie")
+
+        print(f"\n{'='*60}")
+        print(f"Backfill finalizat!" if apply_changes else "Dry-run finalizat!")
+        print(f"{'='*60}\n")
+
+    except Exception as e:
+        print(f"\nERROR: {e}")
+    finally:
+        client.close()
+        print("Conexiune inchisa")
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print("COMPLETARE CATEGORIE PROBLEMA PE FISE")
+    print("="*60)
+    print("\nFisele existente vor primi campul problem_category.\n")
+
+    # Check for --confirm flag
+    if "--confirm" in sys.argv:
+        print("Start backfill...\n")
+        asyncio.run(backfill_problem_category(apply_changes=True))
+    else:
+        print("Rulare in mod dry-run. Pentru a aplica modificarile:")
+        print("  python backfill_problem_category.py --confirm\n")
+        asyncio.run(backfill_problem_category(apply_changes=False))
@@ -0,0 +1,113 @@
+"""
+Script pentru generarea `search_tokens` pe fise.
+
+Cautarea din GET /tickets?search= foloseste indexul (tenant_id, search_tokens);
+fisele create inainte de acest camp nu apar in cautare pana nu rulati scriptul.
+Tokenii sunt regenerati pentru toate fisele, deci scriptul se poate rula din nou
+(de ex. dupa migrate_ticket_ids.py, care schimba ticket_id).
+"""
+import os
+import re
+import asyncio
+import unicodedata
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.getenv("DB_NAME", "fixgsm_db")
+BATCH_SIZE = 500
+
+# Must match server.py
+CLIENT_SEARCH_MIN_TOKEN = 2
+CLIENT_SEARCH_MAX_TOKEN = 15
+
+def fold_text(value):
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def phone_digits(value):
+    digits = re.sub(r"\D", "", value or "")
+    if (value or "").strip().startswith("+40") or (digits.startswith("40") and len(digits) == 11):
+        return "0" + digits[2:]
+    if digits.startswith("0040"):
+        return "0" + digits[4:]
+    return digits
+
+def client_search_tokens(name, phone):
+    tokens = set()
+    for word in re.split(r"[^a-z0-9]+", fold_text(name)):
+        for end in range(CLIENT_SEARCH_MIN_TOKEN, min(len(word), CLIENT_SEARCH_MAX_TOKEN) + 1):
+            tokens.add(word[:end])
+    digits = phone_digits(phone)
+    for number in {digits, digits.lstrip("0")}:
+        for end in range(CLIENT_SEARCH_MIN_TOKEN, min(len(number), CLIENT_SEARCH_MAX_TOKEN) + 1):
+            tokens.add(number[:end])
+    return sorted(tokens)
+
+def ticket_search_tokens(ticket):
+    words = fold_text(f"{ticket.get('ticket_id') or ''} {ticket.get('device_model') or ''}")
+    words += " " + re.sub(r"(?<=[a-z])(?=\d)|(?<=\d)(?=[a-z])", " ", words)
+    return client_search_tokens(f"{ticket.get('client_name') or ''} {words}", ticket.get("client_phone"))
+
+async def backfill_ticket_search(apply_changes: bool):
+    """Regenerate search_tokens for every ticket"""
+    print("Conectare la MongoDB...")
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    try:
+        missing = await db["tickets"].count_documents({"search_tokens": {"$exists": False}})
+        total = await db["tickets"].estimated_document_count()
+        print(f"\nGasit ~{total} fise, {missing} fara search_tokens\n")
+
+        if not apply_changes:
+            print("   DRY-RUN: nicio modificare scrisa")
+            return
+
+        updated = 0
+        operations = []
+        cursor = db["tickets"].find(
+            {}, {"_id": 1, "ticket_id": 1, "client_name": 1, "client_phone": 1, "device_model": 1}
+        )
+        async for ticket in cursor:
+            operations.append(UpdateOne({"_id": ticket["_id"]}, {"$set": {"search_tokens": ticket_search_tokens(ticket)}}))
+            if len(operations) >= BATCH_SIZE:
+                await db["tickets"].bulk_write(operations, ordered=False)
+                updated += len(operations)
+                operations = []
+                print(f"   {updated} fise actualizate...")
+        if operations:
+            await db["tickets"].bulk_write(operations, ordered=False)
+            updated += len(operations)
+
+        print(f"\n{'='*60}")
+        print("Backfill finalizat!")
+        print(f"Total fise actualizate: {updated}")
+        print(f"{'='*60}\n")
+
+    except Exception as e:
+        print(f"\nERROR: {e}")
+    finally:
+        client.close()
+        print("Conexiune inchisa")
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print("GENERARE SEARCH_TOKENS PENTRU FISE")
+    print("="*60)
+    print("\nCampul `search_tokens` va fi regenerat pentru toate fisele.\n")
+
+    # Check for --confirm flag
+    if "--confirm" in sys.argv:
+        print("Start backfill...\n")
+        asyncio.run(backfill_ticket_search(apply_changes=True))
+    else:
+        print("Rulare in mod dry-run. Pentru a aplica modificarile:")
+        print("  python backfill_ticket_search.py --confirm\n")
+        asyncio.run(backfill_ticket_search(apply_changes=False))
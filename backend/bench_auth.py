@@ -0,0 +1,71 @@
+"""
+Micro-benchmark pentru dependinta de autentificare (get_current_user).
+
+Compara implementarea veche (print-uri DEBUG + verificare HS256 la fiecare
+request) cu cea actuala (cache LRU de token-uri verificate, fara print-uri).
+Nu se conecteaza la MongoDB.
+
+    python bench_auth.py [iteratii]
+"""
+import os
+import sys
+import time
+import asyncio
+import contextlib
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "fixgsm_bench")
+
+from fastapi.security import HTTPAuthorizationCredentials
+import server
+
+async def legacy_get_current_user(credentials):
+    """get_current_user as it was before the token cache"""
+    token = credentials.credentials
+    print(f"DEBUG: get_current_user called with token: {token[:50]}...")
+    payload = server.decode_token(token)
+    print(f"DEBUG: Decoded payload: {payload}")
+    return payload
+
+async def measure(dependency, credentials, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await dependency(credentials)
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+async def main(iterations):
+    token = server.create_access_token({
+        "user_id": "bench-user",
+        "user_type": "employee",
+        "tenant_id": "bench-tenant",
+        "email": "bench@fixgsm.ro",
+        "role": "technician"
+    })
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    # Prints go to /dev/null so the terminal does not dominate the timing;
+    # real stdout (container logs) is slower, so this understates the old cost
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        legacy = await measure(legacy_get_current_user, credentials, iterations)
+
+    server._token_cache.clear()
+    cached = await measure(server.get_current_user, credentials, iterations)
+
+    server._token_cache.clear()
+    uncached_start = time.perf_counter()
+    for _ in range(iterations):
+        server._token_cache.clear()
+        await server.get_current_user(credentials)
+    uncached = (time.perf_counter() - uncached_start) / iterations * 1_000_000
+
+    print(f"\nIteratii: {iterations}")
+    print(f"{'='*60}")
+    print(f"Inainte (print + decode):        {legacy:8.2f} us/request")
+    print(f"Dupa, cache miss (decode):       {uncached:8.2f} us/request")
+    print(f"Dupa, cache hit:                 {cached:8.2f} us/request")
+    print(f"{'='*60}")
+    print(f"Accelerare (cache hit vs inainte): {legacy / cached:.1f}x\n")
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    asyncio.run(main(iterations))
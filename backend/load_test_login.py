@@ -0,0 +1,100 @@
+"""
+Test de incarcare: latenta endpoint-urilor non-auth in timpul unui val de login-uri.
+
+Masoara latenta /health (fara autentificare) mai intai fara trafic, apoi in
+timp ce N thread-uri trimit login-uri in paralel. Cu bcrypt rulat pe thread
+pool, latenta /health ar trebui sa ramana aproximativ aceeasi.
+
+    python load_test_login.py --email user@test.ro --password parola
+    python load_test_login.py --url http://localhost:8000 --logins 20 --duration 15
+"""
+import argparse
+import statistics
+import threading
+import time
+import requests
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def probe(url, duration, interval=0.05):
+    """Measure /health latency (ms) for `duration` seconds"""
+    latencies = []
+    session = requests.Session()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            session.get(f"{url}/health", timeout=10)
+            latencies.append((time.perf_counter() - start) * 1000)
+        except requests.RequestException:
+            pass
+        time.sleep(interval)
+    return latencies
+
+def login_worker(url, email, password, stop, counters, lock):
+    session = requests.Session()
+    while not stop.is_set():
+        try:
+            response = session.post(
+                f"{url}/api/auth/login",
+                json={"email": email, "password": password},
+                timeout=30
+            )
+            key = "ok" if response.status_code == 200 else f"http_{response.status_code}"
+        except requests.RequestException:
+            key = "error"
+        with lock:
+            counters[key] = counters.get(key, 0) + 1
+
+def report(label, latencies):
+    if not latencies:
+        print(f"{label:<22} fara raspunsuri")
+        return
+    print(
+        f"{label:<22} n={len(latencies):<5} "
+        f"p50={statistics.median(latencies):7.1f} ms  "
+        f"p95={percentile(latencies, 0.95):7.1f} ms  "
+        f"max={max(latencies):7.1f} ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Login burst vs /health latency")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--email", default="Test2@B.com")
+    parser.add_argument("--password", default="Coolzone")
+    parser.add_argument("--logins", type=int, default=20, help="thread-uri de login in paralel")
+    parser.add_argument("--duration", type=float, default=10.0, help="secunde per faza")
+    args = parser.parse_args()
+
+    print(f"\nServer: {args.url}")
+    print(f"Faza 1: /health fara trafic ({args.duration}s)...")
+    baseline = probe(args.url, args.duration)
+
+    print(f"Faza 2: /health in timpul a {args.logins} login-uri paralele ({args.duration}s)...")
+    stop = threading.Event()
+    lock = threading.Lock()
+    counters = {}
+    workers = [
+        threading.Thread(target=login_worker, args=(args.url, args.email, args.password, stop, counters, lock), daemon=True)
+        for _ in range(args.logins)
+    ]
+    for worker in workers:
+        worker.start()
+    time.sleep(1)  # let the burst build up
+    during = probe(args.url, args.duration)
+    stop.set()
+    for worker in workers:
+        worker.join(timeout=30)
+
+    print(f"\n{'='*70}")
+    report("/health fara trafic", baseline)
+    report("/health in burst", during)
+    print(f"Login-uri: {counters}")
+    print(f"{'='*70}\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Script pentru migrarea logurilor existente la retentia pe niveluri.
+
+Logurile noi primesc `logged_at` (data BSON) si `expire_at` la scriere, iar
+indexul TTL `expire_at_ttl` le sterge automat. Logurile vechi nu au aceste
+campuri si nu ar expira niciodata; scriptul le calculeaza din `timestamp`
+(sau `created_at`) si din nivelul logului.
+"""
+import os
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.getenv("DB_NAME", "fixgsm_db")
+
+# Must match LOG_RETENTION_DAYS in server.py
+LOG_RETENTION_DAYS = {
+    "info": int(os.getenv("LOG_RETENTION_INFO_DAYS", 30)),
+    "warning": int(os.getenv("LOG_RETENTION_WARNING_DAYS", 90)),
+    "error": int(os.getenv("LOG_RETENTION_ERROR_DAYS", 180)),
+    "critical": int(os.getenv("LOG_RETENTION_CRITICAL_DAYS", 180)),
+}
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+def retention_update(days):
+    """Pipeline update: logged_at from timestamp/created_at, expire_at = logged_at + days"""
+    return [
+        {"$set": {"logged_at": {"$ifNull": [
+            {"$toDate": {"$multiply": ["$timestamp", 1000]}},
+            {"$toDate": "$created_at"}
+        ]}}},
+        {"$set": {"expire_at": {"$add": ["$logged_at", days * DAY_MS]}}}
+    ]
+
+async def migrate_log_retention(apply_changes: bool):
+    """Add logged_at / expire_at to logs written before retention existed"""
+
+    print("Conectare la MongoDB...")
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    try:
+        pending = {"expire_at": {"$exists": False}}
+        total_pending = await db["logs"].count_documents(pending)
+        print(f"\nGasit {total_pending} loguri fara expire_at\n")
+
+        known_levels = [level for level in LOG_RETENTION_DAYS if level != "info"]
+        groups = [({**pending, "level": level}, level, LOG_RETENTION_DAYS[level]) for level in known_levels]
+        # Everything else (info and unknown levels) uses the info retention
+        groups.append(({**pending, "level": {"$nin": known_levels}}, "info", LOG_RETENTION_DAYS["info"]))
+
+        for query, level, days in groups:
+            if not apply_changes:
+                count = await db["logs"].count_documents(query)
+                print(f"   DRY-RUN: {count} loguri '{level}' -> expira dupa {days} zile")
+                continue
+
+            result = await db["logs"].update_many(query, retention_update(days))
+            print(f"   SUCCESS: {result.modified_count} loguri '{level}' -> expira dupa {days} zile")
+
+        print(f"\n{'='*60}")
+        print(f"Migrare finalizata!" if apply_changes else "Dry-run finalizat!")
+        print("Logurile deja expirate vor fi sterse de MongoDB la urmatoarea trecere TTL.")
+        print(f"{'='*60}\n")
+
+    except Exception as e:
+        print(f"\nERROR: {e}")
+    finally:
+        client.close()
+        print("Conexiune inchisa")
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print("MIGRARE RETENTIE LOGURI")
+    print("="*60)
+    print(f"\nRetentie (zile): {LOG_RETENTION_DAYS}\n")
+
+    # Check for --confirm flag
+    if "--confirm" in sys.argv:
+        print("Start migrare...\n")
+        asyncio.run(migrate_log_retention(apply_changes=True))
+    else:
+        print("Rulare in mod dry-run. Pentru a aplica modificarile:")
+        print("  python migrate_log_retention.py --confirm\n")
+        asyncio.run(migrate_log_retention(apply_changes=False))
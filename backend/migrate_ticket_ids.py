@@ -0,0 +1,126 @@
+"""
+Script pentru migrarea ID-urilor de fise (BMP100-999 random) la secventa per tenant.
+
+- Initializeaza contorul `counters` pentru fiecare tenant (peste BMP999)
+- Re-numeroteaza fisele cu ticket_id duplicat in acelasi tenant: cea mai veche
+  fisa isi pastreaza ID-ul, celelalte primesc ID-uri noi din secventa.
+  ID-ul vechi este pastrat in campul `previous_ticket_id`.
+"""
+import os
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.getenv("DB_NAME", "fixgsm_db")
+
+# Must match server.py
+TICKET_ID_PREFIX = "BMP"
+LEGACY_TICKET_NUMBER_MAX = 999
+
+async def next_ticket_number(db, tenant_id):
+    """Reserve one number from the tenant sequence (same counter as server.py)"""
+    counter_filter = {"counter_id": "ticket_number", "tenant_id": tenant_id}
+    await db["counters"].update_one(
+        counter_filter,
+        {"$max": {"value": LEGACY_TICKET_NUMBER_MAX}},
+        upsert=True
+    )
+    counter = await db["counters"].find_one_and_update(
+        counter_filter,
+        {"$inc": {"value": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["value"]
+
+async def migrate_ticket_ids(apply_changes: bool):
+    """Re-key duplicate ticket IDs within each tenant"""
+
+    print("Conectare la MongoDB...")
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    try:
+        # Seed counters for every tenant so new tickets start above legacy IDs
+        tenant_ids = await db["tickets"].distinct("tenant_id")
+        print(f"\nGasit {len(tenant_ids)} tenant(s) cu fise\n")
+
+        if apply_changes:
+            for tenant_id in tenant_ids:
+                await db["counters"].update_one(
+                    {"counter_id": "ticket_number", "tenant_id": tenant_id},
+                    {"$max": {"value": LEGACY_TICKET_NUMBER_MAX}},
+                    upsert=True
+                )
+
+        # Find (tenant_id, ticket_id) pairs used by more than one ticket
+        pipeline = [
+            {"$group": {
+                "_id": {"tenant_id": "$tenant_id", "ticket_id": "$ticket_id"},
+                "docs": {"$push": {"_id": "$_id", "created_at": "$created_at"}},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ]
+        duplicates = await db["tickets"].aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+
+        print(f"Gasit {len(duplicates)} ID-uri duplicate\n")
+
+        total_rekeyed = 0
+
+        for group in duplicates:
+            tenant_id = group["_id"]["tenant_id"]
+            old_ticket_id = group["_id"]["ticket_id"]
+
+            # Oldest ticket keeps the original ID (it is the one printed on paper first)
+            docs = sorted(group["docs"], key=lambda d: d.get("created_at") or "")
+
+            for doc in docs[1:]:
+                if not apply_changes:
+                    print(f"   DRY-RUN: {tenant_id} / {old_ticket_id} ({doc['_id']}) ar primi un ID nou")
+                    total_rekeyed += 1
+                    continue
+
+                new_ticket_id = f"{TICKET_ID_PREFIX}{await next_ticket_number(db, tenant_id)}"
+                await db["tickets"].update_one(
+                    {"_id": doc["_id"]},
+                    {"$set": {
+                        "ticket_id": new_ticket_id,
+                        "previous_ticket_id": old_ticket_id
+                    }}
+                )
+                print(f"   SUCCESS: {tenant_id} / {old_ticket_id} -> {new_ticket_id}")
+                total_rekeyed += 1
+
+        print(f"\n{'='*60}")
+        print(f"Migrare finalizata!" if apply_changes else "Dry-run finalizat!")
+        print(f"Total fise re-numerotate: {total_rekeyed}")
+        print(f"{'='*60}\n")
+
+    except Exception as e:
+        print(f"\nERROR: {e}")
+    finally:
+        client.close()
+        print("Conexiune inchisa")
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print("MIGRARE ID-URI FISE")
+    print("="*60)
+    print("\nFisele cu acelasi ticket_id in acelasi tenant vor primi ID-uri noi")
+    print("din secventa tenantului. Fisa cea mai veche isi pastreaza ID-ul.\n")
+
+    # Check for --confirm flag
+    if "--confirm" in sys.argv:
+        print("Start migrare...\n")
+        asyncio.run(migrate_ticket_ids(apply_changes=True))
+    else:
+        print("Rulare in mod dry-run. Pentru a aplica modificarile:")
+        print("  python migrate_ticket_ids.py --confirm\n")
+        asyncio.run(migrate_ticket_ids(apply_changes=False))
@@ -1,12 +1,27 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, ExecutionTimeout
 import os
+import asyncio
+import base64
+import copy
+import hashlib
+import heapq
+import itertools
+import time
+import json
 import logging
+import math
+import re
+import unicodedata
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional
 import uuid
@@ -378,6 +393,64 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
+# bcrypt is CPU-bound (tens of ms per call) and releases the GIL, so handlers
+# run it on a small dedicated pool instead of blocking the event loop.
+# PASSWORD_HASH_CONCURRENCY caps parallel bcrypt calls; beyond
+# PASSWORD_HASH_MAX_QUEUE waiting calls, requests are rejected with 503.
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', min(4, os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 200))
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="bcrypt")
+_password_semaphore = asyncio.Semaphore(PASSWORD_HASH_CONCURRENCY)
+password_pool_stats = {
+    "queued": 0,
+    "running": 0,
+    "max_queued": 0,
+    "completed": 0,
+    "rejected": 0,
+    "total_wait_ms": 0.0,
+    "total_run_ms": 0.0
+}
+
+async def run_password_work(func, *args):
+    if password_pool_stats["queued"] >= PASSWORD_HASH_MAX_QUEUE:
+        password_pool_stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+    
+    password_pool_stats["queued"] += 1
+    password_pool_stats["max_queued"] = max(password_pool_stats["max_queued"], password_pool_stats["queued"])
+    queued_at = time.perf_counter()
+    try:
+        await _password_semaphore.acquire()
+    finally:
+        password_pool_stats["queued"] -= 1
+    
+    started_at = time.perf_counter()
+    password_pool_stats["running"] += 1
+    password_pool_stats["total_wait_ms"] += (started_at - queued_at) * 1000
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_password_executor, func, *args)
+    finally:
+        password_pool_stats["running"] -= 1
+        password_pool_stats["completed"] += 1
+        password_pool_stats["total_run_ms"] += (time.perf_counter() - started_at) * 1000
+        _password_semaphore.release()
+
+async def hash_password_async(password: str) -> str:
+    return await run_password_work(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_password_work(verify_password, plain_password, hashed_password)
+
+def get_password_pool_stats() -> dict:
+    completed = password_pool_stats["completed"]
+    return {
+        **password_pool_stats,
+        "concurrency": PASSWORD_HASH_CONCURRENCY,
+        "max_queue": PASSWORD_HASH_MAX_QUEUE,
+        "avg_wait_ms": round(password_pool_stats["total_wait_ms"] / completed, 2) if completed else 0,
+        "avg_run_ms": round(password_pool_stats["total_run_ms"] / completed, 2) if completed else 0
+    }
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -391,48 +464,144 @@ def decode_token(token: str) -> dict:
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
-    token = credentials.credentials
-    print(f"DEBUG: get_current_user called with token: {token[:50]}...")
-    payload = decode_token(token)
-    print(f"DEBUG: Decoded payload: {payload}")
+# Verified tokens are cached (keyed by SHA-256 of the token) until they expire,
+# so repeated requests skip signature verification. Bounded LRU.
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 10000))
+_token_cache = OrderedDict()
+
+# Off by default; set AUTH_DEBUG_LOGGING=true to trace authentication
+auth_logger = logging.getLogger("server.auth")
+if os.environ.get('AUTH_DEBUG_LOGGING', 'false').lower() == 'true':
+    auth_logger.setLevel(logging.DEBUG)
+
+def decode_token_cached(token: str) -> dict:
+    token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    payload = _token_cache.get(token_hash)
+    
+    if payload is not None:
+        if payload.get("exp", 0) <= datetime.now(timezone.utc).timestamp():
+            _token_cache.pop(token_hash, None)
+            raise HTTPException(status_code=401, detail="Token expired")
+        _token_cache.move_to_end(token_hash)
+        cache_hit = True
+    else:
+        payload = decode_token(token)
+        if AUTH_CACHE_SIZE > 0:
+            _token_cache[token_hash] = payload
+            if len(_token_cache) > AUTH_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+        cache_hit = False
+    
+    if auth_logger.isEnabledFor(logging.DEBUG):
+        auth_logger.debug(
+            "authenticated token=%s user_type=%s user_id=%s cache_hit=%s",
+            token_hash[:12], payload.get("user_type"), payload.get("user_id"), cache_hit
+        )
     return payload
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    # Copy so handlers can't mutate the cached claims
+    return dict(decode_token_cached(credentials.credentials))
+
+# ============ TENANT CACHE ============
+# Read-through cache of tenant documents, one entry per (tenant_id, view).
+# Views are named projections so hot endpoints never load roles, statuses and
+# ai_config when they only need the plan. Every db.tenants.update_one call
+# site calls invalidate_tenant(); the TTL bounds staleness on other workers.
+
+TENANT_CACHE_TTL_SECONDS = int(os.environ.get('TENANT_CACHE_TTL_SECONDS', 30))
+TENANT_PROJECTIONS = {
+    "plan": ["subscription_plan", "subscription_status", "subscription_end_date", "subscription_price",
+             "has_payment_notification", "is_trial"],
+    "company": ["service_name", "company_info", "company_name", "cui", "address", "phone", "email"],
+    "ai": ["ai_config"],
+    "statuses": ["custom_statuses"],
+    "settings": ["language"],
+}
+_tenant_cache = {}
+
+def invalidate_tenant(tenant_id: str = None):
+    """Drop cached views of one tenant (or of all tenants)"""
+    if tenant_id is None:
+        _tenant_cache.clear()
+        return
+    for view in TENANT_PROJECTIONS:
+        _tenant_cache.pop((tenant_id, view), None)
+
+async def get_tenant(tenant_id: str, view: str) -> Optional[dict]:
+    """Tenant fields for a named projection, or None if the tenant does not exist"""
+    key = (tenant_id, view)
+    cached = _tenant_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return copy.deepcopy(cached[1])
+    
+    projection = {"_id": 0, "tenant_id": 1, **{field: 1 for field in TENANT_PROJECTIONS[view]}}
+    tenant = await db.tenants.find_one({"tenant_id": tenant_id}, projection)
+    if tenant is None:
+        return None
+    
+    _tenant_cache[key] = (time.monotonic() + TENANT_CACHE_TTL_SECONDS, tenant)
+    return copy.deepcopy(tenant)
+
 # ============ PERMISSION HELPERS ============
 
-async def get_user_permissions(user: dict) -> List[str]:
-    """Get all permissions for a user based on their role"""
+# Compiled per-tenant role tables: role_id -> frozenset of permission values.
+# Role endpoints invalidate their tenant's table; the TTL bounds how long other
+# worker processes can serve a stale table after an edit.
+ROLE_TABLE_TTL_SECONDS = int(os.environ.get('ROLE_TABLE_TTL_SECONDS', 60))
+ALL_PERMISSIONS = frozenset(perm.value for perm in Permission)
+DEFAULT_ROLE_TABLE = {
+    role_id: frozenset(perm.value for perm in role["permissions"])
+    for role_id, role in DEFAULT_ROLES.items()
+}
+_role_tables = {}
+
+def invalidate_role_table(tenant_id: str):
+    _role_tables.pop(tenant_id, None)
+
+async def get_role_table(tenant_id: str) -> dict:
+    cached = _role_tables.get(tenant_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    
+    tenant = await db.tenants.find_one(
+        {"tenant_id": tenant_id},
+        {"_id": 0, "roles.role_id": 1, "roles.permissions": 1}
+    )
+    # Custom roles take precedence over default roles with the same id
+    table = dict(DEFAULT_ROLE_TABLE)
+    for role in (tenant or {}).get("roles", []):
+        table[role["role_id"]] = frozenset(role.get("permissions", []))
+    
+    _role_tables[tenant_id] = (time.monotonic() + ROLE_TABLE_TTL_SECONDS, table)
+    return table
+
+async def get_permission_set(user: dict) -> frozenset:
+    """Permissions of a user as a frozenset of Permission values"""
     # Admin and tenant_owner have all permissions
     if user["user_type"] in ["admin", "tenant_owner"]:
-        return [perm.value for perm in Permission]
+        return ALL_PERMISSIONS
     
-    # Get role from tenant's roles collection
     tenant_id = user.get("tenant_id")
     user_role = user.get("role")
     
     if not tenant_id or not user_role:
-        return []
-    
-    # Check custom roles first
-    tenant = await db.tenants.find_one({"tenant_id": tenant_id})
-    if tenant and "roles" in tenant:
-        for role in tenant["roles"]:
-            if role["role_id"] == user_role:
-                return role.get("permissions", [])
+        return frozenset()
     
-    # Fallback to default roles
-    if user_role in DEFAULT_ROLES:
-        return [perm.value for perm in DEFAULT_ROLES[user_role]["permissions"]]
-    
-    return []
+    return (await get_role_table(tenant_id)).get(user_role, frozenset())
+
+async def get_user_permissions(user: dict) -> List[str]:
+    """Get all permissions for a user based on their role"""
+    if user["user_type"] in ["admin", "tenant_owner"]:
+        return [perm.value for perm in Permission]
+    return sorted(await get_permission_set(user))
 
 async def check_permission(user: dict, required_permission: Permission) -> bool:
     """Check if user has a specific permission"""
-    permissions = await get_user_permissions(user)
-    return required_permission.value in permissions
+    return required_permission.value in await get_permission_set(user)
 
 def require_permission(permission: Permission):
     """Decorator to require a specific permission"""
@@ -445,12 +614,352 @@ def require_permission(permission: Permission):
         return current_user
     return permission_checker
 
-def generate_ticket_id() -> str:
-    """Generate ticket ID like BMP268"""
-    import random
-    prefix = "BMP"
-    number = random.randint(100, 999)
-    return f"{prefix}{number}"
+def encode_cursor(*values) -> str:
+    """Opaque keyset-pagination cursor from the sort key of the last row"""
+    raw = json.dumps(list(values), separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("unexpected cursor shape")
+        return values
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_date_param(value: str, end_of_day: bool = False) -> str:
+    """Turn a date / datetime query param into an ISO string comparable with
+    stored created_at values. A bare date used as an upper bound is extended
+    to the start of the next day (use with $lt)."""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+# ============ TICKET NUMBER SEQUENCE ============
+
+TICKET_ID_PREFIX = "BMP"
+# Numbers reserved per round trip to the counters collection. Each worker
+# hands out its block locally, so IDs are unique per tenant and increasing
+# within a worker, but may interleave between workers.
+TICKET_ID_BLOCK_SIZE = max(1, int(os.environ.get("TICKET_ID_BLOCK_SIZE", "10")))
+# The old generator produced random BMP100-BMP999; the sequence starts above
+# that range so new IDs never collide with legacy tickets.
+LEGACY_TICKET_NUMBER_MAX = 999
+
+_ticket_number_blocks = {}  # tenant_id -> [next_number, last_number]
+_ticket_number_locks = {}  # tenant_id -> asyncio.Lock
+_seeded_ticket_counters = set()
+
+async def reserve_ticket_numbers(tenant_id: str, count: int) -> tuple:
+    """Atomically reserve `count` consecutive ticket numbers for a tenant.
+    Returns (first, last) inclusive."""
+    counter_filter = {"counter_id": "ticket_number", "tenant_id": tenant_id}
+    
+    if tenant_id not in _seeded_ticket_counters:
+        # $max is idempotent, so concurrent workers can all seed safely
+        await db.counters.update_one(
+            counter_filter,
+            {"$max": {"value": LEGACY_TICKET_NUMBER_MAX}},
+            upsert=True
+        )
+        _seeded_ticket_counters.add(tenant_id)
+    
+    counter = await db.counters.find_one_and_update(
+        counter_filter,
+        {"$inc": {"value": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    last = counter["value"]
+    return last - count + 1, last
+
+async def generate_ticket_id(tenant_id: str) -> str:
+    """Generate ticket ID like BMP1268 from the tenant's sequence"""
+    lock = _ticket_number_locks.setdefault(tenant_id, asyncio.Lock())
+    async with lock:
+        block = _ticket_number_blocks.get(tenant_id)
+        if not block or block[0] > block[1]:
+            first, last = await reserve_ticket_numbers(tenant_id, TICKET_ID_BLOCK_SIZE)
+            block = [first, last]
+            _ticket_number_blocks[tenant_id] = block
+        number = block[0]
+        block[0] += 1
+    return f"{TICKET_ID_PREFIX}{number}"
+
+# ============ DATABASE INDEXES ============
+
+# Declarative index registry: collection -> list of IndexModel.
+# Every index has an explicit name so ensure_indexes() is idempotent and the
+# admin report can match registered indexes against what exists in MongoDB.
+INDEX_REGISTRY = {
+    "tickets": [
+        # GET /tickets sorts on (created_at, ticket_id); each filter gets an
+        # equality prefix in front of that sort key. estimated_cost trails the
+        # main index so date + cost range filters are resolved from index keys.
+        IndexModel([("tenant_id", ASCENDING), ("created_at", DESCENDING), ("ticket_id", DESCENDING), ("estimated_cost", ASCENDING)], name="tenant_created_ticket_cost"),
+        IndexModel([("tenant_id", ASCENDING), ("location_id", ASCENDING), ("created_at", DESCENDING), ("ticket_id", DESCENDING)], name="tenant_location_created_ticket"),
+        IndexModel([("tenant_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("ticket_id", DESCENDING)], name="tenant_status_created_ticket"),
+        IndexModel([("tenant_id", ASCENDING), ("urgent", ASCENDING), ("created_at", DESCENDING), ("ticket_id", DESCENDING)], name="tenant_urgent_created_ticket"),
+        IndexModel([("tenant_id", ASCENDING), ("client_phone", ASCENDING), ("created_at", DESCENDING), ("ticket_id", DESCENDING)], name="tenant_phone_created_ticket"),
+        # GET /tickets?search= matches folded prefix tokens (ticket_search_tokens;
+        # backfill_ticket_search.py fills them in on older tickets)
+        IndexModel([("tenant_id", ASCENDING), ("search_tokens", ASCENDING), ("created_at", DESCENDING), ("ticket_id", DESCENDING)], name="tenant_search_created_ticket"),
+        # Stuck-ticket counts: open statuses not changed since a cutoff
+        IndexModel([("tenant_id", ASCENDING), ("status", ASCENDING), ("status_changed_at", ASCENDING)], name="tenant_status_changed"),
+        # Daily rollup job scans writes since its last run
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+        # Unique once migrate_ticket_ids.py has re-keyed legacy duplicates
+        IndexModel([("ticket_id", ASCENDING), ("tenant_id", ASCENDING)], name="ticket_tenant_unique", unique=True),
+    ],
+    "clients": [
+        IndexModel([("tenant_id", ASCENDING), ("client_id", ASCENDING)], name="tenant_client_unique", unique=True),
+        IndexModel([("tenant_id", ASCENDING), ("last_seen", DESCENDING), ("client_id", DESCENDING)], name="tenant_last_seen_client"),
+        IndexModel([("tenant_id", ASCENDING), ("search_tokens", ASCENDING), ("last_seen", DESCENDING)], name="tenant_search_tokens_last_seen"),
+    ],
+    "tenant_stats": [
+        IndexModel([("tenant_id", ASCENDING)], name="tenant_id_unique", unique=True),
+    ],
+    "ticket_status_events": [
+        IndexModel([("tenant_id", ASCENDING), ("changed_at", DESCENDING)], name="tenant_changed_at"),
+        IndexModel([("tenant_id", ASCENDING), ("ticket_id", ASCENDING), ("changed_at", ASCENDING)], name="tenant_ticket_changed_at"),
+        IndexModel([("changed_at", ASCENDING)], name="changed_at"),
+    ],
+    "tenant_cycle_stats": [
+        IndexModel([("tenant_id", ASCENDING)], name="tenant_id_unique", unique=True),
+    ],
+    "tenant_daily_stats": [
+        IndexModel([("tenant_id", ASCENDING), ("day", ASCENDING)], name="tenant_day_unique", unique=True),
+        IndexModel([("dirty", ASCENDING)], name="dirty", partialFilterExpression={"dirty": True}),
+    ],
+    "job_state": [
+        IndexModel([("job_id", ASCENDING)], name="job_id_unique", unique=True),
+    ],
+    "credentials": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("principal_type", ASCENDING), ("principal_id", ASCENDING)], name="principal"),
+    ],
+    "counters": [
+        IndexModel([("counter_id", ASCENDING), ("tenant_id", ASCENDING)], name="counter_tenant_unique", unique=True),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("tenant_id", ASCENDING), ("role", ASCENDING)], name="tenant_role"),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "tenants": [
+        IndexModel([("tenant_id", ASCENDING)], name="tenant_id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email"),
+        IndexModel([("subscription_status", ASCENDING)], name="subscription_status"),
+    ],
+    "admin_users": [
+        IndexModel([("admin_id", ASCENDING)], name="admin_id"),
+        IndexModel([("email", ASCENDING)], name="email"),
+    ],
+    "locations": [
+        IndexModel([("tenant_id", ASCENDING), ("location_id", ASCENDING)], name="tenant_location"),
+    ],
+    "logs": [
+        # GET /admin/logs sorts on (timestamp, log_id); every filter combination
+        # the admin log viewer offers gets its own equality prefix.
+        IndexModel([("timestamp", DESCENDING), ("log_id", DESCENDING)], name="timestamp_log"),
+        IndexModel([("log_type", ASCENDING), ("timestamp", DESCENDING), ("log_id", DESCENDING)], name="type_timestamp_log"),
+        IndexModel([("level", ASCENDING), ("timestamp", DESCENDING), ("log_id", DESCENDING)], name="level_timestamp_log"),
+        IndexModel([("category", ASCENDING), ("timestamp", DESCENDING), ("log_id", DESCENDING)], name="category_timestamp_log"),
+        IndexModel([("log_type", ASCENDING), ("level", ASCENDING), ("timestamp", DESCENDING), ("log_id", DESCENDING)], name="type_level_timestamp_log"),
+        IndexModel([("log_type", ASCENDING), ("category", ASCENDING), ("timestamp", DESCENDING), ("log_id", DESCENDING)], name="type_category_timestamp_log"),
+        IndexModel([("level", ASCENDING), ("category", ASCENDING), ("timestamp", DESCENDING), ("log_id", DESCENDING)], name="level_category_timestamp_log"),
+        IndexModel([("log_type", ASCENDING), ("level", ASCENDING), ("category", ASCENDING), ("timestamp", DESCENDING), ("log_id", DESCENDING)], name="type_level_category_timestamp_log"),
+        IndexModel([("tenant_id", ASCENDING), ("timestamp", DESCENDING), ("log_id", DESCENDING)], name="tenant_timestamp_log"),
+        # Retention: MongoDB removes each entry once its per-level expire_at passes
+        IndexModel([("expire_at", ASCENDING)], name="expire_at_ttl", expireAfterSeconds=0),
+    ],
+    "log_counters": [
+        IndexModel([("bucket", ASCENDING), ("start", ASCENDING)], name="bucket_start_unique", unique=True),
+        IndexModel([("expire_at", ASCENDING)], name="expire_at_ttl", expireAfterSeconds=0),
+    ],
+    "ai_conversations": [
+        IndexModel([("user_id", ASCENDING), ("tenant_id", ASCENDING), ("updated_at", DESCENDING)], name="user_tenant_updated"),
+        IndexModel([("conversation_id", ASCENDING)], name="conversation_id"),
+    ],
+    "ai_messages": [
+        IndexModel([("conversation_id", ASCENDING), ("timestamp", ASCENDING)], name="conversation_timestamp"),
+        # Streamed answers are checkpointed by message_id; TTFT stats read recent streamed messages
+        IndexModel([("message_id", ASCENDING)], name="message_id", sparse=True),
+        IndexModel([("timestamp", DESCENDING)], name="streamed_timestamp", partialFilterExpression={"ttft_ms": {"$exists": True}}),
+    ],
+    "ai_knowledge": [
+        IndexModel([("tenant_id", ASCENDING), ("updated_at", DESCENDING)], name="tenant_updated"),
+    ],
+    "ai_diagnostic_cache": [
+        IndexModel([("cache_key", ASCENDING)], name="cache_key_unique", unique=True),
+        IndexModel([("expire_at", ASCENDING)], name="expire_at_ttl", expireAfterSeconds=0),
+    ],
+    "ai_diagnostic_cache_stats": [
+        IndexModel([("day", ASCENDING)], name="day_unique", unique=True),
+    ],
+    "ai_usage_stats": [
+        IndexModel([("timestamp", ASCENDING)], name="timestamp"),
+    ],
+    "payments": [
+        IndexModel([("tenant_id", ASCENDING), ("created_at", DESCENDING)], name="tenant_created"),
+    ],
+    "subscription_plans": [
+        IndexModel([("plan_id", ASCENDING)], name="plan_id"),
+    ],
+    "platform_settings": [
+        IndexModel([("settings_id", ASCENDING)], name="settings_id"),
+    ],
+}
+
+async def ensure_indexes() -> dict:
+    """Create every registered index. Safe to run on each boot: existing
+    indexes with the same name and spec are a no-op in MongoDB. Indexes are
+    created one by one so a conflict (e.g. duplicate data blocking a unique
+    index) is logged and does not stop the remaining ones from being built."""
+    summary = {}
+    for collection_name, models in INDEX_REGISTRY.items():
+        created, errors = [], {}
+        for model in models:
+            try:
+                created += await db[collection_name].create_indexes([model])
+            except Exception as e:
+                logger.warning(f"Index {model.document['name']} failed for {collection_name}: {e}")
+                errors[model.document["name"]] = str(e)
+        summary[collection_name] = {"ok": not errors, "indexes": created, "errors": errors}
+    return summary
+
+@api_router.get("/admin/indexes")
+async def get_index_report(current_user: dict = Depends(get_current_user)):
+    """Report missing, unused and unregistered indexes (admin only)"""
+    if current_user.get("user_type") != "admin":
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    report = {}
+    for collection_name, models in INDEX_REGISTRY.items():
+        registered = [m.document["name"] for m in models]
+
+        existing = await db[collection_name].index_information()
+
+        # $indexStats counters reset on mongod restart, so "unused" means
+        # "no operations since the stats were last reset"
+        usage = {}
+        try:
+            async for stat in db[collection_name].aggregate([{"$indexStats": {}}]):
+                usage[stat["name"]] = {
+                    "ops": stat.get("accesses", {}).get("ops", 0),
+                    "since": stat.get("accesses", {}).get("since").isoformat() if stat.get("accesses", {}).get("since") else None
+                }
+        except Exception as e:
+            print(f"Error reading $indexStats for {collection_name}: {e}")
+
+        report[collection_name] = {
+            "missing": [name for name in registered if name not in existing],
+            "unused": [name for name, stat in usage.items() if name != "_id_" and stat["ops"] == 0],
+            "unregistered": [name for name in existing if name != "_id_" and name not in registered],
+            "usage": usage
+        }
+
+    return {
+        "collections": report,
+        "missing_total": sum(len(r["missing"]) for r in report.values()),
+        "unused_total": sum(len(r["unused"]) for r in report.values())
+    }
+
+# ============ CREDENTIALS INDEX ============
+# credentials maps a lowercase login email to the principal that owns it
+# (admin, tenant_owner or employee), so login resolves any account with one
+# indexed read. Password hashes stay on the principal documents.
+# Until backfill_credentials.py has run, login falls back to the legacy
+# collections and records what it finds. CREDENTIALS_LEGACY_FALLBACK="auto"
+# (default) stops the fallback once the script has set its job_state flag;
+# "true" / "false" force it on or off.
+
+CREDENTIALS_LEGACY_FALLBACK = os.environ.get('CREDENTIALS_LEGACY_FALLBACK', 'auto').lower()
+CREDENTIALS_BACKFILL_CHECK_SECONDS = 60
+_credentials_backfill = {"done": False, "checked_at": 0.0}
+
+async def credentials_legacy_fallback() -> bool:
+    if CREDENTIALS_LEGACY_FALLBACK in ("true", "false"):
+        return CREDENTIALS_LEGACY_FALLBACK == "true"
+    if _credentials_backfill["done"]:
+        return False
+    if time.monotonic() - _credentials_backfill["checked_at"] >= CREDENTIALS_BACKFILL_CHECK_SECONDS:
+        state = await db.job_state.find_one({"job_id": "credentials_backfill"}, {"_id": 0, "completed_at": 1})
+        _credentials_backfill.update(done=bool(state and state.get("completed_at")), checked_at=time.monotonic())
+    return not _credentials_backfill["done"]
+
+async def upsert_credential(email: str, principal_type: str, principal_id: str, tenant_id: str = None):
+    await db.credentials.update_one(
+        {"email": (email or "").strip().lower()},
+        {
+            "$set": {
+                "principal_type": principal_type,
+                "principal_id": principal_id,
+                "tenant_id": tenant_id,
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            },
+            "$setOnInsert": {"created_at": datetime.now(timezone.utc).isoformat()}
+        },
+        upsert=True
+    )
+
+async def claim_credential(email: str, principal_type: str, principal_id: str, tenant_id: str = None) -> bool:
+    """Point `email` at this principal unless another principal already owns it"""
+    try:
+        await db.credentials.update_one(
+            {"email": (email or "").strip().lower(), "principal_type": principal_type, "principal_id": principal_id},
+            {
+                "$set": {"tenant_id": tenant_id, "updated_at": datetime.now(timezone.utc).isoformat()},
+                "$setOnInsert": {"created_at": datetime.now(timezone.utc).isoformat()}
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+async def remove_credential(email: str, principal_type: str, principal_id: str):
+    await db.credentials.delete_one(
+        {"email": (email or "").strip().lower(), "principal_type": principal_type, "principal_id": principal_id}
+    )
+
+async def email_taken(email: str) -> bool:
+    """True if any admin, tenant owner or employee already logs in with this email"""
+    return await db.credentials.find_one({"email": (email or "").strip().lower()}, {"_id": 1}) is not None
+
+async def resolve_credential(email: str) -> Optional[dict]:
+    credential = await db.credentials.find_one({"email": (email or "").strip().lower()}, {"_id": 0})
+    if credential or not email or not await credentials_legacy_fallback():
+        return credential
+    
+    # Legacy accounts created before the credentials index (same precedence as
+    # before: admin, tenant, employee; exact match first, then any case)
+    email = email.strip()
+    any_case = {"$regex": f"^{re.escape(email)}$", "$options": "i"}
+    admin = await db.admin_users.find_one({"email": email}, {"_id": 0, "admin_id": 1})
+    if admin:
+        credential = {"principal_type": "admin", "principal_id": admin["admin_id"], "tenant_id": None}
+    else:
+        tenant = await db.tenants.find_one({"email": email}, {"_id": 0, "tenant_id": 1})
+        if tenant:
+            credential = {"principal_type": "tenant_owner", "principal_id": tenant["tenant_id"], "tenant_id": tenant["tenant_id"]}
+        else:
+            employee = await db.users.find_one({"email": email}, {"_id": 0, "user_id": 1, "tenant_id": 1}) or \
+                await db.users.find_one({"email": any_case}, {"_id": 0, "user_id": 1, "tenant_id": 1})
+            if employee:
+                credential = {"principal_type": "employee", "principal_id": employee["user_id"], "tenant_id": employee["tenant_id"]}
+    
+    if credential:
+        await upsert_credential(email, credential["principal_type"], credential["principal_id"], credential["tenant_id"])
+    return credential
 
 # ============ AUTH ROUTES ============
 
@@ -458,11 +967,11 @@ def generate_ticket_id() -> str:
 async def register_service(data: ServiceOnboarding):
     # Check if email exists
     existing = await db.tenants.find_one({"email": data.email})
-    if existing:
+    if existing or await email_taken(data.email):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     tenant_id = str(uuid.uuid4())
-    hashed_pw = hash_password(data.password)
+    hashed_pw = await hash_password_async(data.password)
     
     # Set trial period: 14 days from now
     now = datetime.now(timezone.utc)
@@ -496,24 +1005,25 @@ async def register_service(data: ServiceOnboarding):
     }
     
     await db.tenants.insert_one(tenant_doc)
+    await upsert_credential(data.email, "tenant_owner", tenant_id, tenant_id)
     
     return {"message": "Service registered successfully. Waiting for admin approval.", "tenant_id": tenant_id}
 
 @api_router.post("/auth/login", response_model=LoginResponse)
 async def login(data: LoginRequest, request: Request = None):
-    print(f"\n========== LOGIN ATTEMPT ==========")
-    print(f"Email: {data.email}")
-    print(f"Password: {data.password}")
-    
     # Get client info for logging
     client_ip = request.client.host if request else None
     user_agent = request.headers.get("user-agent") if request else None
     
+    # One indexed read tells which principal owns the email
+    credential = await resolve_credential(data.email) or {}
+    principal_type = credential.get("principal_type")
+    principal_id = credential.get("principal_id")
+    
     # Check if admin
-    admin = await db.admin_users.find_one({"email": data.email})
-    print(f"Admin found: {admin is not None}")
+    admin = await db.admin_users.find_one({"admin_id": principal_id}) if principal_type == "admin" else None
     if admin:
-        if not verify_password(data.password, admin["password_hash"]):
+        if not await verify_password_async(data.password, admin["password_hash"]):
             # Log failed login attempt
             await create_log(
                 log_type="activity",
@@ -553,10 +1063,9 @@ async def login(data: LoginRequest, request: Request = None):
         )
     
     # Check if tenant owner
-    tenant = await db.tenants.find_one({"email": data.email})
-    print(f"Tenant found: {tenant is not None}")
+    tenant = await db.tenants.find_one({"tenant_id": principal_id}) if principal_type == "tenant_owner" else None
     if tenant:
-        if not verify_password(data.password, tenant["password_hash"]):
+        if not await verify_password_async(data.password, tenant["password_hash"]):
             await create_log(
                 log_type="activity",
                 level="warning",
@@ -628,17 +1137,9 @@ async def login(data: LoginRequest, request: Request = None):
         )
     
     # Check if employee
-    employee = await db.users.find_one({"email": data.email})
-    print(f"Employee found: {employee is not None}")
-    if not employee:
-        # Try case-insensitive search
-        employee = await db.users.find_one({"email": {"$regex": f"^{data.email}$", "$options": "i"}})
-        print(f"Employee found (case-insensitive): {employee is not None}")
+    employee = await db.users.find_one({"user_id": principal_id}) if principal_type == "employee" else None
     if employee:
-        print(f"Employee name: {employee.get('name')}")
-        print(f"Employee tenant_id: {employee.get('tenant_id')}")
-        password_valid = verify_password(data.password, employee["password_hash"])
-        print(f"Password valid: {password_valid}")
+        password_valid = await verify_password_async(data.password, employee["password_hash"])
         if not password_valid:
             await create_log(
                 log_type="activity",
@@ -717,8 +1218,6 @@ async def login(data: LoginRequest, request: Request = None):
             role=employee["role"]
         )
     
-    print("No user found - raising Invalid credentials")
-    
     # Log failed login attempt for non-existent user
     await create_log(
         log_type="activity",
@@ -778,6 +1277,7 @@ async def activate_service(
             }
         }
     )
+    invalidate_tenant(tenant_id)
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Service not found")
@@ -850,6 +1350,7 @@ async def update_subscription_price(
         {"tenant_id": tenant_id},
         {"$set": {"subscription_price": data.price}}
     )
+    invalidate_tenant(tenant_id)
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Service not found")
@@ -858,6 +1359,135 @@ async def update_subscription_price(
 
 # ============ TENANT/SERVICE OWNER ROUTES ============
 
+# ============ TENANT DASHBOARD COUNTERS ============
+# One tenant_stats document per tenant holds the dashboard totals. Ticket
+# writes keep it current with $inc; reconcile_tenant_stats() recomputes it from
+# the tickets collection and runs periodically to correct any drift. Every
+# $inc bumps `version`, and the recomputed totals are only written if the
+# version is unchanged, so a concurrent increment is never overwritten. The
+# periodic run holds a job_state lease, so only one worker reconciles.
+
+TENANT_STATS_RECONCILE_SECONDS = int(os.environ.get('TENANT_STATS_RECONCILE_SECONDS', 3600))
+TENANT_STATS_RECONCILE_ATTEMPTS = 3
+WORKER_ID = str(uuid.uuid4())
+
+async def acquire_job_lease(job_id: str, seconds: int) -> bool:
+    """Take (or renew) the job_state lease for `job_id`; False if another worker holds it"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.job_state.update_one(
+            {"job_id": job_id, "$or": [
+                {"lease_owner": WORKER_ID},
+                {"lease_until": {"$lt": now}},
+                {"lease_until": {"$exists": False}}
+            ]},
+            {"$set": {"lease_owner": WORKER_ID, "lease_until": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The job_state document exists and its lease belongs to a live worker
+        return False
+    return True
+
+def stats_key(label: str) -> str:
+    """Labels (statuses, device models) are free text; escape characters MongoDB reserves in field names"""
+    key = (label or "Unknown").replace(".", "\uff0e")
+    return "\uff04" + key[1:] if key.startswith("$") else key
+
+def stats_label(key: str) -> str:
+    label = key.replace("\uff0e", ".")
+    return "$" + label[1:] if label.startswith("\uff04") else label
+
+async def increment_tenant_stats(tenant_id: str, buckets: dict):
+    """Apply {status: (count_delta, cost_delta)} to the tenant counters"""
+    inc = {}
+    for status, (count_delta, cost_delta) in buckets.items():
+        key = stats_key(status)
+        inc[f"by_status.{key}.count"] = inc.get(f"by_status.{key}.count", 0) + count_delta
+        inc[f"by_status.{key}.total_cost"] = inc.get(f"by_status.{key}.total_cost", 0) + cost_delta
+        inc["total_tickets"] = inc.get("total_tickets", 0) + count_delta
+        inc["total_cost"] = inc.get("total_cost", 0) + cost_delta
+    inc = {field: value for field, value in inc.items() if value}
+    if not inc:
+        return
+    try:
+        await db.tenant_stats.update_one(
+            {"tenant_id": tenant_id},
+            {"$inc": {**inc, "version": 1}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}},
+            upsert=True
+        )
+    except Exception as e:
+        # The ticket write already succeeded; reconciliation repairs the counters
+        print(f"Error updating tenant stats: {e}")
+
+async def compute_tenant_stats(tenant_id: str) -> dict:
+    pipeline = [
+        {"$match": {"tenant_id": tenant_id}},
+        {"$group": {
+            "_id": "$status",
+            "count": {"$sum": 1},
+            "total_cost": {"$sum": {"$ifNull": ["$estimated_cost", 0]}}
+        }}
+    ]
+    rows = await db.tickets.aggregate(pipeline).to_list(None)
+
+    now = datetime.now(timezone.utc).isoformat()
+    stats = {
+        "tenant_id": tenant_id,
+        "total_tickets": sum(row["count"] for row in rows),
+        "total_cost": sum(row["total_cost"] for row in rows),
+        "by_status": {
+            stats_key(row["_id"]): {"count": row["count"], "total_cost": row["total_cost"]}
+            for row in rows
+        },
+        "updated_at": now,
+        "reconciled_at": now
+    }
+    return stats
+
+async def reconcile_tenant_stats(tenant_id: str) -> dict:
+    """Recompute one tenant's counters from its tickets and store them, unless
+    increments keep landing while the tickets are aggregated"""
+    for _ in range(TENANT_STATS_RECONCILE_ATTEMPTS):
+        current = await db.tenant_stats.find_one({"tenant_id": tenant_id}, {"_id": 0, "version": 1})
+        stats = await compute_tenant_stats(tenant_id)
+        version = (current or {}).get("version")
+        guard = {"tenant_id": tenant_id, "version": version if version is not None else {"$exists": False}}
+        try:
+            result = await db.tenant_stats.update_one(guard, {"$set": stats}, upsert=current is None)
+        except DuplicateKeyError:
+            # Created by a concurrent $inc
+            continue
+        if result.matched_count or result.upserted_id is not None:
+            return stats
+    # Still changing: the counters are being maintained right now; the next run retries
+    return stats
+
+async def reconcile_all_tenant_stats():
+    tenant_ids = set(await db.tickets.distinct("tenant_id"))
+    tenant_ids.update(await db.tenant_stats.distinct("tenant_id"))
+    drifted = 0
+    for tenant_id in tenant_ids:
+        before = await db.tenant_stats.find_one({"tenant_id": tenant_id}, {"_id": 0})
+        after = await reconcile_tenant_stats(tenant_id)
+        if not before or before.get("total_tickets") != after["total_tickets"] or \
+                abs((before.get("total_cost") or 0) - after["total_cost"]) > 0.005:
+            drifted += 1
+    return {"tenants": len(tenant_ids), "drifted": drifted}
+
+async def tenant_stats_reconcile_loop():
+    while True:
+        await asyncio.sleep(TENANT_STATS_RECONCILE_SECONDS)
+        try:
+            # Held for two periods, so the owning worker keeps it and a dead one is replaced
+            if not await acquire_job_lease("tenant_stats_reconcile", TENANT_STATS_RECONCILE_SECONDS * 2):
+                continue
+            result = await reconcile_all_tenant_stats()
+            if result["drifted"]:
+                logger.warning(f"Tenant stats reconciled: {result['drifted']} of {result['tenants']} tenants had drifted")
+        except Exception as e:
+            logger.error(f"Tenant stats reconciliation failed: {e}")
+
 @api_router.get("/tenant/dashboard-stats", response_model=DashboardStats)
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
     if current_user["user_type"] not in ["tenant_owner", "employee"]:
@@ -865,92 +1495,567 @@ async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
     
     tenant_id = current_user["tenant_id"]
     
-    # Get all tickets for this tenant
-    tickets = await db.tickets.find({"tenant_id": tenant_id}).to_list(10000)
+    stats = await db.tenant_stats.find_one({"tenant_id": tenant_id}, {"_id": 0})
+    if not stats:
+        # First read for this tenant (or counters were never built)
+        stats = await reconcile_tenant_stats(tenant_id)
     
-    total_tickets = len(tickets)
-    total_cost = sum(t.get("estimated_cost", 0) for t in tickets)
-    
-    # Group by status
-    by_status = {}
-    for ticket in tickets:
-        status = ticket.get("status", "Unknown")
-        if status not in by_status:
-            by_status[status] = {"count": 0, "total_cost": 0}
-        by_status[status]["count"] += 1
-        by_status[status]["total_cost"] += ticket.get("estimated_cost", 0)
+    by_status = {
+        stats_label(key): bucket
+        for key, bucket in stats.get("by_status", {}).items()
+        if bucket.get("count", 0) > 0
+    }
     
     return DashboardStats(
-        total_tickets=total_tickets,
-        total_cost=total_cost,
+        total_tickets=stats.get("total_tickets", 0),
+        total_cost=stats.get("total_cost", 0),
         by_status=by_status
     )
 
+# Problem categories shown on the statistics page, checked in order
+PROBLEM_CATEGORIES = [
+    ("Ecran spart", ("ecran", "display")),
+    ("Probleme baterie", ("baterie",)),
+    ("Probleme software", ("software",)),
+]
+
+STATISTICS_MAX_TIME_MS = int(os.environ.get('STATISTICS_MAX_TIME_MS', 5000))
+STATISTICS_TREND_WINDOWS = {"day": 30, "month": 12}
+
+def classify_problem(reported_issue: str) -> Optional[str]:
+    """Map a free-text reported issue to a PROBLEM_CATEGORIES label"""
+    issue = (reported_issue or "").lower()
+    for category, keywords in PROBLEM_CATEGORIES:
+        if any(keyword in issue for keyword in keywords):
+            return category
+    return None
+
+def top_counts_facet(field: str, limit: int = 5) -> list:
+    return [
+        {"$match": {field: {"$nin": [None, ""]}}},
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1, "_id": 1}},
+        {"$limit": limit}
+    ]
+
 @api_router.get("/statistics")
-async def get_statistics(current_user: dict = Depends(get_current_user)):
-    """Get comprehensive statistics for the statistics page"""
+async def get_statistics(
+    trend: str = "month",
+    current_user: dict = Depends(get_current_user)
+):
+    """Get comprehensive statistics for the statistics page.
+    trend selects the revenue_trend buckets: "month" (last 12) or "day" (last 30).
+    """
     if current_user["user_type"] not in ["tenant_owner", "employee"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
+    if trend not in STATISTICS_TREND_WINDOWS:
+        raise HTTPException(status_code=400, detail="trend must be 'day' or 'month'")
+    
     tenant_id = current_user["tenant_id"]
     
+    now = datetime.now(timezone.utc)
+    if trend == "day":
+        trend_start = (now - timedelta(days=STATISTICS_TREND_WINDOWS["day"] - 1)).strftime("%Y-%m-%d")
+    else:
+        months_back = STATISTICS_TREND_WINDOWS["month"] - 1
+        year, month = divmod(now.year * 12 + now.month - 1 - months_back, 12)
+        trend_start = f"{year:04d}-{month + 1:02d}-01"
+    
+    # $match uses the tenant_id prefix of tenant_created_ticket_cost; only the
+    # fields the facets need are projected
+    pipeline = [
+        {"$match": {"tenant_id": tenant_id}},
+        {"$project": {
+            "_id": 0,
+            "status": 1,
+            "device_model": 1,
+            "estimated_cost": 1,
+            "client_name": 1,
+            "problem_category": 1
+        }},
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "total_tickets": {"$sum": 1},
+                    "total_revenue": {"$sum": {"$ifNull": ["$estimated_cost", 0]}},
+                    "completed_tickets": {"$sum": {"$cond": [
+                        {"$regexMatch": {"input": {"$ifNull": ["$status", ""]}, "regex": "finalizat", "options": "i"}},
+                        1, 0
+                    ]}}
+                }}
+            ],
+            "active_clients": [
+                {"$match": {"client_name": {"$nin": [None, ""]}}},
+                {"$group": {"_id": "$client_name"}},
+                {"$count": "count"}
+            ],
+            "top_devices": top_counts_facet("device_model"),
+            "top_problems": top_counts_facet("problem_category"),
+            "ticket_distribution": [
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+            ]
+        }}
+    ]
+    
     try:
-        # Get all tickets for this tenant
-        tickets = await db.tickets.find({"tenant_id": tenant_id}).to_list(10000)
-        
-        # Calculate basic stats
-        total_tickets = len(tickets)
-        completed_tickets = len([t for t in tickets if "finalizat" in t.get("status", "").lower()])
-        total_revenue = sum(t.get("estimated_cost", 0) for t in tickets)
-        
-        # Get unique clients
-        unique_clients = set()
-        for ticket in tickets:
-            if ticket.get("client_name"):
-                unique_clients.add(ticket.get("client_name"))
-        active_clients = len(unique_clients)
-        
-        # Calculate average repair time (simplified)
-        avg_repair_time = 24  # hours - placeholder calculation
-        
-        # Get device statistics
-        device_stats = {}
-        problem_stats = {}
-        
-        for ticket in tickets:
-            device = ticket.get("device_model", "Unknown")
-            if device in device_stats:
-                device_stats[device] += 1
-            else:
-                device_stats[device] = 1
-                
-            problem = ticket.get("reported_issue", "")
-            if "ecran" in problem.lower() or "display" in problem.lower():
-                problem_stats["Ecran spart"] = problem_stats.get("Ecran spart", 0) + 1
-            elif "baterie" in problem.lower():
-                problem_stats["Probleme baterie"] = problem_stats.get("Probleme baterie", 0) + 1
-            elif "software" in problem.lower():
-                problem_stats["Probleme software"] = problem_stats.get("Probleme software", 0) + 1
-        
-        # Sort by frequency
-        top_devices = sorted(device_stats.items(), key=lambda x: x[1], reverse=True)[:5]
-        top_problems = sorted(problem_stats.items(), key=lambda x: x[1], reverse=True)[:5]
-        
-        return {
-            "total_tickets": total_tickets,
-            "completed_tickets": completed_tickets,
-            "total_revenue": total_revenue,
-            "active_clients": active_clients,
-            "avg_repair_time": avg_repair_time,
-            "top_devices": top_devices,
-            "top_problems": top_problems,
-            "revenue_trend": [],  # Placeholder for future implementation
-            "ticket_distribution": {}  # Placeholder for future implementation
-        }
-        
+        result = await db.tickets.aggregate(pipeline, maxTimeMS=STATISTICS_MAX_TIME_MS).to_list(1)
+    except ExecutionTimeout:
+        raise HTTPException(status_code=503, detail="Statistics are taking too long, please retry")
     except Exception as e:
         print(f"Error fetching statistics: {e}")
         raise HTTPException(status_code=500, detail="Error fetching statistics")
+    
+    facets = result[0] if result else {}
+    cycle_stats = await get_cycle_stats(tenant_id)
+    totals = (facets.get("totals") or [{}])[0]
+    active_clients = (facets.get("active_clients") or [{}])[0]
+    
+    return {
+        "total_tickets": totals.get("total_tickets", 0),
+        "completed_tickets": totals.get("completed_tickets", 0),
+        "total_revenue": totals.get("total_revenue", 0),
+        "active_clients": active_clients.get("count", 0),
+        "avg_repair_time": cycle_stats.get("repair_time", {}).get("avg_hours") or 0,  # hours
+        "top_devices": [(row["_id"], row["count"]) for row in facets.get("top_devices", [])],
+        "top_problems": [(row["_id"], row["count"]) for row in facets.get("top_problems", [])],
+        "revenue_trend": daily_stats_series(await load_daily_stats(tenant_id, trend_start), trend),
+        "ticket_distribution": {
+            row["_id"] or "Unknown": row["count"] for row in facets.get("ticket_distribution", [])
+        }
+    }
+
+# ============ TENANT DAILY ROLLUPS ============
+# tenant_daily_stats holds one document per tenant per day (UTC, by ticket
+# created_at) with ticket counts by status, device, location and problem
+# category, plus revenue. A background job rebuilds only the days touched since
+# its last run (tickets.updated_at watermark) and days marked dirty by deletes,
+# so historical range queries read O(days) documents instead of raw tickets.
+# Only the worker holding the "daily_stats_rollup" job_state lease runs it.
+
+DAILY_STATS_INTERVAL_SECONDS = int(os.environ.get('DAILY_STATS_INTERVAL_SECONDS', 300))
+DAILY_STATS_OVERLAP_SECONDS = 60  # re-read writes that were in flight during the previous run
+DAILY_STATS_CHUNK_DAYS = 31
+DAILY_STATS_DIMENSIONS = {
+    "by_status": "status",
+    "by_device": "device_model",
+    "by_location": "location_id",
+    "by_problem": "problem_category",
+}
+
+def parse_day(value: str, field: str) -> datetime:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{field} must be YYYY-MM-DD")
+
+def next_day(day: str) -> str:
+    return (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+def chunk_days(days: list) -> list:
+    """Split sorted days into chunks spanning at most DAILY_STATS_CHUNK_DAYS"""
+    chunks = []
+    for day in days:
+        if chunks and (datetime.strptime(day, "%Y-%m-%d") - datetime.strptime(chunks[-1][0], "%Y-%m-%d")).days < DAILY_STATS_CHUNK_DAYS:
+            chunks[-1].append(day)
+        else:
+            chunks.append([day])
+    return chunks
+
+async def rebuild_daily_stats(tenant_id: str, days: list):
+    """Recompute the rollups of the given days from tickets (idempotent)"""
+    for chunk in chunk_days(sorted(set(day for day in days if day))):
+        facets = {"totals": [{"$group": {
+            "_id": "$day",
+            "tickets": {"$sum": 1},
+            "revenue": {"$sum": {"$ifNull": ["$estimated_cost", 0]}}
+        }}]}
+        for dimension, field in DAILY_STATS_DIMENSIONS.items():
+            facets[dimension] = [{"$group": {"_id": {"day": "$day", "key": f"${field}"}, "count": {"$sum": 1}}}]
+
+        pipeline = [
+            {"$match": {"tenant_id": tenant_id, "created_at": {"$gte": chunk[0], "$lt": next_day(chunk[-1])}}},
+            {"$project": {
+                "_id": 0,
+                "day": {"$substrBytes": ["$created_at", 0, 10]},
+                "estimated_cost": 1,
+                **{field: 1 for field in DAILY_STATS_DIMENSIONS.values()}
+            }},
+            {"$match": {"day": {"$in": chunk}}},
+            {"$facet": facets}
+        ]
+        result = (await db.tickets.aggregate(pipeline, allowDiskUse=True).to_list(1) or [{}])[0]
+
+        now = datetime.now(timezone.utc).isoformat()
+        docs = {}
+        for row in result.get("totals", []):
+            docs[row["_id"]] = {
+                "tenant_id": tenant_id,
+                "day": row["_id"],
+                "tickets": row["tickets"],
+                "revenue": row["revenue"],
+                **{dimension: {} for dimension in DAILY_STATS_DIMENSIONS},
+                "updated_at": now
+            }
+        for dimension in DAILY_STATS_DIMENSIONS:
+            for row in result.get(dimension, []):
+                docs[row["_id"]["day"]][dimension][stats_key(row["_id"].get("key"))] = row["count"]
+
+        for day in chunk:
+            day_filter = {"tenant_id": tenant_id, "day": day}
+            if day in docs:
+                await db.tenant_daily_stats.replace_one(day_filter, docs[day], upsert=True)
+            else:
+                await db.tenant_daily_stats.delete_one(day_filter)
+
+async def run_daily_stats_rollup() -> dict:
+    """Rebuild every (tenant, day) touched since the last run"""
+    state = await db.job_state.find_one({"job_id": "tenant_daily_stats"}) or {}
+    watermark = state.get("watermark")
+    run_started = datetime.now(timezone.utc)
+
+    pending = {}
+    touched = await db.tickets.aggregate([
+        {"$match": {"updated_at": {"$gt": watermark}} if watermark else {}},
+        {"$group": {"_id": {"tenant_id": "$tenant_id", "day": {"$substrBytes": ["$created_at", 0, 10]}}}}
+    ], allowDiskUse=True).to_list(None)
+    for row in touched:
+        pending.setdefault(row["_id"]["tenant_id"], set()).add(row["_id"]["day"])
+
+    async for row in db.tenant_daily_stats.find({"dirty": True}, {"_id": 0, "tenant_id": 1, "day": 1}):
+        pending.setdefault(row["tenant_id"], set()).add(row["day"])
+
+    for tenant_id, days in pending.items():
+        await rebuild_daily_stats(tenant_id, list(days))
+
+    await db.job_state.update_one(
+        {"job_id": "tenant_daily_stats"},
+        {"$set": {
+            "watermark": (run_started - timedelta(seconds=DAILY_STATS_OVERLAP_SECONDS)).isoformat(),
+            "last_run_at": run_started.isoformat()
+        }},
+        upsert=True
+    )
+    return {"tenants": len(pending), "days": sum(len(days) for days in pending.values())}
+
+async def daily_stats_rollup_loop():
+    while True:
+        try:
+            # Held for two periods, like the tenant stats reconcile lease
+            if await acquire_job_lease("daily_stats_rollup", DAILY_STATS_INTERVAL_SECONDS * 2):
+                await run_daily_stats_rollup()
+        except Exception as e:
+            logger.error(f"Daily stats rollup failed: {e}")
+        await asyncio.sleep(DAILY_STATS_INTERVAL_SECONDS)
+
+async def mark_daily_stats_dirty(tenant_id: str, created_at: str):
+    """Deletes leave no updated_at behind; flag the day for the next rollup run"""
+    try:
+        await db.tenant_daily_stats.update_one(
+            {"tenant_id": tenant_id, "day": (created_at or "")[:10]},
+            {"$set": {"dirty": True}}
+        )
+    except Exception as e:
+        print(f"Error marking daily stats: {e}")
+
+async def load_daily_stats(tenant_id: str, date_from: str = None, date_to: str = None) -> list:
+    """Rollups for a tenant in [date_from, date_to] (inclusive, YYYY-MM-DD), oldest first"""
+    query = {"tenant_id": tenant_id}
+    if date_from or date_to:
+        query["day"] = {}
+        if date_from:
+            query["day"]["$gte"] = date_from
+        if date_to:
+            query["day"]["$lte"] = date_to
+    docs = await db.tenant_daily_stats.find(query, {"_id": 0}).sort("day", ASCENDING).to_list(None)
+    if not docs and not await db.tenant_daily_stats.find_one({"tenant_id": tenant_id}, {"_id": 1}):
+        # Tenant not rolled up yet (first run still pending); build it now
+        days = await db.tickets.aggregate([
+            {"$match": {"tenant_id": tenant_id}},
+            {"$group": {"_id": {"$substrBytes": ["$created_at", 0, 10]}}}
+        ]).to_list(None)
+        if days:
+            await rebuild_daily_stats(tenant_id, [row["_id"] for row in days])
+            docs = await db.tenant_daily_stats.find(query, {"_id": 0}).sort("day", ASCENDING).to_list(None)
+    return docs
+
+def merge_daily_stats(docs: list) -> dict:
+    """Sum daily rollups into one summary with decoded labels"""
+    summary = {"tickets": 0, "revenue": 0, **{dimension: {} for dimension in DAILY_STATS_DIMENSIONS}}
+    for doc in docs:
+        summary["tickets"] += doc.get("tickets", 0)
+        summary["revenue"] += doc.get("revenue", 0)
+        for dimension in DAILY_STATS_DIMENSIONS:
+            bucket = summary[dimension]
+            for key, count in doc.get(dimension, {}).items():
+                label = stats_label(key)
+                bucket[label] = bucket.get(label, 0) + count
+    return summary
+
+def daily_stats_series(docs: list, group_by: str) -> list:
+    """Revenue/ticket series per day or per month"""
+    key_length = 7 if group_by == "month" else 10
+    series = {}
+    for doc in docs:
+        period = doc["day"][:key_length]
+        point = series.setdefault(period, {"period": period, "revenue": 0, "tickets": 0})
+        point["revenue"] += doc.get("revenue", 0)
+        point["tickets"] += doc.get("tickets", 0)
+    return list(series.values())
+
+@api_router.get("/statistics/range")
+async def get_statistics_range(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    group_by: str = "day",
+    compare: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Statistics for an arbitrary date range (default: last 30 days), read from daily rollups.
+    compare=true adds the same figures for the preceding period of equal length.
+    """
+    if current_user["user_type"] not in ["tenant_owner", "employee"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    if group_by not in ("day", "month"):
+        raise HTTPException(status_code=400, detail="group_by must be 'day' or 'month'")
+    
+    tenant_id = current_user["tenant_id"]
+    end = parse_day(date_to, "date_to") if date_to else datetime.now(timezone.utc).replace(tzinfo=None)
+    start = parse_day(date_from, "date_from") if date_from else end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="date_from must be before date_to")
+    
+    docs = await load_daily_stats(tenant_id, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+    summary = merge_daily_stats(docs)
+    
+    locations = await db.locations.find({"tenant_id": tenant_id}, {"_id": 0, "location_id": 1, "location_name": 1}).to_list(1000)
+    location_names = {loc["location_id"]: loc.get("location_name") for loc in locations}
+    
+    response = {
+        "date_from": start.strftime("%Y-%m-%d"),
+        "date_to": end.strftime("%Y-%m-%d"),
+        "total_tickets": summary["tickets"],
+        "total_revenue": summary["revenue"],
+        "by_status": summary["by_status"],
+        "by_device": summary["by_device"],
+        "by_location": {location_names.get(key) or key: count for key, count in summary["by_location"].items()},
+        "by_problem": {key: count for key, count in summary["by_problem"].items() if key != "Unknown"},
+        "series": daily_stats_series(docs, group_by)
+    }
+    
+    if compare:
+        span = end - start
+        previous_end = start - timedelta(days=1)
+        previous_start = previous_end - span
+        previous = merge_daily_stats(await load_daily_stats(
+            tenant_id, previous_start.strftime("%Y-%m-%d"), previous_end.strftime("%Y-%m-%d")
+        ))
+        response["previous"] = {
+            "date_from": previous_start.strftime("%Y-%m-%d"),
+            "date_to": previous_end.strftime("%Y-%m-%d"),
+            "total_tickets": previous["tickets"],
+            "total_revenue": previous["revenue"]
+        }
+    
+    return response
+
+# ============ TICKET STATUS EVENTS & CYCLE TIMES ============
+# ticket_status_events is append-only: one document per status change (and one
+# for the initial status at creation) with the time spent in the previous
+# status. A background job folds new events into tenant_cycle_stats
+# (time-in-status, repair-time percentiles per device/location, stuck tickets),
+# which is what the statistics page reads. Only the worker holding the
+# "cycle_stats" job_state lease runs it.
+
+CYCLE_STATS_INTERVAL_SECONDS = int(os.environ.get('CYCLE_STATS_INTERVAL_SECONDS', 900))
+CYCLE_STATS_WINDOW_DAYS = int(os.environ.get('CYCLE_STATS_WINDOW_DAYS', 180))
+CYCLE_STUCK_THRESHOLDS_DAYS = [3, 7, 14, 30]
+
+def status_flags(custom_statuses: list, label: str) -> tuple:
+    """(done, closed) for a status label: done = repair finished, closed = no longer in progress"""
+    definition = next((st for st in custom_statuses or [] if st.get("label") == label), {})
+    category = definition.get("category")
+    done = bool(definition.get("is_final")) or category == "FINALIZAT" or "finalizat" in (label or "").lower()
+    return done, done or category == "ANULAT"
+
+async def closed_statuses(tenant_id: str) -> list:
+    tenant = await get_tenant(tenant_id, "statuses") or {}
+    custom_statuses = tenant.get("custom_statuses", [])
+    labels = {st.get("label") for st in custom_statuses}
+    closed = [label for label in labels if label and status_flags(custom_statuses, label)[1]]
+    # Labels such as "Finalizat" may be used without being defined as custom statuses
+    used = await db.tickets.distinct("status", {"tenant_id": tenant_id})
+    closed += [label for label in used if label and label not in labels and status_flags([], label)[1]]
+    return closed
+
+async def record_status_event(ticket: dict, from_status: Optional[str], to_status: str, changed_by: str, changed_at: datetime):
+    """Append a status transition; ticket needs tenant_id, ticket_id, created_at and the previous status_changed_at"""
+    try:
+        previous_change = ticket.get("status_changed_at") or ticket.get("created_at")
+        seconds_in_previous = None
+        if from_status is not None and previous_change:
+            seconds_in_previous = max((changed_at - datetime.fromisoformat(previous_change)).total_seconds(), 0)
+        
+        tenant = await get_tenant(ticket["tenant_id"], "statuses") or {}
+        custom_statuses = tenant.get("custom_statuses", [])
+        done = status_flags(custom_statuses, to_status)[0]
+        was_done = from_status is not None and status_flags(custom_statuses, from_status)[0]
+        repair_seconds = None
+        if done and not was_done and ticket.get("created_at"):
+            repair_seconds = max((changed_at - datetime.fromisoformat(ticket["created_at"])).total_seconds(), 0)
+        
+        await db.ticket_status_events.insert_one({
+            "event_id": str(uuid.uuid4()),
+            "tenant_id": ticket["tenant_id"],
+            "ticket_id": ticket["ticket_id"],
+            "location_id": ticket.get("location_id"),
+            "device_model": ticket.get("device_model"),
+            "from_status": from_status,
+            "to_status": to_status,
+            "changed_by": changed_by,
+            "changed_at": changed_at.isoformat(),
+            "seconds_in_previous": seconds_in_previous,
+            "repair_seconds": repair_seconds
+        })
+    except Exception as e:
+        # History is best-effort; the ticket update itself already succeeded
+        print(f"Error recording status event: {e}")
+
+def percentile(sorted_values: list, fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+def duration_summary(seconds: list) -> dict:
+    values = sorted(seconds)
+    to_hours = lambda value: round(value / 3600, 1) if value is not None else None
+    return {
+        "count": len(values),
+        "avg_hours": to_hours(sum(values) / len(values)) if values else None,
+        "median_hours": to_hours(percentile(values, 0.5)),
+        "p90_hours": to_hours(percentile(values, 0.9))
+    }
+
+async def compute_cycle_stats(tenant_id: str) -> dict:
+    """Recompute time-in-status and repair-time aggregates over the recent event window"""
+    since = (datetime.now(timezone.utc) - timedelta(days=CYCLE_STATS_WINDOW_DAYS)).isoformat()
+    time_in_status, repair_all, repair_by_device, repair_by_location = {}, [], {}, {}
+    
+    cursor = db.ticket_status_events.find(
+        {"tenant_id": tenant_id, "changed_at": {"$gte": since}},
+        {"_id": 0, "from_status": 1, "seconds_in_previous": 1, "repair_seconds": 1, "device_model": 1, "location_id": 1}
+    )
+    async for event in cursor:
+        if event.get("from_status") is not None and event.get("seconds_in_previous") is not None:
+            time_in_status.setdefault(stats_key(event["from_status"]), []).append(event["seconds_in_previous"])
+        if event.get("repair_seconds") is not None:
+            repair_all.append(event["repair_seconds"])
+            repair_by_device.setdefault(stats_key(event.get("device_model")), []).append(event["repair_seconds"])
+            repair_by_location.setdefault(stats_key(event.get("location_id")), []).append(event["repair_seconds"])
+    
+    return {
+        "window_days": CYCLE_STATS_WINDOW_DAYS,
+        "repair_time": duration_summary(repair_all),
+        "repair_time_by_device": {key: duration_summary(values) for key, values in repair_by_device.items()},
+        "repair_time_by_location": {key: duration_summary(values) for key, values in repair_by_location.items()},
+        "time_in_status": {key: duration_summary(values) for key, values in time_in_status.items()}
+    }
+
+async def count_stuck_tickets(tenant_id: str) -> dict:
+    """Open tickets whose status has not changed for longer than each threshold"""
+    closed = await closed_statuses(tenant_id)
+    now = datetime.now(timezone.utc)
+    stuck = {}
+    for days in CYCLE_STUCK_THRESHOLDS_DAYS:
+        cutoff = (now - timedelta(days=days)).isoformat()
+        stuck[str(days)] = await db.tickets.count_documents({
+            "tenant_id": tenant_id,
+            "status": {"$nin": closed},
+            "$or": [
+                {"status_changed_at": {"$lt": cutoff}},
+                {"status_changed_at": {"$exists": False}, "created_at": {"$lt": cutoff}}
+            ]
+        })
+    return stuck
+
+async def run_cycle_stats() -> dict:
+    """Refresh cycle aggregates for tenants with new events; stuck counts for all tenants"""
+    state = await db.job_state.find_one({"job_id": "ticket_cycle_stats"}) or {}
+    watermark = state.get("watermark")
+    run_started = datetime.now(timezone.utc)
+    
+    changed = await db.ticket_status_events.distinct(
+        "tenant_id", {"changed_at": {"$gt": watermark}} if watermark else {}
+    )
+    for tenant_id in changed:
+        stats = await compute_cycle_stats(tenant_id)
+        await db.tenant_cycle_stats.update_one(
+            {"tenant_id": tenant_id},
+            {"$set": {**stats, "computed_at": run_started.isoformat()}},
+            upsert=True
+        )
+    
+    # Stuck counts age with the clock, so they are refreshed for every tenant
+    tenant_ids = await db.tickets.distinct("tenant_id")
+    for tenant_id in tenant_ids:
+        await db.tenant_cycle_stats.update_one(
+            {"tenant_id": tenant_id},
+            {"$set": {"stuck_tickets": await count_stuck_tickets(tenant_id), "stuck_computed_at": run_started.isoformat()}},
+            upsert=True
+        )
+    
+    await db.job_state.update_one(
+        {"job_id": "ticket_cycle_stats"},
+        {"$set": {
+            "watermark": (run_started - timedelta(seconds=DAILY_STATS_OVERLAP_SECONDS)).isoformat(),
+            "last_run_at": run_started.isoformat()
+        }},
+        upsert=True
+    )
+    return {"tenants_recomputed": len(changed), "tenants": len(tenant_ids)}
+
+async def cycle_stats_loop():
+    while True:
+        try:
+            if await acquire_job_lease("cycle_stats", CYCLE_STATS_INTERVAL_SECONDS * 2):
+                await run_cycle_stats()
+        except Exception as e:
+            logger.error(f"Cycle stats job failed: {e}")
+        await asyncio.sleep(CYCLE_STATS_INTERVAL_SECONDS)
+
+async def get_cycle_stats(tenant_id: str) -> dict:
+    return await db.tenant_cycle_stats.find_one({"tenant_id": tenant_id}, {"_id": 0, "tenant_id": 0}) or {}
+
+@api_router.get("/statistics/cycle-times")
+async def get_cycle_times(current_user: dict = Depends(get_current_user)):
+    """Precomputed repair-time and time-in-status aggregates"""
+    if current_user["user_type"] not in ["tenant_owner", "employee"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    tenant_id = current_user["tenant_id"]
+    stats = await get_cycle_stats(tenant_id)
+    
+    locations = await db.locations.find({"tenant_id": tenant_id}, {"_id": 0, "location_id": 1, "location_name": 1}).to_list(1000)
+    location_names = {loc["location_id"]: loc.get("location_name") for loc in locations}
+    
+    return {
+        "window_days": stats.get("window_days", CYCLE_STATS_WINDOW_DAYS),
+        "repair_time": stats.get("repair_time", duration_summary([])),
+        "repair_time_by_device": {
+            stats_label(key): value for key, value in stats.get("repair_time_by_device", {}).items()
+        },
+        "repair_time_by_location": {
+            location_names.get(stats_label(key)) or stats_label(key): value
+            for key, value in stats.get("repair_time_by_location", {}).items()
+        },
+        "time_in_status": {stats_label(key): value for key, value in stats.get("time_in_status", {}).items()},
+        "stuck_tickets": stats.get("stuck_tickets", {}),
+        "computed_at": stats.get("computed_at")
+    }
 
 @api_router.post("/tenant/locations", response_model=Location)
 async def create_location(
@@ -961,7 +2066,7 @@ async def create_location(
         raise HTTPException(status_code=403, detail="Only service owner can create locations")
     
     # Check plan limits
-    tenant = await db["tenants"].find_one({"tenant_id": current_user["tenant_id"]})
+    tenant = await get_tenant(current_user["tenant_id"], "plan")
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant not found")
     
@@ -1041,7 +2146,7 @@ async def create_employee(
         raise HTTPException(status_code=403, detail="Only service owner can create employees")
     
     # Check plan limits
-    tenant = await db["tenants"].find_one({"tenant_id": current_user["tenant_id"]})
+    tenant = await get_tenant(current_user["tenant_id"], "plan")
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant not found")
     
@@ -1072,11 +2177,11 @@ async def create_employee(
     
     # Check if email exists
     existing = await db.users.find_one({"email": data.email})
-    if existing:
+    if existing or await email_taken(data.email):
         raise HTTPException(status_code=400, detail="Email already exists")
     
     user_id = str(uuid.uuid4())
-    hashed_pw = hash_password(data.password)
+    hashed_pw = await hash_password_async(data.password)
     
     employee_doc = {
         "user_id": user_id,
@@ -1090,6 +2195,7 @@ async def create_employee(
     }
     
     await db.users.insert_one(employee_doc)
+    await upsert_credential(data.email, "employee", user_id, current_user["tenant_id"])
     
     # Log employee creation
     await create_log(
@@ -1183,6 +2289,7 @@ async def add_custom_status(
         {"tenant_id": tenant_id},
         {"$push": {"custom_statuses": status_obj}}
     )
+    invalidate_tenant(tenant_id)
     
     return {"message": "Status added successfully", "status": status_obj}
 
@@ -1195,10 +2302,7 @@ async def get_custom_statuses(current_user: dict = Depends(get_current_user)):
     if not tenant_id:
         return {"statuses": []}
     
-    tenant = await db.tenants.find_one(
-        {"tenant_id": tenant_id},
-        {"custom_statuses": 1}
-    )
+    tenant = await get_tenant(tenant_id, "statuses")
     
     if not tenant:
         return {"statuses": []}
@@ -1248,6 +2352,7 @@ async def update_custom_status(
         {"tenant_id": tenant_id, "custom_statuses.status_id": status_id},
         {"$set": update_fields}
     )
+    invalidate_tenant(tenant_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Status not found")
@@ -1270,6 +2375,7 @@ async def delete_custom_status(
         {"tenant_id": tenant_id},
         {"$pull": {"custom_statuses": {"status_id": status_id}}}
     )
+    invalidate_tenant(tenant_id)
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Status not found")
@@ -1288,10 +2394,7 @@ async def get_company_info(current_user: dict = Depends(get_current_user)):
     if not tenant_id:
         return {}
     
-    tenant = await db.tenants.find_one(
-        {"tenant_id": tenant_id},
-        {"company_name": 1, "service_name": 1, "cui": 1, "address": 1, "phone": 1, "email": 1, "company_info": 1, "_id": 0}
-    )
+    tenant = await get_tenant(tenant_id, "company")
     
     if not tenant:
         return {}
@@ -1352,6 +2455,16 @@ async def update_company_info(
     if not company_info_fields:
         raise HTTPException(status_code=400, detail="No fields to update")
     
+    # The top-level email is the owner's login: move the credential with it.
+    # Claiming first makes a taken address fail before anything is written.
+    previous_email = None
+    if data.email is not None:
+        tenant = await db.tenants.find_one({"tenant_id": tenant_id}, {"_id": 0, "email": 1}) or {}
+        if (tenant.get("email") or "").strip().lower() != data.email.strip().lower():
+            if not await claim_credential(data.email, "tenant_owner", tenant_id, tenant_id):
+                raise HTTPException(status_code=400, detail="Email already registered")
+            previous_email = tenant.get("email")
+    
     # Update company_info object
     for key, value in company_info_fields.items():
         update_fields[f"company_info.{key}"] = value
@@ -1362,10 +2475,14 @@ async def update_company_info(
         {"tenant_id": tenant_id},
         {"$set": update_fields}
     )
+    invalidate_tenant(tenant_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Tenant not found")
     
+    if previous_email:
+        await remove_credential(previous_email, "tenant_owner", tenant_id)
+    
     # Log company info update
     changes = ", ".join([f"{k}: {v}" for k, v in company_info_fields.items()])
     await create_log(
@@ -1403,6 +2520,7 @@ async def update_language(
         {"tenant_id": tenant_id},
         {"$set": {"language": language, "updated_at": datetime.now(timezone.utc).isoformat()}}
     )
+    invalidate_tenant(tenant_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Tenant not found")
@@ -1431,100 +2549,187 @@ async def get_language(current_user: dict = Depends(get_current_user)):
     if not tenant_id:
         raise HTTPException(status_code=400, detail="No tenant associated")
     
-    tenant = await db.tenants.find_one({"tenant_id": tenant_id})
+    tenant = await get_tenant(tenant_id, "settings")
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant not found")
     
     return {"language": tenant.get("language", "ro")}
 
-# ============ CLIENTS (derived from tickets) =========
+# ============ CLIENTS (materialized from tickets) =========
+# A client is identified per tenant by the pair (client_name, client_phone);
+# client_id keeps the "name|phone" format the frontend routes on. The clients
+# collection is maintained incrementally by the ticket write paths and can be
+# rebuilt at any time with backfill_clients.py.
+
+CLIENTS_PAGE_SIZE = 100
+CLIENTS_MAX_PAGE_SIZE = 500
+
+def client_key(client_name: str, client_phone: str) -> tuple:
+    name = client_name or "-"
+    phone = client_phone or "-"
+    return name, phone, f"{name}|{phone}"
+
+CLIENT_SEARCH_LIMIT = 10
+CLIENT_SEARCH_MAX_LIMIT = 50
+CLIENT_SEARCH_MIN_TOKEN = 2
+CLIENT_SEARCH_MAX_TOKEN = 15
+CLIENT_SEARCH_CANDIDATES = 5  # candidates fetched per returned result, re-ranked in memory
+
+def fold_text(value: str) -> str:
+    """Lowercase and strip diacritics (ș→s, ț→t, ă→a, î→i, â→a)"""
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def phone_digits(value: str) -> str:
+    """Digits-only phone in national form (+40 / 0040 prefix replaced by 0)"""
+    digits = re.sub(r"\D", "", value or "")
+    if (value or "").strip().startswith("+40") or (digits.startswith("40") and len(digits) == 11):
+        return "0" + digits[2:]
+    if digits.startswith("0040"):
+        return "0" + digits[4:]
+    return digits
+
+def client_search_tokens(name: str, phone: str) -> list:
+    """Prefix tokens for name words and the phone number"""
+    tokens = set()
+    for word in re.split(r"[^a-z0-9]+", fold_text(name)):
+        for end in range(CLIENT_SEARCH_MIN_TOKEN, min(len(word), CLIENT_SEARCH_MAX_TOKEN) + 1):
+            tokens.add(word[:end])
+    digits = phone_digits(phone)
+    # phones are typed both with and without the leading 0
+    for number in {digits, digits.lstrip("0")}:
+        for end in range(CLIENT_SEARCH_MIN_TOKEN, min(len(number), CLIENT_SEARCH_MAX_TOKEN) + 1):
+            tokens.add(number[:end])
+    return sorted(tokens)
+
+def ticket_search_tokens(ticket: dict) -> list:
+    """client_search_tokens for the client plus the ticket id and device model
+    words, also split at letter/digit boundaries ("iPhone12" -> "iphone", "12")"""
+    words = fold_text(f"{ticket.get('ticket_id') or ''} {ticket.get('device_model') or ''}")
+    words += " " + re.sub(r"(?<=[a-z])(?=\d)|(?<=\d)(?=[a-z])", " ", words)
+    return client_search_tokens(f"{ticket.get('client_name') or ''} {words}", ticket.get("client_phone"))
+
+def client_query_tokens(query: str) -> list:
+    """Split a typeahead query into tokens matching client_search_tokens"""
+    folded = fold_text(query).strip()
+    if re.fullmatch(r"[0-9+()\-./ ]+", folded):
+        # "0722 123 456" is one phone number, not three words
+        parts = [phone_digits(folded)]
+    else:
+        parts = re.split(r"[^a-z0-9]+", folded)
+    return [part[:CLIENT_SEARCH_MAX_TOKEN] for part in parts if len(part) >= CLIENT_SEARCH_MIN_TOKEN]
+
+def client_search_score(client: dict, now: datetime) -> float:
+    """Rank by frequency (ticket count) and recency (last visit)"""
+    try:
+        last_seen = datetime.fromisoformat(client.get("last_seen"))
+        days = max((now - last_seen).total_seconds() / 86400, 0)
+    except (TypeError, ValueError):
+        days = 365
+    return math.log1p(client.get("ticket_count", 0) or 0) + 2 / (1 + days / 30)
+
+async def upsert_client_from_ticket(ticket: dict):
+    """Count a newly created ticket towards its client's aggregates"""
+    name, phone, client_id = client_key(ticket.get("client_name"), ticket.get("client_phone"))
+    created_at = ticket.get("created_at")
+    try:
+        await db.clients.update_one(
+            {"tenant_id": ticket["tenant_id"], "client_id": client_id},
+            {
+                "$inc": {"ticket_count": 1, "lifetime_estimated_cost": ticket.get("estimated_cost", 0) or 0},
+                "$min": {"first_seen": created_at, "created_at": created_at},
+                "$max": {"last_seen": created_at},
+                "$setOnInsert": {
+                    "name": name,
+                    "phone": phone,
+                    "email": None,
+                    "search_tokens": client_search_tokens(name, phone)
+                }
+            },
+            upsert=True
+        )
+    except Exception as e:
+        # The ticket is already stored; backfill_clients.py repairs any drift
+        print(f"Error updating client aggregates: {e}")
+
+async def adjust_client_from_ticket(ticket: dict, ticket_delta: int = 0, cost_delta: float = 0):
+    """Apply a ticket update/delete to its client's aggregates"""
+    if not ticket_delta and not cost_delta:
+        return
+    _, _, client_id = client_key(ticket.get("client_name"), ticket.get("client_phone"))
+    client_filter = {"tenant_id": ticket["tenant_id"], "client_id": client_id}
+    try:
+        await db.clients.update_one(
+            client_filter,
+            {"$inc": {"ticket_count": ticket_delta, "lifetime_estimated_cost": cost_delta}}
+        )
+        if ticket_delta < 0:
+            await db.clients.delete_one({**client_filter, "ticket_count": {"$lte": 0}})
+    except Exception as e:
+        print(f"Error updating client aggregates: {e}")
 
 @api_router.get("/tenant/clients")
-async def get_clients(current_user: dict = Depends(get_current_user)):
-    """Return unique clients for the current tenant derived from tickets.
-    A client is identified by the pair (client_name, client_phone).
+async def get_clients(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = CLIENTS_PAGE_SIZE,
+    current_user: dict = Depends(get_current_user)
+):
+    """Return clients for the current tenant, most recently seen first.
+    The body is a list; the next-page cursor is sent in X-Next-Cursor.
     """
     if current_user["user_type"] not in ["tenant_owner", "employee"]:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    tenant_id = current_user["tenant_id"]
+    limit = max(1, min(limit, CLIENTS_MAX_PAGE_SIZE))
 
-    # fetch all tickets for tenant (tenant-wide so employees also see full list)
-    tickets = await db.tickets.find({"tenant_id": tenant_id}, {"_id": 0, "client_name": 1, "client_phone": 1, "created_at": 1}).to_list(10000)
-
-    client_map = {}
-    for t in tickets:
-        name = t.get("client_name") or "-"
-        phone = t.get("client_phone") or "-"
-        key = f"{name}|{phone}"
-        created_at = t.get("created_at")
-        if key not in client_map:
-            client_map[key] = {
-                "client_id": key,
-                "name": name,
-                "phone": phone,
-                "email": None,
-                "created_at": created_at,
-            }
-        else:
-            # keep the earliest creation date
-            existing = client_map[key]
-            if created_at and existing.get("created_at"):
-                existing["created_at"] = min(existing["created_at"], created_at)
-            elif created_at and not existing.get("created_at"):
-                existing["created_at"] = created_at
+    # tenant-wide so employees also see full list
+    query = {"tenant_id": current_user["tenant_id"]}
+    if cursor:
+        last_seen, last_client_id = decode_cursor(cursor, 2)
+        query["$or"] = [
+            {"last_seen": {"$lt": last_seen}},
+            {"last_seen": last_seen, "client_id": {"$lt": last_client_id}}
+        ]
+
+    clients = await db.clients.find(query, {"_id": 0, "tenant_id": 0, "search_tokens": 0}).sort(
+        [("last_seen", DESCENDING), ("client_id", DESCENDING)]
+    ).limit(limit + 1).to_list(limit + 1)
+
+    if len(clients) > limit:
+        clients = clients[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(clients[-1].get("last_seen"), clients[-1]["client_id"])
 
-    # return as list
-    return list(client_map.values())
+    return clients
 
 @api_router.get("/tenant/clients/search")
-async def search_clients(query: str, current_user: dict = Depends(get_current_user)):
-    """Search clients by name or phone for the current tenant."""
-    print(f"DEBUG: Search clients called with query: '{query}' for tenant: {current_user.get('tenant_id')}")
-    
+async def search_clients(
+    query: str,
+    limit: int = CLIENT_SEARCH_LIMIT,
+    current_user: dict = Depends(get_current_user)
+):
+    """Typeahead search over client names and phones for the current tenant.
+    Every query token must prefix-match a name word or the phone number.
+    """
     if current_user["user_type"] not in ["tenant_owner", "employee"]:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    tenant_id = current_user["tenant_id"]
-    query_lower = query.lower().strip()
-    
-    if not query_lower:
-        print("DEBUG: Empty query, returning empty list")
+    tokens = client_query_tokens(query)
+    if not tokens:
         return []
 
-    # fetch all tickets for tenant
-    tickets = await db.tickets.find({"tenant_id": tenant_id}, {"_id": 0, "client_name": 1, "client_phone": 1, "created_at": 1}).to_list(10000)
-    print(f"DEBUG: Found {len(tickets)} tickets for tenant")
+    limit = max(1, min(limit, CLIENT_SEARCH_MAX_LIMIT))
 
-    client_map = {}
-    for t in tickets:
-        name = t.get("client_name") or "-"
-        phone = t.get("client_phone") or "-"
-        
-        # Check if query matches name or phone
-        if (query_lower in name.lower() or query_lower in phone.lower()):
-            print(f"DEBUG: Match found - {name} ({phone})")
-            key = f"{name}|{phone}"
-            created_at = t.get("created_at")
-            if key not in client_map:
-                client_map[key] = {
-                    "client_id": key,
-                    "name": name,
-                    "phone": phone,
-                    "email": None,
-                    "created_at": created_at,
-                }
-            else:
-                # keep the earliest creation date
-                existing = client_map[key]
-                if created_at and existing.get("created_at"):
-                    existing["created_at"] = min(existing["created_at"], created_at)
-                elif created_at and not existing.get("created_at"):
-                    existing["created_at"] = created_at
-
-    result = list(client_map.values())[:10]
-    print(f"DEBUG: Returning {len(result)} clients")
-    return result
+    # Served by the (tenant_id, search_tokens, last_seen) index; the most recent
+    # candidates are re-ranked by frequency and recency in memory
+    candidates = await db.clients.find(
+        {"tenant_id": current_user["tenant_id"], "search_tokens": {"$all": tokens}},
+        {"_id": 0, "tenant_id": 0, "search_tokens": 0}
+    ).sort("last_seen", DESCENDING).limit(limit * CLIENT_SEARCH_CANDIDATES).to_list(limit * CLIENT_SEARCH_CANDIDATES)
+
+    now = datetime.now(timezone.utc)
+    candidates.sort(key=lambda c: client_search_score(c, now), reverse=True)
+    return candidates[:limit]
 
 # ============ TICKET ROUTES ============
 
@@ -1536,7 +2741,7 @@ async def create_ticket(
     if current_user["user_type"] not in ["tenant_owner", "employee"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    ticket_id = generate_ticket_id()
+    ticket_id = await generate_ticket_id(current_user["tenant_id"])
     
     ticket_doc = {
         "ticket_id": ticket_id,
@@ -1557,11 +2762,33 @@ async def create_ticket(
         "estimated_cost": data.estimated_cost,
         "urgent": data.urgent,
         "status": "Dispozitiv Receptionat",
+        "problem_category": classify_problem(data.reported_issue),
         "created_at": datetime.now(timezone.utc).isoformat(),
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.tickets.insert_one(ticket_doc)
+    ticket_doc["search_tokens"] = ticket_search_tokens(ticket_doc)
+    
+    # The unique index makes a collision (e.g. a counter restored from an
+    # old backup) fail loudly; skip to the next number instead of erroring
+    for attempt in range(3):
+        try:
+            await db.tickets.insert_one(ticket_doc)
+            break
+        except DuplicateKeyError:
+            if attempt == 2:
+                raise HTTPException(status_code=500, detail="Could not allocate a ticket number")
+            ticket_doc.pop("_id", None)
+            ticket_id = await generate_ticket_id(current_user["tenant_id"])
+            ticket_doc["ticket_id"] = ticket_id
+            ticket_doc["search_tokens"] = ticket_search_tokens(ticket_doc)
+    
+    await upsert_client_from_ticket(ticket_doc)
+    await record_status_event(
+        ticket_doc, None, ticket_doc["status"], current_user["user_id"],
+        datetime.fromisoformat(ticket_doc["created_at"])
+    )
+    await increment_tenant_stats(ticket_doc["tenant_id"], {ticket_doc["status"]: (1, ticket_doc["estimated_cost"] or 0)})
     
     # Log ticket creation
     await create_log(
@@ -1583,14 +2810,35 @@ async def create_ticket(
     
     return Ticket(**ticket_doc)
 
+TICKETS_PAGE_SIZE = 50
+TICKETS_MAX_PAGE_SIZE = 200
+
 @api_router.get("/tickets", response_model=List[Ticket])
 async def get_tickets(
+    response: Response,
     location_id: Optional[str] = None,
+    status: Optional[str] = None,
+    urgent: Optional[bool] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    min_cost: Optional[float] = None,
+    max_cost: Optional[float] = None,
+    client_phone: Optional[str] = None,
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = TICKETS_PAGE_SIZE,
     current_user: dict = Depends(get_current_user)
 ):
+    """List tickets newest first, one page at a time.
+    The body stays a plain list; the cursor for the next page is returned in
+    the X-Next-Cursor header (absent on the last page). `search` matches word
+    prefixes of the ticket id, client name, device model or phone, ignoring
+    case and diacritics; every word of the search must match."""
     if current_user["user_type"] not in ["tenant_owner", "employee"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
+    limit = max(1, min(limit, TICKETS_MAX_PAGE_SIZE))
+    
     query = {"tenant_id": current_user["tenant_id"]}
     
     # If employee, filter by their location
@@ -1599,7 +2847,47 @@ async def get_tickets(
     elif location_id:  # If owner provides location filter
         query["location_id"] = location_id
     
-    tickets = await db.tickets.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    if status:
+        query["status"] = status
+    if urgent is not None:
+        query["urgent"] = urgent
+    if client_phone:
+        query["client_phone"] = client_phone
+    search_tokens = client_query_tokens(search or "")
+    if search_tokens:
+        query["search_tokens"] = {"$all": search_tokens}
+    
+    created_range = {}
+    if date_from:
+        created_range["$gte"] = parse_date_param(date_from)
+    if date_to:
+        created_range["$lt" if len(date_to) == 10 else "$lte"] = parse_date_param(date_to, end_of_day=True)
+    if created_range:
+        query["created_at"] = created_range
+    
+    cost_range = {}
+    if min_cost is not None:
+        cost_range["$gte"] = min_cost
+    if max_cost is not None:
+        cost_range["$lte"] = max_cost
+    if cost_range:
+        query["estimated_cost"] = cost_range
+    
+    # Keyset pagination: continue strictly after the last (created_at, ticket_id) seen
+    if cursor:
+        last_created_at, last_ticket_id = decode_cursor(cursor, 2)
+        query = {"$and": [query, {"$or": [
+            {"created_at": {"$lt": last_created_at}},
+            {"created_at": last_created_at, "ticket_id": {"$lt": last_ticket_id}}
+        ]}]}
+    
+    tickets = await db.tickets.find(query, {"_id": 0, "search_tokens": 0}).sort(
+        [("created_at", DESCENDING), ("ticket_id", DESCENDING)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    if len(tickets) > limit:
+        tickets = tickets[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(tickets[-1]["created_at"], tickets[-1]["ticket_id"])
     
     return tickets
 
@@ -1633,14 +2921,48 @@ async def update_ticket(
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
-    result = await db.tickets.update_one(
+    # Pipeline update, so status_changed_at is written with the status and
+    # only when the status really changes; $literal keeps user text like
+    # "$100" from being read as a field path
+    update_fields = {field: {"$literal": value} for field, value in update_data.items()}
+    if "status" in update_data:
+        update_fields["status_changed_at"] = {"$cond": [
+            {"$ne": ["$status", {"$literal": update_data["status"]}]},
+            {"$literal": update_data["updated_at"]},
+            "$status_changed_at"
+        ]}
+    
+    # Return the previous values so derived aggregates can apply the delta
+    previous = await db.tickets.find_one_and_update(
         {"ticket_id": ticket_id, "tenant_id": current_user["tenant_id"]},
-        {"$set": update_data}
+        [{"$set": update_fields}],
+        projection={
+            "_id": 0, "tenant_id": 1, "ticket_id": 1, "client_name": 1, "client_phone": 1, "estimated_cost": 1,
+            "status": 1, "status_changed_at": 1, "created_at": 1, "location_id": 1, "device_model": 1
+        },
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.modified_count == 0:
+    if not previous:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
+    if "estimated_cost" in update_data:
+        await adjust_client_from_ticket(
+            previous,
+            cost_delta=update_data["estimated_cost"] - (previous.get("estimated_cost", 0) or 0)
+        )
+    
+    old_status = previous.get("status")
+    new_status = update_data.get("status", old_status)
+    old_cost = previous.get("estimated_cost", 0) or 0
+    new_cost = update_data.get("estimated_cost", old_cost)
+    if new_status != old_status:
+        await increment_tenant_stats(previous["tenant_id"], {old_status: (-1, -old_cost), new_status: (1, new_cost)})
+        changed_at = datetime.fromisoformat(update_data["updated_at"])
+        await record_status_event(previous, old_status, new_status, current_user["user_id"], changed_at)
+    elif new_cost != old_cost:
+        await increment_tenant_stats(previous["tenant_id"], {old_status: (0, new_cost - old_cost)})
+    
     # Log ticket update
     changes = ", ".join([f"{k}: {v}" for k, v in update_data.items() if k != "updated_at"])
     await create_log(
@@ -1667,21 +2989,23 @@ async def delete_ticket(
     if current_user["user_type"] not in ["tenant_owner", "employee"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Get ticket info before deletion for logging
-    ticket = await db.tickets.find_one(
-        {"ticket_id": ticket_id, "tenant_id": current_user["tenant_id"]}
-    )
-    
-    result = await db.tickets.delete_one(
-        {"ticket_id": ticket_id, "tenant_id": current_user["tenant_id"]}
+    # Every delta below comes from the document as it was deleted, so a
+    # concurrent status or cost change can't leave the counters stale
+    ticket = await db.tickets.find_one_and_delete(
+        {"ticket_id": ticket_id, "tenant_id": current_user["tenant_id"]},
+        projection={"_id": 0, "search_tokens": 0}
     )
     
-    if result.deleted_count == 0:
+    if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
+    await adjust_client_from_ticket(ticket, ticket_delta=-1, cost_delta=-(ticket.get("estimated_cost", 0) or 0))
+    await increment_tenant_stats(ticket["tenant_id"], {ticket.get("status"): (-1, -(ticket.get("estimated_cost", 0) or 0))})
+    await mark_daily_stats_dirty(ticket["tenant_id"], ticket.get("created_at"))
+    
     # Log ticket deletion
-    client_name = ticket.get("client_name", "Unknown") if ticket else "Unknown"
-    device = ticket.get("device_model", "Unknown") if ticket else "Unknown"
+    client_name = ticket.get("client_name", "Unknown")
+    device = ticket.get("device_model", "Unknown")
     await create_log(
         log_type="activity",
         level="warning",
@@ -1724,15 +3048,496 @@ async def seed_admin():
     admin_doc = {
         "admin_id": str(uuid.uuid4()),
         "email": "admin@fixgsm.com",
-        "password_hash": hash_password("admin123"),
+        "password_hash": await hash_password_async("admin123"),
         "role": "superadmin",
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
     await db.admin_users.insert_one(admin_doc)
+    await upsert_credential(admin_doc["email"], "admin", admin_doc["admin_id"])
     
     return {"message": "Admin created", "email": "admin@fixgsm.com", "password": "admin123"}
 
+# ============ AI PROVIDER CLIENTS ============
+# One async client per process, built from platform_settings ai_config and
+# reused across requests (keep-alive connections, no event-loop blocking).
+# It is rebuilt when the provider, key, model or endpoint changes; the
+# config itself is re-read at most every AI_CONFIG_TTL_SECONDS so other
+# workers pick up admin changes. SDKs are imported only for the provider in use.
+
+AI_CONFIG_TTL_SECONDS = int(os.environ.get('AI_CONFIG_TTL_SECONDS', 30))
+AI_MAX_RETRIES = int(os.environ.get('AI_MAX_RETRIES', 2))
+AI_PROVIDER_TIMEOUTS = {
+    "google_gemini": float(os.environ.get('AI_TIMEOUT_GEMINI', 60)),
+    "openai": float(os.environ.get('AI_TIMEOUT_OPENAI', 60)),
+    "azure_openai": float(os.environ.get('AI_TIMEOUT_OPENAI', 60)),
+    "custom_llm": float(os.environ.get('AI_TIMEOUT_CUSTOM_LLM', 120)),
+    "anthropic": float(os.environ.get('AI_TIMEOUT_ANTHROPIC', 90)),
+}
+_ai_config_cache = {"config": None, "expires_at": 0.0}
+_ai_client = {"signature": None, "client": None}
+_ai_client_lock = asyncio.Lock()
+
+def invalidate_ai_clients():
+    """Force the next AI call to re-read ai_config (and rebuild the client if it changed)"""
+    _ai_config_cache["expires_at"] = 0.0
+
+async def load_ai_config() -> Optional[dict]:
+    if _ai_config_cache["expires_at"] > time.monotonic():
+        return _ai_config_cache["config"]
+    config = await db["platform_settings"].find_one({"settings_id": "ai_config"}, {"_id": 0})
+    _ai_config_cache.update(config=config, expires_at=time.monotonic() + AI_CONFIG_TTL_SECONDS)
+    return config
+
+def ai_client_signature(config: dict) -> tuple:
+    return tuple(config.get(field) for field in (
+        "provider", "api_key", "model", "openai_base_url", "openai_organization", "custom_endpoint_url"
+    ))
+
+def build_ai_client(config: dict) -> dict:
+    provider = config.get("provider", "google_gemini")
+    api_key = config.get("api_key")
+    model_name = config.get("model", "gemini-2.5-flash")
+    timeout = AI_PROVIDER_TIMEOUTS.get(provider, 60.0)
+    
+    if provider == "google_gemini":
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        client = genai.GenerativeModel(model_name)
+    elif provider == "openai":
+        import openai
+        client = openai.AsyncOpenAI(api_key=api_key, timeout=timeout, max_retries=AI_MAX_RETRIES)
+    elif provider == "azure_openai":
+        import openai
+        client = openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=config.get("openai_base_url") or None,
+            organization=config.get("openai_organization") or None,
+            timeout=timeout,
+            max_retries=AI_MAX_RETRIES
+        )
+    elif provider == "custom_llm":
+        import openai
+        custom_endpoint = config.get("custom_endpoint_url", "")
+        if not custom_endpoint:
+            raise HTTPException(status_code=500, detail="Custom LLM endpoint URL not configured")
+        client = openai.AsyncOpenAI(api_key=api_key, base_url=custom_endpoint, timeout=timeout, max_retries=AI_MAX_RETRIES)
+    elif provider == "anthropic":
+        import anthropic
+        client = anthropic.AsyncAnthropic(api_key=api_key, timeout=timeout, max_retries=AI_MAX_RETRIES)
+    else:
+        raise HTTPException(status_code=500, detail=f"Unsupported AI provider: {provider}")
+    
+    return {"provider": provider, "model": model_name, "timeout": timeout, "config": config, "client": client}
+
+async def close_ai_client(client, delay: float = 0):
+    """Close an SDK client's connection pool (Gemini's channel is module-global)"""
+    if delay:
+        # Let requests already running on the old client finish
+        await asyncio.sleep(delay)
+    close = getattr(client, "close", None)
+    if close is None:
+        return
+    try:
+        result = close()
+        if asyncio.iscoroutine(result):
+            await result
+    except Exception as e:
+        print(f"Error closing AI client: {e}")
+
+async def get_ai_client() -> dict:
+    """Pooled client for the platform AI provider: {provider, model, timeout, config, client}"""
+    config = await load_ai_config()
+    if not config:
+        raise HTTPException(status_code=500, detail="AI configuration not found. Please configure it in Admin Panel → AI Config")
+    if not config.get("api_key"):
+        provider = config.get("provider", "google_gemini")
+        raise HTTPException(status_code=500, detail=f"{provider.title()} API key not configured. Please configure it in Admin Panel → AI Config")
+    
+    signature = ai_client_signature(config)
+    if _ai_client["signature"] != signature:
+        async with _ai_client_lock:
+            if _ai_client["signature"] != signature:
+                previous = _ai_client["client"]
+                _ai_client["client"] = build_ai_client(config)
+                _ai_client["signature"] = signature
+                if previous:
+                    asyncio.create_task(close_ai_client(previous["client"], delay=previous["timeout"]))
+    
+    ai = _ai_client["client"]
+    # Same client, but hand out the latest config (cost settings etc.)
+    return {**ai, "config": config}
+
+def estimate_ai_cost(provider: str, model_name: str, config: dict, input_tokens: float, output_tokens: float) -> tuple:
+    """(input_cost, output_cost) in USD for a call, from list prices"""
+    input_cost = output_cost = 0.0
+    # Calculate costs based on provider pricing (as of 2024)
+    if provider == "google_gemini":
+        # Gemini pricing: $0.000075 per 1K input tokens, $0.0003 per 1K output tokens
+        input_cost = (input_tokens / 1000) * 0.000075
+        output_cost = (output_tokens / 1000) * 0.0003
+    elif provider == "openai":
+        # OpenAI pricing varies by model
+        if "gpt-4o" in model_name:
+            input_cost = (input_tokens / 1000) * 0.005  # $5 per 1M tokens
+            output_cost = (output_tokens / 1000) * 0.015  # $15 per 1M tokens
+        elif "gpt-4" in model_name:
+            input_cost = (input_tokens / 1000) * 0.03  # $30 per 1M tokens
+            output_cost = (output_tokens / 1000) * 0.06  # $60 per 1M tokens
+        else:  # GPT-3.5
+            input_cost = (input_tokens / 1000) * 0.0015  # $1.5 per 1M tokens
+            output_cost = (output_tokens / 1000) * 0.002  # $2 per 1M tokens
+    elif provider == "anthropic":
+        # Claude pricing
+        if "claude-3-5-sonnet" in model_name:
+            input_cost = (input_tokens / 1000) * 0.003  # $3 per 1M tokens
+            output_cost = (output_tokens / 1000) * 0.015  # $15 per 1M tokens
+        else:  # Claude 3 Opus
+            input_cost = (input_tokens / 1000) * 0.015  # $15 per 1M tokens
+            output_cost = (output_tokens / 1000) * 0.075  # $75 per 1M tokens
+    elif provider == "azure_openai":
+        # Azure OpenAI pricing (similar to OpenAI but may vary)
+        if "gpt-4o" in model_name:
+            input_cost = (input_tokens / 1000) * 0.005
+            output_cost = (output_tokens / 1000) * 0.015
+        else:
+            input_cost = (input_tokens / 1000) * 0.03
+            output_cost = (output_tokens / 1000) * 0.06
+    elif provider == "custom_llm":
+        # Custom LLM pricing from configuration
+        custom_input_cost = config.get("custom_input_cost", 0)
+        custom_output_cost = config.get("custom_output_cost", 0)
+        input_cost = (input_tokens / 1000) * custom_input_cost
+        output_cost = (output_tokens / 1000) * custom_output_cost
+
+    return input_cost, output_cost
+
+def render_system_prompt(provider: str, system):
+    """`system` is a string or a list of {"text", "cache"} segments. Anthropic
+    gets content blocks with cache_control on cacheable segments; other
+    providers get one string with the segments in order (stable prefix first)."""
+    if not system or isinstance(system, str):
+        return system
+    if provider == "anthropic":
+        blocks = []
+        for segment in system:
+            block = {"type": "text", "text": segment["text"]}
+            if segment.get("cache"):
+                block["cache_control"] = {"type": "ephemeral"}
+            blocks.append(block)
+        return blocks
+    return "\n\n".join(segment["text"].strip() for segment in system)
+
+async def provider_complete(ai: dict, prompt: str, system, max_tokens: int, temperature: float) -> tuple:
+    """(text, raw response) for a single-turn completion on the pooled client"""
+    provider, client = ai["provider"], ai["client"]
+    system = render_system_prompt(provider, system)
+    
+    if provider == "google_gemini":
+        full_prompt = f"{system}\n\n{prompt}" if system else prompt
+        # No max_output_tokens: on thinking models it also caps the reasoning,
+        # which can leave no text parts at all (response.text then raises)
+        generation_config = {}
+        if temperature is not None:
+            generation_config["temperature"] = temperature
+        response = await asyncio.wait_for(
+            client.generate_content_async(full_prompt, generation_config=generation_config),
+            timeout=ai["timeout"]
+        )
+        return response.text, response
+    
+    if provider == "anthropic":
+        kwargs = {"model": ai["model"], "max_tokens": max_tokens, "messages": [{"role": "user", "content": prompt}]}
+        if system:
+            kwargs["system"] = system
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        response = await client.messages.create(**kwargs)
+        return response.content[0].text, response
+    
+    # OpenAI-compatible (openai, azure_openai, custom_llm)
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    kwargs = {"model": ai["model"], "messages": messages, "max_tokens": max_tokens}
+    if temperature is not None:
+        kwargs["temperature"] = temperature
+    response = await client.chat.completions.create(**kwargs)
+    return response.choices[0].message.content, response
+
+async def ai_complete(ai: dict, prompt: str, system=None, max_tokens: int = 2000, temperature: float = None, usage: dict = None) -> str:
+    """Single-turn completion on the pooled client; returns the response text.
+    With a `usage` context (ai_usage_context) the call is recorded in ai_usage_stats."""
+    started = time.monotonic()
+    try:
+        text, response = await provider_complete(ai, prompt, system, max_tokens, temperature)
+    except Exception:
+        if usage is not None:
+            record_ai_usage(ai, usage, prompt, system, "", None, started, status="failed")
+        raise
+    if usage is not None:
+        record_ai_usage(ai, usage, prompt, system, text, response, started)
+    return text
+
+async def provider_stream(ai: dict, prompt: str, system, max_tokens: int, temperature: float, final: dict):
+    """Yields text deltas; final["response"] is set to whatever carries the token usage"""
+    provider, client = ai["provider"], ai["client"]
+    system = render_system_prompt(provider, system)
+    
+    if provider == "google_gemini":
+        full_prompt = f"{system}\n\n{prompt}" if system else prompt
+        # No max_output_tokens: on thinking models it also caps the reasoning,
+        # which can leave no text parts at all (response.text then raises)
+        generation_config = {}
+        if temperature is not None:
+            generation_config["temperature"] = temperature
+        response = await asyncio.wait_for(
+            client.generate_content_async(full_prompt, generation_config=generation_config, stream=True),
+            timeout=ai["timeout"]
+        )
+        chunks = response.__aiter__()
+        while True:
+            # Bound every chunk as well, so a stream that stalls midway fails
+            # instead of hanging the background chat task
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=ai["timeout"])
+            except StopAsyncIteration:
+                break
+            # Every chunk carries the usage so far
+            final["response"] = chunk
+            try:
+                yield chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. safety metadata)
+                continue
+        return
+    
+    if provider == "anthropic":
+        kwargs = {"model": ai["model"], "max_tokens": max_tokens, "messages": [{"role": "user", "content": prompt}]}
+        if system:
+            kwargs["system"] = system
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        async with client.messages.stream(**kwargs) as stream:
+            async for text in stream.text_stream:
+                yield text
+            final["response"] = await stream.get_final_message()
+        return
+    
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    kwargs = {"model": ai["model"], "messages": messages, "max_tokens": max_tokens, "stream": True}
+    if temperature is not None:
+        kwargs["temperature"] = temperature
+    if provider == "openai":
+        # Adds a last chunk with the usage; other compatible endpoints may reject it
+        kwargs["stream_options"] = {"include_usage": True}
+    stream = await client.chat.completions.create(**kwargs)
+    async for chunk in stream:
+        if getattr(chunk, "usage", None):
+            final["response"] = chunk
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+async def ai_stream(ai: dict, prompt: str, system=None, max_tokens: int = 2000, temperature: float = None, usage: dict = None):
+    """Like ai_complete, but yields text deltas as the provider produces them"""
+    started = time.monotonic()
+    first_token_at = None
+    parts = []
+    final = {}
+    status = "failed"
+    try:
+        async for delta in provider_stream(ai, prompt, system, max_tokens, temperature, final):
+            if delta and first_token_at is None:
+                first_token_at = time.monotonic()
+            parts.append(delta)
+            yield delta
+        status = "completed"
+    finally:
+        if usage is not None:
+            record_ai_usage(ai, usage, prompt, system, "".join(parts), final.get("response"), started,
+                            first_token_at=first_token_at, status=status)
+
+# ============ AI USAGE ACCOUNTING ============
+# Provider calls made with a usage context get an ai_usage_stats record:
+# tokens as reported by the provider (counted locally with tiktoken when it
+# reports none, ~4 chars/token if tiktoken is unavailable), cost, latency and,
+# for streams, time to first token. Records are queued and written in batches
+# by a background writer like the log writer; a full queue drops the oldest.
+
+AI_USAGE_QUEUE_MAX = int(os.environ.get('AI_USAGE_QUEUE_MAX', 5000))
+AI_USAGE_BATCH_SIZE = int(os.environ.get('AI_USAGE_BATCH_SIZE', 100))
+AI_USAGE_FLUSH_INTERVAL_SECONDS = float(os.environ.get('AI_USAGE_FLUSH_INTERVAL_SECONDS', 2.0))
+_ai_usage_queue = asyncio.Queue(maxsize=AI_USAGE_QUEUE_MAX)
+_ai_usage_writer_task = None
+ai_usage_writer_stats = {"enqueued": 0, "flushed": 0, "dropped": 0, "failed": 0, "batches": 0}
+# tiktoken may download its BPE files on first use, so encodings are loaded
+# in the default executor: the common ones at startup, any other model the
+# first time it is seen (its calls are estimated until the load finishes)
+TOKEN_ENCODING_PRELOAD = ("cl100k_base", "o200k_base")
+_token_encodings = {}  # model -> tiktoken encoding, None when unavailable or still loading
+_token_encoding_tasks = set()
+
+def ai_usage_context(endpoint: str, current_user: dict, conversation_id: str = None) -> dict:
+    return {
+        "endpoint": endpoint,
+        "tenant_id": current_user.get("tenant_id"),
+        "user_id": current_user.get("user_id"),
+        "conversation_id": conversation_id
+    }
+
+def load_token_encoding(model_name: str):
+    """Blocking; run in an executor"""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            # Not an OpenAI model: cl100k is a close enough approximation
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken missing, or its BPE files could not be downloaded
+        print(f"Error loading tokenizer for {model_name}: {e}")
+        return None
+
+async def preload_token_encodings():
+    def preload():
+        import tiktoken
+        for name in TOKEN_ENCODING_PRELOAD:
+            tiktoken.get_encoding(name)
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, preload)
+    except Exception as e:
+        print(f"Error preloading tokenizers: {e}")
+
+async def load_token_encoding_async(model_name: str):
+    _token_encodings[model_name] = await asyncio.get_running_loop().run_in_executor(None, load_token_encoding, model_name)
+
+def get_token_encoding(model_name: str):
+    """Never blocks: returns None until the model's encoding has been loaded"""
+    if model_name not in _token_encodings:
+        _token_encodings[model_name] = None
+        task = asyncio.get_running_loop().create_task(load_token_encoding_async(model_name))
+        _token_encoding_tasks.add(task)
+        task.add_done_callback(_token_encoding_tasks.discard)
+    return _token_encodings[model_name]
+
+def count_tokens(text: str, model_name: str) -> int:
+    if not text:
+        return 0
+    encoding = get_token_encoding(model_name)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def provider_token_usage(provider: str, response) -> Optional[dict]:
+    """{input_tokens, output_tokens, cached_input_tokens} as reported by the provider, if it did"""
+    if response is None:
+        return None
+    if provider == "google_gemini":
+        usage = getattr(response, "usage_metadata", None)
+        if not usage or not getattr(usage, "prompt_token_count", 0):
+            return None
+        return {
+            "input_tokens": usage.prompt_token_count,
+            "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+            "cached_input_tokens": getattr(usage, "cached_content_token_count", 0) or 0
+        }
+    
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    if provider == "anthropic":
+        # input_tokens excludes prompt-cache reads and writes
+        cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        return {
+            "input_tokens": usage.input_tokens + cache_read + cache_write,
+            "output_tokens": usage.output_tokens,
+            "cached_input_tokens": cache_read
+        }
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "input_tokens": usage.prompt_tokens or 0,
+        "output_tokens": usage.completion_tokens or 0,
+        "cached_input_tokens": getattr(details, "cached_tokens", 0) or 0
+    }
+
+def record_ai_usage(ai: dict, usage: dict, prompt: str, system, output_text: str, response, started: float,
+                    first_token_at: float = None, status: str = "completed"):
+    """Queue the ai_usage_stats record for one provider call and copy it into `usage`"""
+    elapsed = time.monotonic() - started
+    tokens = provider_token_usage(ai["provider"], response)
+    token_source = "provider"
+    if tokens is None:
+        token_source = "tokenizer"
+        if status == "failed" and not output_text:
+            # Nothing came back; the request is not billed
+            tokens = {"input_tokens": 0, "output_tokens": 0, "cached_input_tokens": 0}
+        else:
+            system_text = render_system_prompt("", system) or ""
+            tokens = {
+                "input_tokens": count_tokens(system_text, ai["model"]) + count_tokens(prompt, ai["model"]),
+                "output_tokens": count_tokens(output_text, ai["model"]),
+                "cached_input_tokens": 0
+            }
+    
+    input_cost, output_cost = estimate_ai_cost(ai["provider"], ai["model"], ai["config"], tokens["input_tokens"], tokens["output_tokens"])
+    now = datetime.now(timezone.utc)
+    record = {
+        "usage_id": str(uuid.uuid4()),
+        "endpoint": usage.get("endpoint"),
+        "tenant_id": usage.get("tenant_id"),
+        "user_id": usage.get("user_id"),
+        "conversation_id": usage.get("conversation_id"),
+        **tokens,
+        "total_tokens": tokens["input_tokens"] + tokens["output_tokens"],
+        "token_source": token_source,
+        "input_cost": round(input_cost, 6),
+        "output_cost": round(output_cost, 6),
+        "total_cost": round(input_cost + output_cost, 6),
+        "duration_seconds": round(elapsed, 2),
+        "latency_ms": round(elapsed * 1000),
+        "status": status,
+        "model": ai["model"],
+        "provider": ai["provider"],
+        "timestamp": (now - timedelta(seconds=elapsed)).isoformat(),
+        "created_at": now.isoformat()
+    }
+    if first_token_at is not None:
+        record["ttft_ms"] = round((first_token_at - started) * 1000)
+    
+    usage.update(record)
+    if _ai_usage_queue.full():
+        _ai_usage_queue.get_nowait()
+        ai_usage_writer_stats["dropped"] += 1
+    _ai_usage_queue.put_nowait(record)
+    ai_usage_writer_stats["enqueued"] += 1
+
+async def write_ai_usage_batch(batch: list):
+    if not batch:
+        return
+    try:
+        await db["ai_usage_stats"].insert_many(batch, ordered=False)
+        ai_usage_writer_stats["flushed"] += len(batch)
+        ai_usage_writer_stats["batches"] += 1
+    except Exception as e:
+        ai_usage_writer_stats["failed"] += len(batch)
+        print(f"Error writing AI usage batch: {str(e)}")
+
+async def ai_usage_writer_loop():
+    await batch_writer_loop(_ai_usage_queue, AI_USAGE_BATCH_SIZE, AI_USAGE_FLUSH_INTERVAL_SECONDS, write_ai_usage_batch)
+
+async def flush_ai_usage_queue():
+    await flush_batch_queue(_ai_usage_queue, AI_USAGE_BATCH_SIZE, write_ai_usage_batch)
+
+def get_ai_usage_writer_stats() -> dict:
+    return {
+        **ai_usage_writer_stats,
+        "queued": _ai_usage_queue.qsize(),
+        "max_queue": AI_USAGE_QUEUE_MAX,
+        "running": _ai_usage_writer_task is not None and not _ai_usage_writer_task.done()
+    }
+
 # ============ AI CHAT ENDPOINTS ============
 
 class ChatRequest(BaseModel):
@@ -1833,18 +3638,24 @@ async def ai_chat_options():
     """Handle CORS preflight for AI chat endpoint"""
     return {"message": "OK"}
 
-@api_router.post("/ai/chat", response_model=ChatResponse)
-async def ai_chat(request: ChatRequest, current_user: dict = Depends(get_current_user)):
-    """
-    AI Chat endpoint - integrat cu Google Gemini pentru FixGSM Platform
-    """
-    if current_user["user_type"] not in ["admin", "tenant_owner", "employee"]:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
+DEFAULT_TENANT_AI_CONFIG = {
+    "enabled": True,
+    "tone": "professional",
+    "detail_level": "detailed",
+    "language": "ro",
+    "custom_prompt": "",
+    "response_format": "structured",
+    "include_sources": True,
+    "auto_learn": True
+}
+
+async def open_ai_chat(request: ChatRequest, current_user: dict) -> dict:
+    """Shared start of /ai/chat and /ai/chat/stream: plan check, conversation
+    upsert and the tenant's ai_config. Returns {conversation_id, now_iso, ai_config}."""
     # Check if AI is available in current plan
     tenant_id = current_user.get("tenant_id")
     if tenant_id:
-        tenant = await db["tenants"].find_one({"tenant_id": tenant_id})
+        tenant = await get_tenant(tenant_id, "plan")
         if tenant:
             current_plan = tenant.get("subscription_plan", "Trial")
             if current_plan in ["Trial", "Basic"]:
@@ -1875,274 +3686,411 @@ async def ai_chat(request: ChatRequest, current_user: dict = Depends(get_current
 
     # Fetch AI configuration for this tenant
     tenant_id = current_user.get("tenant_id")
-    ai_config = {
-        "enabled": True,
-        "tone": "professional",
-        "detail_level": "detailed",
-        "language": "ro",
-        "custom_prompt": "",
-        "response_format": "structured",
-        "include_sources": True,
-        "auto_learn": True
-    }
+    ai_config = DEFAULT_TENANT_AI_CONFIG
+    
+    if tenant_id:
+        tenant = await get_tenant(tenant_id, "ai")
+        if tenant and "ai_config" in tenant:
+            ai_config = tenant["ai_config"]
+    
+    # Check if AI is enabled for this tenant
+    if not ai_config.get("enabled", True):
+        raise HTTPException(status_code=403, detail="AI Assistant is disabled for your organization")
+    
+    return {"conversation_id": conversation_id, "now_iso": now_iso, "ai_config": ai_config}
+
+# ============ KNOWLEDGE RETRIEVAL ============
+# Per-tenant BM25 index over ai_knowledge (title + content, diacritics
+# folded), held in memory and built on a tenant's first chat. New notes from
+# POST /ai/knowledge and "mem:" capture are added immediately; notes written
+# by other workers are picked up from the (tenant_id, updated_at) index every
+# KNOWLEDGE_INDEX_REFRESH_SECONDS. Retrieval returns the top-k notes as
+# snippets that fit in KNOWLEDGE_TOKEN_BUDGET.
+
+KNOWLEDGE_TOP_K = 5
+KNOWLEDGE_TOKEN_BUDGET = int(os.environ.get('KNOWLEDGE_TOKEN_BUDGET', 600))
+KNOWLEDGE_INDEX_MAX_TENANTS = int(os.environ.get('KNOWLEDGE_INDEX_MAX_TENANTS', 200))
+KNOWLEDGE_INDEX_REFRESH_SECONDS = 30
+KNOWLEDGE_BM25_K1 = 1.2
+KNOWLEDGE_BM25_B = 0.75
+KNOWLEDGE_TITLE_WEIGHT = 2
+# Terms found in more than this share of a tenant's notes only re-score
+# candidates found by rarer terms instead of walking their whole posting list
+KNOWLEDGE_COMMON_TERM_RATIO = 0.1
+# A query made only of common terms is seeded with at most this many notes
+# (the best-weighted ones from the shortest posting list)
+KNOWLEDGE_COMMON_CANDIDATES = 200
+# Cold builds yield to the event loop after every chunk of notes
+KNOWLEDGE_INDEX_BUILD_CHUNK = 200
+_knowledge_indexes = OrderedDict()  # tenant_id -> index dict
+_knowledge_builds = {}  # tenant_id -> in-flight build task
+
+def knowledge_terms(text: str) -> list:
+    return [term for term in re.split(r"[^a-z0-9]+", fold_text(text)) if len(term) > 1 and term not in SYMPTOM_STOP_WORDS]
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for Romanian/English text
+    return max(1, len(text or "") // 4)
+
+def knowledge_frequencies(doc: dict) -> dict:
+    frequencies = {}
+    for term in knowledge_terms(doc.get("title")) * KNOWLEDGE_TITLE_WEIGHT + knowledge_terms(doc.get("content")):
+        frequencies[term] = frequencies.get(term, 0) + 1
+    return frequencies
+
+def add_to_knowledge_index(index: dict, doc: dict, frequencies: dict = None, average_length: float = None):
+    """Postings hold the BM25 term weight, length-normalized against the
+    average note length at the time the note is added"""
+    knowledge_id = doc["knowledge_id"]
+    if knowledge_id in index["docs"]:
+        return
+    if frequencies is None:
+        frequencies = knowledge_frequencies(doc)
+    length = sum(frequencies.values())
+    index["docs"][knowledge_id] = {"title": doc.get("title") or "", "content": doc.get("content") or "", "length": length}
+    index["total_length"] += length
+    if average_length is None:
+        average_length = index["total_length"] / len(index["docs"])
+    norm = KNOWLEDGE_BM25_K1 * (1 - KNOWLEDGE_BM25_B + KNOWLEDGE_BM25_B * length / (average_length or 1))
+    for term, count in frequencies.items():
+        index["postings"].setdefault(term, {})[knowledge_id] = count * (KNOWLEDGE_BM25_K1 + 1) / (count + norm)
+    index["watermark"] = max(index["watermark"], doc.get("updated_at") or "")
+
+async def load_knowledge_docs(tenant_id: str, since: str = None) -> list:
+    query = {"tenant_id": tenant_id}
+    if since:
+        query["updated_at"] = {"$gte": since}
+    return await db.ai_knowledge.find(
+        query, {"_id": 0, "knowledge_id": 1, "title": 1, "content": 1, "updated_at": 1}
+    ).to_list(length=None)
+
+async def build_knowledge_index(tenant_id: str) -> dict:
+    """Cold build of a tenant's index; pure-Python CPU work, so it runs in
+    chunks of KNOWLEDGE_INDEX_BUILD_CHUNK notes and yields to the loop between them"""
+    index = {"docs": {}, "postings": {}, "total_length": 0, "watermark": "", "refreshed_at": time.monotonic()}
+    docs = await load_knowledge_docs(tenant_id)
+    # Normalize the initial load against the final average length
+    frequencies = []
+    for start in range(0, len(docs), KNOWLEDGE_INDEX_BUILD_CHUNK):
+        frequencies.extend(knowledge_frequencies(doc) for doc in docs[start:start + KNOWLEDGE_INDEX_BUILD_CHUNK])
+        await asyncio.sleep(0)
+    average_length = sum(sum(freq.values()) for freq in frequencies) / max(len(docs), 1)
+    for start in range(0, len(docs), KNOWLEDGE_INDEX_BUILD_CHUNK):
+        for doc, freq in zip(docs[start:start + KNOWLEDGE_INDEX_BUILD_CHUNK], frequencies[start:start + KNOWLEDGE_INDEX_BUILD_CHUNK]):
+            add_to_knowledge_index(index, doc, freq, average_length)
+        await asyncio.sleep(0)
+    _knowledge_indexes[tenant_id] = index
+    while len(_knowledge_indexes) > KNOWLEDGE_INDEX_MAX_TENANTS:
+        _knowledge_indexes.popitem(last=False)
+    return index
+
+async def get_knowledge_index(tenant_id: str) -> dict:
+    index = _knowledge_indexes.get(tenant_id)
+    if index is None:
+        # Concurrent first chats share one build; shield it so a cancelled
+        # request doesn't cancel it for the others
+        build = _knowledge_builds.get(tenant_id)
+        if build is None:
+            build = asyncio.ensure_future(build_knowledge_index(tenant_id))
+            _knowledge_builds[tenant_id] = build
+            build.add_done_callback(lambda _: _knowledge_builds.pop(tenant_id, None))
+        index = await asyncio.shield(build)
+    elif time.monotonic() - index["refreshed_at"] >= KNOWLEDGE_INDEX_REFRESH_SECONDS:
+        # $gte re-reads the newest note; add_to_knowledge_index skips known ids
+        for doc in await load_knowledge_docs(tenant_id, since=index["watermark"] or None):
+            add_to_knowledge_index(index, doc)
+        index["refreshed_at"] = time.monotonic()
+    if tenant_id in _knowledge_indexes:
+        _knowledge_indexes.move_to_end(tenant_id)
+    return index
+
+def index_knowledge(doc: dict):
+    """Add a new note to its tenant's index (if that index is loaded)"""
+    index = _knowledge_indexes.get(doc.get("tenant_id"))
+    if index is not None:
+        add_to_knowledge_index(index, doc)
+
+def knowledge_snippet(content: str, terms: set, max_chars: int) -> str:
+    """Window of `content` starting shortly before the first matching term"""
+    if len(content) <= max_chars:
+        return content
+    folded = fold_text(content)  # same length as content for Romanian text
+    positions = [match.start() for match in re.finditer(r"[a-z0-9]+", folded) if match.group() in terms]
+    start = max(0, positions[0] - max_chars // 4) if positions and len(folded) == len(content) else 0
+    snippet = content[start:start + max_chars].strip()
+    return ("…" if start > 0 else "") + snippet + ("…" if start + max_chars < len(content) else "")
+
+async def retrieve_knowledge(tenant_id: str, query: str, top_k: int = KNOWLEDGE_TOP_K, token_budget: int = KNOWLEDGE_TOKEN_BUDGET) -> list:
+    """BM25 top-k notes for `query` as [{knowledge_id, title, snippet, score}] within token_budget"""
+    terms = set(knowledge_terms(query))
+    if not tenant_id or not terms:
+        return []
+    index = await get_knowledge_index(tenant_id)
+    total_docs = len(index["docs"])
+    if not total_docs:
+        return []
+    
+    postings_by_term = sorted(
+        (postings for postings in (index["postings"].get(term) for term in terms) if postings), key=len
+    )
+    if not postings_by_term:
+        return []
+    # Rare terms nominate candidates; common terms (df above the ratio) only
+    # add to the score of notes already nominated, so a query word found in
+    # most notes never walks its whole posting list
+    common_df = max(1, int(total_docs * KNOWLEDGE_COMMON_TERM_RATIO))
+    selective = sum(1 for postings in postings_by_term if len(postings) <= common_df)
+    scores = {}
+    for position, postings in enumerate(postings_by_term):
+        idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+        if position < selective:
+            for knowledge_id, weight in postings.items():
+                scores[knowledge_id] = scores.get(knowledge_id, 0.0) + idf * weight
+        elif position == 0:
+            # Only common terms: seed from the best notes of the shortest list
+            for knowledge_id, weight in heapq.nlargest(KNOWLEDGE_COMMON_CANDIDATES, postings.items(), key=lambda item: item[1]):
+                scores[knowledge_id] = idf * weight
+        else:
+            for knowledge_id in scores:
+                weight = postings.get(knowledge_id)
+                if weight:
+                    scores[knowledge_id] += idf * weight
+    
+    results = []
+    remaining = token_budget
+    for knowledge_id, score in heapq.nlargest(top_k, scores.items(), key=lambda item: item[1]):
+        doc = index["docs"][knowledge_id]
+        title_tokens = estimate_tokens(doc["title"])
+        if remaining <= title_tokens:
+            break
+        snippet = knowledge_snippet(doc["content"], terms, (remaining - title_tokens) * 4)
+        remaining -= title_tokens + estimate_tokens(snippet)
+        results.append({"knowledge_id": knowledge_id, "title": doc["title"], "snippet": snippet, "score": round(score, 3)})
+    return results
+
+# ============ CHAT SYSTEM PROMPT ============
+# The chat system prompt is two segments: CHAT_STATIC_PROMPT (identical for
+# every tenant, marked cacheable) followed by the tenant's configuration.
+# Keeping the static text first lets providers reuse it between calls:
+# Anthropic through cache_control on that block, OpenAI through automatic
+# prefix caching. Compiled segments are kept per (tenant, provider, model)
+# and dropped when the tenant's ai_config changes (PUT /ai/config).
+
+CHAT_TONE_INSTRUCTIONS = {
+    "professional": "Comunică profesional, exact și orientat spre soluții.",
+    "friendly": "Comunică într-un mod prietenos și accesibil, menținând profesionalismul.",
+    "technical": "Folosește terminologie tehnică avansată și detalii tehnice aprofundate. Vorbești ca un coleg de service GSM, pe scurt și la obiect."
+}
+
+CHAT_DETAIL_INSTRUCTIONS = {
+    "brief": "Oferă răspunsuri concise și directe, fără detalii suplimentare decât esențialul.",
+    "balanced": "Oferă un echilibru între detalii și concizie, menționând aspectele importante fără a fi excesiv.",
+    "detailed": "Oferă răspunsuri detaliate cu explicații complete, exemple și checklist-uri extinse."
+}
+
+CHAT_FORMAT_INSTRUCTIONS = {
+    "structured": "Structurează ÎNTOTDEAUNA răspunsurile cu liste, bullet points și pași clari numerotați.",
+    "conversational": "Răspunde într-un mod conversațional, natural și fluid, fără structuri rigide."
+}
+
+CHAT_STATIC_PROMPT = """Ești AI-ul tehnic al platformei FixGSM.
+
+PRINCIPII DE COMUNICARE (OBLIGATORIU):
+- Răspunzi ÎNTOTDEAUNA în română, stil colegial, fără formalități inutile.
+- Oferi pași concreți, checklist-uri și posibile cauze cu probabilități.
+- Prioritizezi diagnosticul practic: ce să măsori, ce să verifici, ce piese să schimbi.
+- Sugerezi un flux de depanare de la simplu la complex.
+- Dacă lipsesc detalii (model, simptome, istoric), ceri clarificări punctuale.
+- Menționezi scule/metode: multimetru, alimentare de laborator, jig, loguri, diag apps.
+- Dacă există riscuri (pierdere garanție, ESD, date), le evidențiezi.
+- Evită texte vagi. Preferă bullet points și structură clară.
+
+CONTEXT FIXGSM:
+- Platformă de management pentru service GSM: fișe, clienți, reparații, piese, statusuri.
+- Public țintă: tehnicieni (junior/mediu/avansat) care vor răspunsuri aplicabile rapid.
+
+IMPORTANT - DETECTARE ÎNTREBĂRI STATISTICI:
+Dacă utilizatorul întreabă despre statistici, date business, analize, profitabilitate, 
+frecvența problemelor, venituri, costuri, sau alte întrebări despre date business,
+răspunde cu:
+
+"📊 Pentru întrebări despre statistici și analize business, te rog să folosești 
+**Analiză Statistici AI** din meniul principal. Acolo poți întreba în română 
+despre datele business și vei primi analize detaliate cu insights acționabile.
+
+Pentru asistență tehnică (reparații, diagnostic, probleme), sunt aici să te ajut!"
+
+FORMAT DE RĂSPUNS RECOMANDAT:
+1) Rezumat scurt al problemei (1-2 linii)
+2) Posibile cauze (ordonate de la probabil la rar)
+3) Checklist de verificări (de la simplu la avansat)
+4) Pași de remediere/încercări rapide
+5) Când escaladezi (placă, micro-soldering, diag avansat)
+6) Note/precauții (ESD, backup, garanție)
+
+PLAYBOOK-URI TEHNICE (FOLOSEȘTE-LE CA GHID):
+• ÎNCĂRCARE/BATERIE
+  - Cauze probabile: cablu/adaptor, port murdar, baterie uzată, Tristar/U2, PMIC, lichid
+  - Checklist: alt cablu/adapter; inspectează/curăță port; măsoară consum pe alimentare de laborator; test baterie (tensiune, ciclu); loguri iOS/Android; semne oxidare
+  - Remedieri rapide: curățare port; altă baterie de test; flex încărcare; reflow/înlocuire Tristar (iPhone); verificare linii VBUS/PP_BATT
+• ECRAN/DISPLAY
+  - Cauze: ecran defect, conector/flex, backlight, driver, apă
+  - Checklist: test ecran nou; inspectează conectori/pini; lanternă pt backlight; diag software (safe mode)
+  - Remedieri: înlocuire ecran/flex; reflow driver/backlight; curățare conectori
+• AUDIO/MIC/DIFUZOR
+  - Cauze: difuzor murdar/defect, microfon blocat, codec audio, setări, apă
+  - Checklist: test apel/dictare/recorder; difuzor sus/jos; inspectează grile; test cu difuzor/placă de probă
+  - Remedieri: curățare grile; înlocuire modul difuzor/mic; reflow/înlocuire codec audio dacă confirmat
+• SEMNAL/NETWORK
+  - Cauze: antene/conectori, PA/duplexer, SIM/IMEI, cădere, firmware
+  - Checklist: alt SIM; verifică IMEI/baseband; inspectează antene și pogo pins; test în altă zonă; diag *#*#4636#*#* (Android)
+  - Remedieri: refixare antene; înlocuire conector; reflow/înlocuire PA; update/restore firmware
+• CAMERĂ
+  - Cauze: modul cameră, OIS blocat, conexiuni, aplicație, șoc
+  - Checklist: test cameră față/spate; altă aplicație; inspectează modul/conector; test cu modul de probă
+  - Remedieri: înlocuire modul; curățare; reflow conector
+• APĂ/OXIDARE
+  - Checklist: deconectează baterie; curăță ultrasonic; uscare controlată; inspecție microscop; măsurători scurt/rezistențe; căutare coroziune linii PP_MAIN
+• BOOTLOOP/NU PORNEȘTE
+  - Checklist: alimentare de laborator (curbă consum), recovery/restore, măsurări linii principale (PP_VCC_MAIN etc.), izolare periferice
+• WI‑FI/BLUETOOTH
+  - Checklist: toggle/firmware, antene/conectori, modul RF, temperaturi, loguri
+• SIM/IMEI
+  - Checklist: test alt SIM, citire IMEI/baseband, inspecție SIM tray/contacte, reflash/restore
+• PLACĂ DE BAZĂ – NOTE
+  - PMIC/Tristar/U2/baseband/PA/duplexer/audio codec/backlight pot necesita micro-soldering, diag avansat, schemă și boardview.
+
+Respectă formatul de mai sus cât de mult posibil. Fii util și concret.
+"""
+
+CHAT_PROMPT_CACHE_SIZE = 1000
+_chat_prompts = OrderedDict()  # (tenant_id, provider, model) -> (config fingerprint, segments)
+
+def build_chat_system_prompt(ai_config: dict) -> list:
+    """System prompt segments for the technical chat: [static, tenant configuration]"""
+    tenant_section = f"""CONFIGURARE PERSONALIZATĂ:
+- Ton comunicare: {CHAT_TONE_INSTRUCTIONS.get(ai_config.get('tone', 'professional'), CHAT_TONE_INSTRUCTIONS['technical'])}
+- Nivel detaliu: {CHAT_DETAIL_INSTRUCTIONS.get(ai_config.get('detail_level', 'detailed'), CHAT_DETAIL_INSTRUCTIONS['detailed'])}
+- Format răspuns: {CHAT_FORMAT_INSTRUCTIONS.get(ai_config.get('response_format', 'structured'), CHAT_FORMAT_INSTRUCTIONS['structured'])}
+- Limba obligatorie: ROMÂNĂ (RO)
+"""
+    if ai_config.get('custom_prompt'):
+        tenant_section += f"\nINSTRUCȚIUNI PERSONALIZATE (PRIORITARE):\n{ai_config.get('custom_prompt')}\n"
+    
+    return [{"text": CHAT_STATIC_PROMPT, "cache": True}, {"text": tenant_section}]
+
+def invalidate_chat_prompt(tenant_id: str):
+    for key in [key for key in _chat_prompts if key[0] == tenant_id]:
+        _chat_prompts.pop(key, None)
+
+def get_chat_system_prompt(tenant_id: str, ai_config: dict, ai: dict) -> list:
+    """Compiled system prompt segments for this tenant on the current provider/model"""
+    key = (tenant_id, ai["provider"], ai["model"])
+    fingerprint = json.dumps(ai_config, sort_keys=True, default=str)
+    cached = _chat_prompts.get(key)
+    if cached and cached[0] == fingerprint:
+        _chat_prompts.move_to_end(key)
+        return cached[1]
+    
+    segments = build_chat_system_prompt(ai_config)
+    _chat_prompts[key] = (fingerprint, segments)
+    while len(_chat_prompts) > CHAT_PROMPT_CACHE_SIZE:
+        _chat_prompts.popitem(last=False)
+    return segments
+
+async def capture_chat_memory(message: str, current_user: dict) -> bool:
+    """Messages starting with a memory prefix ("mem:" ...) are stored as knowledge"""
+    memorized_flag = False
+    message_trim = (message or "").strip()
+    lower = message_trim.lower()
+    mem_prefixes = ["mem:", "memorize:", "memoreaza:", "rezolvare:"]
+    for p in mem_prefixes:
+        if lower.startswith(p):
+            content_to_store = message_trim[len(p):].strip()
+            if content_to_store:
+                nowk = datetime.now(timezone.utc).isoformat()
+                knowledge_id = str(uuid.uuid4())
+                doc = {
+                    "knowledge_id": knowledge_id,
+                    "tenant_id": current_user.get("tenant_id"),
+                    "user_id": current_user["user_id"],
+                    "title": (content_to_store[:60] + ("..." if len(content_to_store) > 60 else "")),
+                    "content": content_to_store,
+                    "tags": [],
+                    "created_at": nowk,
+                    "updated_at": nowk,
+                }
+                await db.ai_knowledge.insert_one(doc)
+                index_knowledge(doc)
+                memorized_flag = True
+            break
+    return memorized_flag
+
+async def build_chat_prompt(system_prompt: list, request: ChatRequest, tenant_id: str) -> tuple:
+    """(system, transcript): the compiled system segments plus memorized
+    knowledge, and the recent history with the current message as the user turn"""
+    # Knowledge varies per turn, so it goes after the cacheable segments
+    knowledge_lines = []
+    try:
+        kitems = await retrieve_knowledge(tenant_id, request.message)
+        if kitems:
+            knowledge_lines.append("CUNOȘTINȚE MEMORIZATE (relevante pentru întrebare):")
+            knowledge_lines.extend(f"- {ki['title'].strip()}: {ki['snippet']}" for ki in kitems)
+    except Exception as e:
+        print(f"Error retrieving knowledge: {e}")
     
-    if tenant_id:
-        tenant = await db.tenants.find_one({"tenant_id": tenant_id})
-        if tenant and "ai_config" in tenant:
-            ai_config = tenant["ai_config"]
+    system = list(system_prompt)
+    if knowledge_lines:
+        system.append({"text": "\n".join(knowledge_lines)})
     
-    # Check if AI is enabled for this tenant
-    if not ai_config.get("enabled", True):
-        raise HTTPException(status_code=403, detail="AI Assistant is disabled for your organization")
+    # Ultimele 5 mesaje pentru context, apoi mesajul curent
+    lines = []
+    for msg in (request.conversation_history or [])[-5:]:
+        if msg.get('type') == 'user':
+            lines.append(f"Utilizator: {msg.get('content', '')}")
+        elif msg.get('type') == 'ai':
+            lines.append(f"AI: {msg.get('content', '')}")
+    lines.append(f"Utilizator: {request.message}")
+    lines.append("AI:")
+    
+    return system, "\n".join(lines)
+
+@api_router.post("/ai/chat", response_model=ChatResponse)
+async def ai_chat(request: ChatRequest, current_user: dict = Depends(get_current_user)):
+    """
+    AI Chat endpoint - integrat cu Google Gemini pentru FixGSM Platform
+    """
+    if current_user["user_type"] not in ["admin", "tenant_owner", "employee"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    chat = await open_ai_chat(request, current_user)
+    conversation_id = chat["conversation_id"]
+    now_iso = chat["now_iso"]
+    ai_config = chat["ai_config"]
     
     # Initialize memorized_flag outside try block
     memorized_flag = False
     
     try:
-        # Get AI configuration from database
-        ai_global_config = await db["platform_settings"].find_one({"settings_id": "ai_config"})
-        
-        if not ai_global_config:
-            raise HTTPException(status_code=500, detail="AI configuration not found. Please configure it in Admin Panel → AI Config")
-        
-        provider = ai_global_config.get("provider", "google_gemini")
-        api_key = ai_global_config.get("api_key")
-        model_name = ai_global_config.get("model", "gemini-2.5-flash")
-        
-        if not api_key:
-            raise HTTPException(status_code=500, detail=f"{provider.title()} API key not configured. Please configure it in Admin Panel → AI Config")
-        
-        # Initialize AI provider based on configuration
-        if provider == "google_gemini":
-            import google.generativeai as genai
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(model_name)
-        elif provider == "openai":
-            import openai
-            client = openai.OpenAI(api_key=api_key)
-        elif provider == "anthropic":
-            import anthropic
-            client = anthropic.Anthropic(api_key=api_key)
-        elif provider == "azure_openai":
-            import openai
-            base_url = ai_global_config.get("openai_base_url", "")
-            organization = ai_global_config.get("openai_organization", "")
-            client = openai.OpenAI(
-                api_key=api_key,
-                base_url=base_url,
-                organization=organization
-            )
-        elif provider == "custom_llm":
-            import openai
-            custom_endpoint = ai_global_config.get("custom_endpoint_url", "")
-            if not custom_endpoint:
-                raise HTTPException(status_code=500, detail="Custom LLM endpoint URL not configured")
-            client = openai.OpenAI(
-                api_key=api_key,
-                base_url=custom_endpoint
-            )
-        else:
-            raise HTTPException(status_code=500, detail=f"Unsupported AI provider: {provider}")
-        
-        # Track AI usage for statistics
-        usage_id = str(uuid.uuid4())
-        usage_start_time = datetime.now(timezone.utc)
-        
-        # Build system prompt based on tenant configuration
-        tone_instructions = {
-            "professional": "Comunică profesional, exact și orientat spre soluții.",
-            "friendly": "Comunică într-un mod prietenos și accesibil, menținând profesionalismul.",
-            "technical": "Folosește terminologie tehnică avansată și detalii tehnice aprofundate. Vorbești ca un coleg de service GSM, pe scurt și la obiect."
-        }
-        
-        detail_instructions = {
-            "brief": "Oferă răspunsuri concise și directe, fără detalii suplimentare decât esențialul.",
-            "balanced": "Oferă un echilibru între detalii și concizie, menționând aspectele importante fără a fi excesiv.",
-            "detailed": "Oferă răspunsuri detaliate cu explicații complete, exemple și checklist-uri extinse."
-        }
-        
-        format_instructions = {
-            "structured": "Structurează ÎNTOTDEAUNA răspunsurile cu liste, bullet points și pași clari numerotați.",
-            "conversational": "Răspunde într-un mod conversațional, natural și fluid, fără structuri rigide."
-        }
-        
-        custom_section = ""
-        if ai_config.get('custom_prompt'):
-            custom_section = f"\n\nINSTRUCȚIUNI PERSONALIZATE (PRIORITARE):\n{ai_config.get('custom_prompt')}\n"
-        
-        # Sistem de prompt specializat pentru FixGSM Platform
-        system_prompt = f"""
-        Ești AI-ul tehnic al platformei FixGSM.
-        
-        CONFIGURARE PERSONALIZATĂ:
-        - Ton comunicare: {tone_instructions.get(ai_config.get('tone', 'professional'), tone_instructions['technical'])}
-        - Nivel detaliu: {detail_instructions.get(ai_config.get('detail_level', 'detailed'), detail_instructions['detailed'])}
-        - Format răspuns: {format_instructions.get(ai_config.get('response_format', 'structured'), format_instructions['structured'])}
-        - Limba obligatorie: ROMÂNĂ (RO)
-        {custom_section}
-
-        PRINCIPII DE COMUNICARE (OBLIGATORIU):
-        - Răspunzi ÎNTOTDEAUNA în română, stil colegial, fără formalități inutile.
-        - Oferi pași concreți, checklist-uri și posibile cauze cu probabilități.
-        - Prioritizezi diagnosticul practic: ce să măsori, ce să verifici, ce piese să schimbi.
-        - Sugerezi un flux de depanare de la simplu la complex.
-        - Dacă lipsesc detalii (model, simptome, istoric), ceri clarificări punctuale.
-        - Menționezi scule/metode: multimetru, alimentare de laborator, jig, loguri, diag apps.
-        - Dacă există riscuri (pierdere garanție, ESD, date), le evidențiezi.
-        - Evită texte vagi. Preferă bullet points și structură clară.
-
-        CONTEXT FIXGSM:
-        - Platformă de management pentru service GSM: fișe, clienți, reparații, piese, statusuri.
-        - Public țintă: tehnicieni (junior/mediu/avansat) care vor răspunsuri aplicabile rapid.
-
-        IMPORTANT - DETECTARE ÎNTREBĂRI STATISTICI:
-        Dacă utilizatorul întreabă despre statistici, date business, analize, profitabilitate, 
-        frecvența problemelor, venituri, costuri, sau alte întrebări despre date business,
-        răspunde cu:
+        # Pooled client for the platform AI provider
+        ai = await get_ai_client()
         
-        "📊 Pentru întrebări despre statistici și analize business, te rog să folosești 
-        **Analiză Statistici AI** din meniul principal. Acolo poți întreba în română 
-        despre datele business și vei primi analize detaliate cu insights acționabile.
-        
-        Pentru asistență tehnică (reparații, diagnostic, probleme), sunt aici să te ajut!"
-
-        FORMAT DE RĂSPUNS RECOMANDAT:
-        1) Rezumat scurt al problemei (1-2 linii)
-        2) Posibile cauze (ordonate de la probabil la rar)
-        3) Checklist de verificări (de la simplu la avansat)
-        4) Pași de remediere/încercări rapide
-        5) Când escaladezi (placă, micro-soldering, diag avansat)
-        6) Note/precauții (ESD, backup, garanție)
-
-        PLAYBOOK-URI TEHNICE (FOLOSEȘTE-LE CA GHID):
-        • ÎNCĂRCARE/BATERIE
-          - Cauze probabile: cablu/adaptor, port murdar, baterie uzată, Tristar/U2, PMIC, lichid
-          - Checklist: alt cablu/adapter; inspectează/curăță port; măsoară consum pe alimentare de laborator; test baterie (tensiune, ciclu); loguri iOS/Android; semne oxidare
-          - Remedieri rapide: curățare port; altă baterie de test; flex încărcare; reflow/înlocuire Tristar (iPhone); verificare linii VBUS/PP_BATT
-        • ECRAN/DISPLAY
-          - Cauze: ecran defect, conector/flex, backlight, driver, apă
-          - Checklist: test ecran nou; inspectează conectori/pini; lanternă pt backlight; diag software (safe mode)
-          - Remedieri: înlocuire ecran/flex; reflow driver/backlight; curățare conectori
-        • AUDIO/MIC/DIFUZOR
-          - Cauze: difuzor murdar/defect, microfon blocat, codec audio, setări, apă
-          - Checklist: test apel/dictare/recorder; difuzor sus/jos; inspectează grile; test cu difuzor/placă de probă
-          - Remedieri: curățare grile; înlocuire modul difuzor/mic; reflow/înlocuire codec audio dacă confirmat
-        • SEMNAL/NETWORK
-          - Cauze: antene/conectori, PA/duplexer, SIM/IMEI, cădere, firmware
-          - Checklist: alt SIM; verifică IMEI/baseband; inspectează antene și pogo pins; test în altă zonă; diag *#*#4636#*#* (Android)
-          - Remedieri: refixare antene; înlocuire conector; reflow/înlocuire PA; update/restore firmware
-        • CAMERĂ
-          - Cauze: modul cameră, OIS blocat, conexiuni, aplicație, șoc
-          - Checklist: test cameră față/spate; altă aplicație; inspectează modul/conector; test cu modul de probă
-          - Remedieri: înlocuire modul; curățare; reflow conector
-        • APĂ/OXIDARE
-          - Checklist: deconectează baterie; curăță ultrasonic; uscare controlată; inspecție microscop; măsurători scurt/rezistențe; căutare coroziune linii PP_MAIN
-        • BOOTLOOP/NU PORNEȘTE
-          - Checklist: alimentare de laborator (curbă consum), recovery/restore, măsurări linii principale (PP_VCC_MAIN etc.), izolare periferice
-        • WI‑FI/BLUETOOTH
-          - Checklist: toggle/firmware, antene/conectori, modul RF, temperaturi, loguri
-        • SIM/IMEI
-          - Checklist: test alt SIM, citire IMEI/baseband, inspecție SIM tray/contacte, reflash/restore
-        • PLACĂ DE BAZĂ – NOTE
-          - PMIC/Tristar/U2/baseband/PA/duplexer/audio codec/backlight pot necesita micro-soldering, diag avansat, schemă și boardview.
-
-        Respectă formatul de mai sus cât de mult posibil. Fii util și concret.
-        """
+        system_prompt = get_chat_system_prompt(current_user.get("tenant_id"), ai_config, ai)
         
         # Memory capture: messages starting with prefixes will be stored as knowledge
-        message_trim = (request.message or "").strip()
-        lower = message_trim.lower()
-        mem_prefixes = ["mem:", "memorize:", "memoreaza:", "rezolvare:"]
-        for p in mem_prefixes:
-            if lower.startswith(p):
-                content_to_store = message_trim[len(p):].strip()
-                if content_to_store:
-                    nowk = datetime.now(timezone.utc).isoformat()
-                    knowledge_id = str(uuid.uuid4())
-                    doc = {
-                        "knowledge_id": knowledge_id,
-                        "tenant_id": current_user.get("tenant_id"),
-                        "user_id": current_user["user_id"],
-                        "title": (content_to_store[:60] + ("..." if len(content_to_store) > 60 else "")),
-                        "content": content_to_store,
-                        "tags": [],
-                        "created_at": nowk,
-                        "updated_at": nowk,
-                    }
-                    await db.ai_knowledge.insert_one(doc)
-                    memorized_flag = True
-                break
-
-        # Construiește conversația cu context + injectează cunoștințele memorate (scurt)
-        conversation_context = system_prompt + "\n\n"
-        # Adaugă ultimele cunoștințe (max 5) pentru tenant
-        try:
-            kitems = await db.ai_knowledge.find({"tenant_id": current_user.get("tenant_id")}, {"_id": 0}).sort("updated_at", -1).limit(5).to_list(5)
-            if kitems:
-                conversation_context += "CUNOȘTINȚE MEMORIZATE (rezumate):\n"
-                for ki in kitems:
-                    conversation_context += f"- {ki.get('title','').strip()}\n"
-                conversation_context += "\n"
-        except Exception:
-            pass
-        
-        # Adaugă istoricul conversației dacă există
-        if request.conversation_history:
-            for msg in request.conversation_history[-5:]:  # Ultimele 5 mesaje pentru context
-                if msg.get('type') == 'user':
-                    conversation_context += f"Utilizator: {msg.get('content', '')}\n"
-                elif msg.get('type') == 'ai':
-                    conversation_context += f"AI: {msg.get('content', '')}\n"
-        
-        # Adaugă mesajul curent
-        conversation_context += f"Utilizator: {request.message}\nAI:"
-        
-        # Generate response based on provider
-        if provider == "google_gemini":
-            response = model.generate_content(conversation_context)
-            response_text = response.text
-        elif provider == "openai":
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": conversation_context.split("Utilizator:")[0]},
-                    {"role": "user", "content": request.message}
-                ],
-                max_tokens=2000,
-                temperature=0.7
-            )
-            response_text = response.choices[0].message.content
-        elif provider == "anthropic":
-            response = client.messages.create(
-                model=model_name,
-                max_tokens=2000,
-                messages=[
-                    {"role": "user", "content": conversation_context}
-                ]
-            )
-            response_text = response.content[0].text
-        elif provider == "azure_openai":
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": conversation_context.split("Utilizator:")[0]},
-                    {"role": "user", "content": request.message}
-                ],
-                max_tokens=2000,
-                temperature=0.7
-            )
-            response_text = response.choices[0].message.content
-        elif provider == "custom_llm":
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": conversation_context.split("Utilizator:")[0]},
-                    {"role": "user", "content": request.message}
-                ],
-                max_tokens=2000,
-                temperature=0.7
-            )
-            response_text = response.choices[0].message.content
+        memorized_flag = await capture_chat_memory(request.message, current_user)
+
+        system_context, transcript = await build_chat_prompt(system_prompt, request, current_user.get("tenant_id"))
+        
+        # Generate response: static prompt + knowledge as system, transcript as the user turn
+        response_text = await ai_complete(
+            ai,
+            transcript,
+            system=system_context,
+            max_tokens=2000,
+            temperature=0.7,
+            usage=ai_usage_context("chat", current_user, conversation_id)
+        )
 
         # Persist messages
         user_msg = {
@@ -2187,77 +4135,6 @@ async def ai_chat(request: ChatRequest, current_user: dict = Depends(get_current
         ])
         await db.ai_conversations.update_one({"conversation_id": conversation_id}, {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}})
         
-        # Track AI usage statistics
-        usage_end_time = datetime.now(timezone.utc)
-        usage_duration = (usage_end_time - usage_start_time).total_seconds()
-        
-        # Estimate tokens and cost based on provider
-        input_tokens = len(request.message.split()) * 1.3  # Rough estimation
-        output_tokens = len(response_text.split()) * 1.3
-        total_tokens = input_tokens + output_tokens
-        
-        # Calculate costs based on provider pricing (as of 2024)
-        if provider == "google_gemini":
-            # Gemini pricing: $0.000075 per 1K input tokens, $0.0003 per 1K output tokens
-            input_cost = (input_tokens / 1000) * 0.000075
-            output_cost = (output_tokens / 1000) * 0.0003
-        elif provider == "openai":
-            # OpenAI pricing varies by model
-            if "gpt-4o" in model_name:
-                input_cost = (input_tokens / 1000) * 0.005  # $5 per 1M tokens
-                output_cost = (output_tokens / 1000) * 0.015  # $15 per 1M tokens
-            elif "gpt-4" in model_name:
-                input_cost = (input_tokens / 1000) * 0.03  # $30 per 1M tokens
-                output_cost = (output_tokens / 1000) * 0.06  # $60 per 1M tokens
-            else:  # GPT-3.5
-                input_cost = (input_tokens / 1000) * 0.0015  # $1.5 per 1M tokens
-                output_cost = (output_tokens / 1000) * 0.002  # $2 per 1M tokens
-        elif provider == "anthropic":
-            # Claude pricing
-            if "claude-3-5-sonnet" in model_name:
-                input_cost = (input_tokens / 1000) * 0.003  # $3 per 1M tokens
-                output_cost = (output_tokens / 1000) * 0.015  # $15 per 1M tokens
-            else:  # Claude 3 Opus
-                input_cost = (input_tokens / 1000) * 0.015  # $15 per 1M tokens
-                output_cost = (output_tokens / 1000) * 0.075  # $75 per 1M tokens
-        elif provider == "azure_openai":
-            # Azure OpenAI pricing (similar to OpenAI but may vary)
-            if "gpt-4o" in model_name:
-                input_cost = (input_tokens / 1000) * 0.005
-                output_cost = (output_tokens / 1000) * 0.015
-            else:
-                input_cost = (input_tokens / 1000) * 0.03
-                output_cost = (output_tokens / 1000) * 0.06
-        elif provider == "custom_llm":
-            # Custom LLM pricing from configuration
-            custom_input_cost = ai_global_config.get("custom_input_cost", 0)
-            custom_output_cost = ai_global_config.get("custom_output_cost", 0)
-            input_cost = (input_tokens / 1000) * custom_input_cost
-            output_cost = (output_tokens / 1000) * custom_output_cost
-        
-        total_cost = input_cost + output_cost
-        
-        # Save usage statistics
-        usage_record = {
-            "usage_id": usage_id,
-            "tenant_id": current_user.get("tenant_id"),
-            "user_id": current_user["user_id"],
-            "conversation_id": conversation_id,
-            "input_tokens": int(input_tokens),
-            "output_tokens": int(output_tokens),
-            "total_tokens": int(total_tokens),
-            "input_cost": round(input_cost, 6),
-            "output_cost": round(output_cost, 6),
-            "total_cost": round(total_cost, 6),
-            "duration_seconds": round(usage_duration, 2),
-            "model": model_name,
-            "provider": provider,
-            "timestamp": usage_start_time.isoformat(),
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        
-        await db["ai_usage_stats"].insert_one(usage_record)
-        
         return ChatResponse(
             response=response_text,
             timestamp=datetime.now(timezone.utc).isoformat(),
@@ -2265,6 +4142,121 @@ async def ai_chat(request: ChatRequest, current_user: dict = Depends(get_current
             memorized=memorized_flag
         )
 
+# Streaming chat: the provider stream runs in its own task that persists the
+# answer (checkpointed every AI_STREAM_CHECKPOINT_CHARS characters or
+# AI_STREAM_CHECKPOINT_SECONDS) and keeps going if the client disconnects.
+# The SSE response only relays what that task produces.
+
+AI_STREAM_CHECKPOINT_CHARS = int(os.environ.get('AI_STREAM_CHECKPOINT_CHARS', 400))
+AI_STREAM_CHECKPOINT_SECONDS = float(os.environ.get('AI_STREAM_CHECKPOINT_SECONDS', 2.0))
+# Saved (and shown by the client) when the stream fails before any text arrives
+AI_STREAM_FALLBACK_TEXT = "Îmi pare rău, nu am putut procesa cererea ta."
+_ai_stream_tasks = set()
+
+def sse_event(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def run_chat_stream(ai: dict, system: str, transcript: str, conversation_id: str, message_id: str, events: asyncio.Queue, usage: dict):
+    started = time.monotonic()
+    first_token_at = None
+    parts = []
+    unsaved = 0
+    last_checkpoint = started
+    status = "completed"
+    
+    try:
+        async for delta in ai_stream(ai, transcript, system=system, max_tokens=2000, temperature=0.7, usage=usage):
+            if not delta:
+                continue
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+            parts.append(delta)
+            events.put_nowait(("delta", delta))
+            
+            unsaved += len(delta)
+            if unsaved >= AI_STREAM_CHECKPOINT_CHARS or time.monotonic() - last_checkpoint >= AI_STREAM_CHECKPOINT_SECONDS:
+                await db.ai_messages.update_one({"message_id": message_id}, {"$set": {"content": "".join(parts)}})
+                unsaved = 0
+                last_checkpoint = time.monotonic()
+    except Exception as e:
+        print(f"Error streaming from AI provider: {e}")
+        status = "failed"
+        events.put_nowait(("error", str(e)))
+    
+    finished = time.monotonic()
+    done = {
+        "conversation_id": conversation_id,
+        "message_id": message_id,
+        "status": status,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "ttft_ms": round((first_token_at - started) * 1000) if first_token_at else None,
+        "duration_ms": round((finished - started) * 1000)
+    }
+    try:
+        update = {"content": "".join(parts) or (AI_STREAM_FALLBACK_TEXT if status == "failed" else ""), "status": status, "timestamp": done["timestamp"], "duration_ms": done["duration_ms"],
+                  "provider": ai["provider"], "model": ai["model"]}
+        if done["ttft_ms"] is not None:
+            update["ttft_ms"] = done["ttft_ms"]
+        await db.ai_messages.update_one({"message_id": message_id}, {"$set": update})
+        await db.ai_conversations.update_one({"conversation_id": conversation_id}, {"$set": {"updated_at": done["timestamp"]}})
+    except Exception as e:
+        print(f"Error saving streamed AI message: {e}")
+    events.put_nowait(("done", done))
+
+@api_router.post("/ai/chat/stream")
+async def ai_chat_stream(request: ChatRequest, current_user: dict = Depends(get_current_user)):
+    """
+    Streaming variant of /ai/chat (Server-Sent Events): one `meta` event,
+    `data: {"delta": ...}` chunks, then `done` (preceded by `error` on failure).
+    """
+    if current_user["user_type"] not in ["admin", "tenant_owner", "employee"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    chat = await open_ai_chat(request, current_user)
+    conversation_id = chat["conversation_id"]
+    
+    # Configuration errors are returned as plain HTTP errors, before streaming starts
+    ai = await get_ai_client()
+    
+    system_prompt = get_chat_system_prompt(current_user.get("tenant_id"), chat["ai_config"], ai)
+    memorized_flag = await capture_chat_memory(request.message, current_user)
+    system_context, transcript = await build_chat_prompt(system_prompt, request, current_user.get("tenant_id"))
+    
+    # Persist the question and an empty answer that the stream fills in
+    message_id = str(uuid.uuid4())
+    await db.ai_messages.insert_many([
+        {"conversation_id": conversation_id, "type": "user", "content": request.message, "timestamp": chat["now_iso"]},
+        {"conversation_id": conversation_id, "message_id": message_id, "type": "ai", "content": "", "status": "streaming",
+         "timestamp": datetime.now(timezone.utc).isoformat()},
+    ])
+    
+    events = asyncio.Queue()
+    task = asyncio.create_task(run_chat_stream(
+        ai, system_context, transcript, conversation_id, message_id, events,
+        ai_usage_context("chat_stream", current_user, conversation_id)
+    ))
+    _ai_stream_tasks.add(task)
+    task.add_done_callback(_ai_stream_tasks.discard)
+    
+    async def event_source():
+        yield sse_event({"conversation_id": conversation_id, "message_id": message_id, "memorized": memorized_flag}, "meta")
+        while True:
+            kind, payload = await events.get()
+            if kind == "delta":
+                yield sse_event({"delta": payload})
+            elif kind == "error":
+                yield sse_event({"detail": payload}, "error")
+            else:
+                yield sse_event(payload, "done")
+                break
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ============ ROLES & PERMISSIONS ENDPOINTS ============
 
 @api_router.get("/tenant/roles", response_model=List[RoleResponse])
@@ -2277,7 +4269,7 @@ async def get_roles(current_user: dict = Depends(get_current_user)):
     if not tenant_id:
         return []
     
-    tenant = await db.tenants.find_one({"tenant_id": tenant_id})
+    tenant = await db.tenants.find_one({"tenant_id": tenant_id}, {"_id": 0, "roles": 1})
     custom_roles = tenant.get("roles", []) if tenant else []
     
     # Count users for each role
@@ -2337,7 +4329,7 @@ async def create_role(role: RoleCreate, current_user: dict = Depends(get_current
             raise HTTPException(status_code=400, detail=f"Invalid permission: {perm}")
     
     # Check if role_id already exists
-    tenant = await db.tenants.find_one({"tenant_id": tenant_id})
+    tenant = await db.tenants.find_one({"tenant_id": tenant_id}, {"_id": 0, "roles": 1})
     if tenant and "roles" in tenant:
         for existing_role in tenant["roles"]:
             if existing_role["role_id"] == role.role_id:
@@ -2361,6 +4353,8 @@ async def create_role(role: RoleCreate, current_user: dict = Depends(get_current
         {"tenant_id": tenant_id},
         {"$push": {"roles": new_role}}
     )
+    invalidate_tenant(tenant_id)
+    invalidate_role_table(tenant_id)
     
     return RoleResponse(
         role_id=new_role["role_id"],
@@ -2416,6 +4410,9 @@ async def update_role(role_id: str, role_update: RoleUpdate, current_user: dict
         {"tenant_id": tenant_id, "roles.role_id": role_id},
         {"$set": update_fields}
     )
+    invalidate_tenant(tenant_id)
+    
+    invalidate_role_table(tenant_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Role not found")
@@ -2450,6 +4447,9 @@ async def delete_role(role_id: str, current_user: dict = Depends(get_current_use
         {"tenant_id": tenant_id},
         {"$pull": {"roles": {"role_id": role_id}}}
     )
+    invalidate_tenant(tenant_id)
+    
+    invalidate_role_table(tenant_id)
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Role not found")
@@ -2538,7 +4538,7 @@ async def get_ai_config(current_user: dict = Depends(get_current_user)):
         }
     
     # Fetch AI config from tenant collection
-    tenant = await db.tenants.find_one({"tenant_id": tenant_id})
+    tenant = await get_tenant(tenant_id, "ai")
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant not found")
     
@@ -2573,6 +4573,8 @@ async def update_ai_config(config: AIConfigUpdate, current_user: dict = Depends(
         {"tenant_id": tenant_id},
         {"$set": {"ai_config": config.dict(), "updated_at": datetime.now(timezone.utc).isoformat()}}
     )
+    invalidate_tenant(tenant_id)
+    invalidate_chat_prompt(tenant_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Tenant not found")
@@ -2596,6 +4598,7 @@ async def create_knowledge(data: KnowledgeCreate, current_user: dict = Depends(g
         "updated_at": now,
     }
     await db.ai_knowledge.insert_one(doc)
+    index_knowledge(doc)
     return KnowledgeItem(
         knowledge_id=knowledge_id,
         title=doc["title"],
@@ -2648,7 +4651,7 @@ async def generate_reception_pdf(ticket_id: str, current_user: dict = Depends(ge
         raise HTTPException(status_code=404, detail="Ticket not found")
     
     # Get tenant/company info
-    tenant = await db.tenants.find_one({"tenant_id": tenant_id})
+    tenant = await get_tenant(tenant_id, "company")
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant not found")
     
@@ -2720,7 +4723,7 @@ async def generate_delivery_pdf(ticket_id: str, current_user: dict = Depends(get
         raise HTTPException(status_code=404, detail="Ticket not found")
     
     # Get tenant/company info
-    tenant = await db.tenants.find_one({"tenant_id": tenant_id})
+    tenant = await get_tenant(tenant_id, "company")
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant not found")
     
@@ -2789,7 +4792,7 @@ async def generate_warranty_pdf(ticket_id: str, current_user: dict = Depends(get
         raise HTTPException(status_code=404, detail="Ticket not found")
     
     # Get tenant/company info
-    tenant = await db.tenants.find_one({"tenant_id": tenant_id})
+    tenant = await get_tenant(tenant_id, "company")
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant not found")
     
@@ -2847,7 +4850,7 @@ async def get_subscription_status(current_user: dict = Depends(get_current_user)
     if not tenant_id:
         raise HTTPException(status_code=400, detail="Tenant ID not found")
     
-    tenant = await db["tenants"].find_one({"tenant_id": tenant_id})
+    tenant = await get_tenant(tenant_id, "plan")
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant not found")
     
@@ -2909,13 +4912,13 @@ async def admin_create_employee(
         raise HTTPException(status_code=400, detail="Tenant ID required")
     
     # Get tenant to verify it exists
-    tenant = await db["tenants"].find_one({"tenant_id": tenant_id})
+    tenant = await get_tenant(tenant_id, "plan")
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant not found")
     
     # Check if email already exists
     existing = await db["users"].find_one({"email": data.get("email")})
-    if existing:
+    if existing or await email_taken(data.get("email")):
         raise HTTPException(status_code=400, detail="Email already exists")
     
     # Get location_id from request or use first location
@@ -2936,7 +4939,7 @@ async def admin_create_employee(
             raise HTTPException(status_code=400, detail="Invalid location for this tenant")
     
     user_id = str(uuid.uuid4())
-    hashed_pw = hash_password(data.get("password"))
+    hashed_pw = await hash_password_async(data.get("password"))
     
     employee_doc = {
         "user_id": user_id,
@@ -2951,6 +4954,7 @@ async def admin_create_employee(
     }
     
     await db["users"].insert_one(employee_doc)
+    await upsert_credential(data.get("email"), "employee", user_id, tenant_id)
     
     return {
         "message": "Employee created successfully",
@@ -3029,6 +5033,8 @@ async def delete_employee(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Employee not found")
     
+    await db["credentials"].delete_one({"principal_type": "employee", "principal_id": user_id})
+    
     return {"message": "Employee deleted successfully"}
 
 @api_router.post("/admin/send-payment-notification")
@@ -3049,6 +5055,7 @@ async def send_payment_notification(
         {"tenant_id": tenant_id},
         {"$set": {"has_payment_notification": True}}
     )
+    invalidate_tenant(tenant_id)
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Tenant not found")
@@ -3072,6 +5079,7 @@ async def dismiss_payment_notification(
         {"tenant_id": tenant_id},
         {"$set": {"has_payment_notification": False}}
     )
+    invalidate_tenant(tenant_id)
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Tenant not found")
@@ -3109,6 +5117,7 @@ async def update_subscription_end_date(
         {"tenant_id": tenant_id},
         {"$set": {"subscription_end_date": end_date}}
     )
+    invalidate_tenant(tenant_id)
     
     print(f"DEBUG: Update result - modified_count: {result.modified_count}, matched_count: {result.matched_count}")
     
@@ -3161,79 +5170,119 @@ async def tenant_dismiss_payment_alert(current_user: dict = Depends(get_current_
         {"tenant_id": tenant_id},
         {"$set": {"has_payment_notification": False}}
     )
+    invalidate_tenant(tenant_id)
     
     return {"message": "Alert dismissed"}
 
 # ================== ADMIN ENDPOINTS - EXTENDED ==================
 
+# Recent activity is served from a per-process ring buffer fed by create_log.
+# The first request after boot fills it from the logs index; every
+# RECENT_ACTIVITY_MERGE_SECONDS it also pulls activity written by other
+# workers since the last merge (0 = serve this process's buffer only).
+# Other workers' entries reach the logs collection whenever their writer
+# flushes, possibly well after their timestamp (queue backlog), so each merge
+# re-reads RECENT_ACTIVITY_MERGE_OVERLAP_SECONDS before the newest entry seen;
+# entries already in the buffer are skipped by log_id.
+
+RECENT_ACTIVITY_SIZE = 50
+RECENT_ACTIVITY_MERGE_SECONDS = float(os.environ.get('RECENT_ACTIVITY_MERGE_SECONDS', 10))
+RECENT_ACTIVITY_MERGE_OVERLAP_SECONDS = float(os.environ.get('RECENT_ACTIVITY_MERGE_OVERLAP_SECONDS', 300))
+_recent_activity = deque(maxlen=RECENT_ACTIVITY_SIZE)
+_recent_activity_state = {"warm": False, "merged_at": 0.0, "watermark": 0.0}
+
+ACTIVITY_TYPES = {
+    "auth": ("login", "cyan"),
+    "user_action": ("ticket", "green"),
+    "payment": ("payment", "purple"),
+    "settings": ("settings", "blue"),
+}
+
+def activity_from_log(log: dict) -> dict:
+    category = log.get("category") or ""
+    level = log.get("level") or "info"
+    activity_type, icon_color = ACTIVITY_TYPES.get(category, ("system", "slate"))
+    if category == "auth" and level != "info":
+        icon_color = "amber"
+    return {
+        "log_id": log.get("log_id"),
+        "type": activity_type,
+        "category": category,
+        "level": level,
+        "message": log.get("message") or "Unknown activity",
+        "user_email": log.get("user_email") or "System",
+        "timestamp": log.get("created_at"),
+        "epoch": log.get("timestamp") or 0.0,
+        "icon_color": icon_color
+    }
+
+def remember_activity(activity: dict):
+    """Push an activity created by this process (always the newest) onto the ring buffer"""
+    _recent_activity.appendleft(activity)
+
+def merge_activity(activities: list):
+    """Merge activities read back from the logs into the buffer (dedupe by log_id, newest first)"""
+    known = {item["log_id"] for item in _recent_activity}
+    fresh = sorted((item for item in activities if item["log_id"] not in known), key=lambda item: item["epoch"], reverse=True)
+    if not fresh:
+        return
+    merged = heapq.merge(list(_recent_activity), fresh, key=lambda item: item["epoch"], reverse=True)
+    _recent_activity.clear()
+    _recent_activity.extend(itertools.islice(merged, RECENT_ACTIVITY_SIZE))
+
+def format_time_ago(seconds: float) -> str:
+    if seconds < 60:
+        return "Acum câteva secunde"
+    if seconds < 3600:
+        minutes = int(seconds / 60)
+        return f"Acum {minutes} {'minut' if minutes == 1 else 'minute'}"
+    if seconds < 86400:
+        hours = int(seconds / 3600)
+        return f"Acum {hours} {'oră' if hours == 1 else 'ore'}"
+    days = int(seconds / 86400)
+    return f"Acum {days} {'zi' if days == 1 else 'zile'}"
+
+async def sync_recent_activity():
+    """Fill the buffer on cold start, then merge other workers' activity"""
+    state = _recent_activity_state
+    if state["warm"] and (RECENT_ACTIVITY_MERGE_SECONDS <= 0 or time.monotonic() - state["merged_at"] < RECENT_ACTIVITY_MERGE_SECONDS):
+        return
+    
+    query = {"log_type": "activity"}
+    if state["warm"]:
+        query["timestamp"] = {"$gt": state["watermark"] - RECENT_ACTIVITY_MERGE_OVERLAP_SECONDS}
+    
+    # Served by the type_timestamp_log index
+    logs = await db["logs"].find(
+        query, {"_id": 0, "log_id": 1, "category": 1, "level": 1, "message": 1, "user_email": 1, "created_at": 1, "timestamp": 1}
+    ).sort([("timestamp", DESCENDING), ("log_id", DESCENDING)]).limit(RECENT_ACTIVITY_SIZE).to_list(RECENT_ACTIVITY_SIZE)
+    
+    merge_activity([activity_from_log(log) for log in logs])
+    if logs:
+        state["watermark"] = max(state["watermark"], logs[0].get("timestamp") or 0.0)
+    state["warm"] = True
+    state["merged_at"] = time.monotonic()
+
 @api_router.get("/admin/recent-activity")
 async def get_recent_activity(current_user: dict = Depends(get_current_user)):
-    """Get recent activity across the platform from logs (admin only)"""
+    """Get recent activity across the platform (admin only)"""
     if current_user.get("user_type") != "admin":
         raise HTTPException(status_code=403, detail="Access denied")
     
-    from datetime import datetime, timedelta
-    
-    # Get recent logs (last 24 hours, all activity types)
-    recent_logs = await db["logs"].find({
-        "log_type": "activity"
-    }).sort("created_at", -1).limit(15).to_list(length=15)
-    
-    activities = []
-    
-    for log in recent_logs:
-        try:
-            created_at = datetime.fromisoformat(log.get("created_at", "").replace('Z', '+00:00'))
-            time_ago = datetime.now(timezone.utc) - created_at
-            
-            # Format time ago
-            if time_ago.total_seconds() < 60:
-                time_str = "Acum câteva secunde"
-            elif time_ago.total_seconds() < 3600:
-                minutes = int(time_ago.total_seconds() / 60)
-                time_str = f"Acum {minutes} {'minut' if minutes == 1 else 'minute'}"
-            elif time_ago.total_seconds() < 86400:
-                hours = int(time_ago.total_seconds() / 3600)
-                time_str = f"Acum {hours} {'oră' if hours == 1 else 'ore'}"
-            else:
-                days = int(time_ago.total_seconds() / 86400)
-                time_str = f"Acum {days} {'zi' if days == 1 else 'zile'}"
-            
-            # Determine activity type and icon based on category and level
-            category = log.get("category", "")
-            level = log.get("level", "info")
-            
-            if category == "auth":
-                activity_type = "login"
-                icon_color = "cyan" if level == "info" else "amber"
-            elif category == "user_action":
-                activity_type = "ticket"
-                icon_color = "green"
-            elif category == "payment":
-                activity_type = "payment"
-                icon_color = "purple"
-            elif category == "settings":
-                activity_type = "settings"
-                icon_color = "blue"
-            else:
-                activity_type = "system"
-                icon_color = "slate"
-            
-            activities.append({
-                "type": activity_type,
-                "category": category,
-                "level": level,
-                "message": log.get("message", "Unknown activity"),
-                "user_email": log.get("user_email", "System"),
-                "time_ago": time_str,
-                "timestamp": log.get("created_at"),
-                "icon_color": icon_color
-            })
-        except Exception as e:
-            print(f"Error processing log: {e}")
-            pass
+    try:
+        await sync_recent_activity()
+    except Exception as e:
+        # Serve whatever this process has seen
+        print(f"Error syncing recent activity: {e}")
     
-    return activities[:10]  # Return top 10 most recent
+    now = datetime.now(timezone.utc).timestamp()
+    return [
+        {
+            **{key: value for key, value in item.items() if key not in ("log_id", "epoch")},
+            "time_ago": format_time_ago(now - item["epoch"])
+        }
+        for item in list(_recent_activity)[:10]
+    ]
 
 @api_router.get("/admin/tenants")
 async def get_all_tenants(current_user: dict = Depends(get_current_user)):
@@ -3267,17 +5316,23 @@ async def reset_tenant_password(
         raise HTTPException(status_code=400, detail="Missing tenant_id or new_password")
     
     # Hash new password
-    hashed_password = pwd_context.hash(new_password)
+    hashed_password = await hash_password_async(new_password)
     
-    # Update tenant password
+    # Update tenant password (login verifies password_hash)
     result = await db["tenants"].update_one(
         {"tenant_id": tenant_id},
-        {"$set": {"password": hashed_password}}
+        {"$set": {"password_hash": hashed_password}}
     )
+    invalidate_tenant(tenant_id)
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Tenant not found")
     
+    # Re-point the login email in case the index entry is missing or stale
+    tenant = await db["tenants"].find_one({"tenant_id": tenant_id}, {"_id": 0, "email": 1})
+    if tenant and tenant.get("email"):
+        await upsert_credential(tenant["email"], "tenant_owner", tenant_id, tenant_id)
+    
     return {"message": "Password reset successfully"}
 
 @api_router.post("/admin/toggle-tenant-status")
@@ -3310,6 +5365,7 @@ async def toggle_tenant_status(
         {"tenant_id": tenant_id},
         {"$set": {"subscription_status": new_status}}
     )
+    invalidate_tenant(tenant_id)
     
     print(f"DEBUG toggle-tenant-status: Update result - modified_count: {result.modified_count}, matched_count: {result.matched_count}")
     
@@ -3368,6 +5424,7 @@ async def extend_grace_period(
             }
         }
     )
+    invalidate_tenant(tenant_id)
     
     print(f"DEBUG extend-grace-period: Update result - modified_count: {result.modified_count}")
     
@@ -3423,6 +5480,7 @@ async def reset_subscription_after_payment(
             }
         }
     )
+    invalidate_tenant(tenant_id)
     
     print(f"DEBUG reset-subscription: Update result - modified_count: {result.modified_count}")
     
@@ -3534,6 +5592,7 @@ async def process_payment(
             }
         }
     )
+    invalidate_tenant(tenant_id)
     
     print(f"DEBUG process-payment: Tenant updated - modified_count: {result.modified_count}")
     
@@ -3795,7 +5854,10 @@ async def get_server_info(current_user: dict = Depends(get_current_user)):
             "seconds": seconds,
             "total_seconds": int(uptime_delta.total_seconds())
         },
-        "uptime_formatted": f"{days} days, {hours} hours, {minutes} minutes"
+        "uptime_formatted": f"{days} days, {hours} hours, {minutes} minutes",
+        "password_pool": get_password_pool_stats(),
+        "log_writer": get_log_writer_stats(),
+        "ai_usage_writer": get_ai_usage_writer_stats()
     }
 
 @api_router.get("/admin/ai-config")
@@ -3863,6 +5925,7 @@ async def update_admin_ai_config(
         {"$set": ai_config_doc, "$setOnInsert": {"created_at": datetime.now(timezone.utc).isoformat()}},
         upsert=True
     )
+    invalidate_ai_clients()
     
     return {"message": "AI configuration updated successfully", "config": ai_config_doc}
 
@@ -3883,67 +5946,16 @@ async def ai_chat_with_context(
         raise HTTPException(status_code=400, detail="Message is required")
     
     # Get AI configuration
-    ai_global_config = await db["platform_settings"].find_one({"settings_id": "ai_config"})
-    if not ai_global_config:
-        raise HTTPException(status_code=500, detail="AI configuration not found")
-    
-    provider = ai_global_config.get("provider", "google_gemini")
-    api_key = ai_global_config.get("api_key")
-    model_name = ai_global_config.get("model", "gemini-2.5-flash")
-    
-    if not api_key:
-        raise HTTPException(status_code=500, detail=f"{provider.title()} API key not configured")
+    ai = await get_ai_client()
     
     try:
         # Build context-specific system prompt
         system_prompt = build_context_system_prompt(context_type, context_data)
         
-        # Initialize AI provider
-        if provider == "google_gemini":
-            import google.generativeai as genai
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(model_name)
-            
-            full_prompt = f"{system_prompt}\n\nUser: {message}\nAI:"
-            response = model.generate_content(full_prompt)
-            response_text = response.text
-            
-        elif provider in ["openai", "azure_openai", "custom_llm"]:
-            import openai
-            
-            if provider == "azure_openai":
-                base_url = ai_global_config.get("openai_base_url", "")
-                organization = ai_global_config.get("openai_organization", "")
-                client = openai.OpenAI(api_key=api_key, base_url=base_url, organization=organization)
-            elif provider == "custom_llm":
-                custom_endpoint = ai_global_config.get("custom_endpoint_url", "")
-                client = openai.OpenAI(api_key=api_key, base_url=custom_endpoint)
-            else:
-                client = openai.OpenAI(api_key=api_key)
-            
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": message}
-                ],
-                max_tokens=2000,
-                temperature=0.7
-            )
-            response_text = response.choices[0].message.content
-            
-        elif provider == "anthropic":
-            import anthropic
-            client = anthropic.Anthropic(api_key=api_key)
-            
-            response = client.messages.create(
-                model=model_name,
-                max_tokens=2000,
-                messages=[
-                    {"role": "user", "content": f"{system_prompt}\n\n{message}"}
-                ]
-            )
-            response_text = response.content[0].text
+        response_text = await ai_complete(
+            ai, message, system=system_prompt, max_tokens=2000, temperature=0.7,
+            usage=ai_usage_context("chat_with_context", current_user)
+        )
         
         # Parse structured data from response
         structured_data = parse_structured_response(response_text, context_type)
@@ -4114,6 +6126,114 @@ def parse_structured_response(response_text: str, context_type: str) -> dict:
         print(f"Error parsing structured response: {e}")
         return {}
 
+# ============ DIAGNOSTIC CACHE ============
+# generate_diagnostic answers are cached per (provider, model, canonical
+# device, normalized symptoms) in ai_diagnostic_cache (TTL on expire_at),
+# with a per-process LRU in front. Switching provider or model changes the
+# key, so old answers are simply never read again and expire.
+# Hits, misses and the estimated cost saved are counted per day in
+# ai_diagnostic_cache_stats for /admin/ai-statistics.
+
+DIAGNOSTIC_CACHE_TTL_DAYS = int(os.environ.get('DIAGNOSTIC_CACHE_TTL_DAYS', 30))
+DIAGNOSTIC_CACHE_LRU_SIZE = int(os.environ.get('DIAGNOSTIC_CACHE_LRU_SIZE', 500))
+DIAGNOSTIC_CACHE_LRU_SECONDS = 3600
+_diagnostic_lru = OrderedDict()  # cache_key -> (expires_at, diagnostic, cost)
+
+DEVICE_NOISE_WORDS = {"apple", "samsung", "galaxy", "xiaomi", "huawei", "telefon", "phone", "smartphone", "tableta"}
+# Only filler words are dropped. Negation, frequency, intensity and time
+# qualifiers are kept: "nu se incarca" / "se incarca", "se stinge uneori" /
+# "se stinge" and "nu mai merge" / "nu merge" are different symptoms.
+SYMPTOM_STOP_WORDS = {
+    "a", "ai", "al", "ale", "am", "are", "as", "au", "ca", "care", "ce", "cu", "cum", "da", "dar", "de", "din",
+    "e", "este", "i", "ii", "il", "in", "la", "le", "lui", "o", "ori", "pe", "pentru", "sa", "sau", "se", "si",
+    "sunt", "un", "una", "telefon", "telefonul", "aparat", "aparatul", "clientul", "client", "spune", "zice"
+}
+
+def canonical_device_model(device_model: str) -> str:
+    """'Apple iPhone12 Pro-Max' -> 'iphone 12 max pro'; '+' reads as 'plus' ('Note 10+' != 'Note 10')"""
+    text = re.sub(r"(?<=[a-z])(?=\d)|(?<=\d)(?=[a-z])", " ", fold_text(device_model).replace("+", " plus "))
+    words = [word for word in re.split(r"[^a-z0-9]+", text) if word and word not in DEVICE_NOISE_WORDS]
+    # Family/number first, then suffixes in a stable order ("pro max" == "max pro")
+    return " ".join(words[:2] + sorted(words[2:]))
+
+def normalize_symptoms(symptoms: str) -> str:
+    # Word order is kept: "nu" only means something next to the word it negates
+    words = [word for word in re.split(r"[^a-z0-9]+", fold_text(symptoms)) if word and word not in SYMPTOM_STOP_WORDS]
+    return " ".join(words)
+
+def diagnostic_cache_key(ai: dict, device_model: str, symptoms: str) -> str:
+    raw = "|".join([ai["provider"], ai["model"], canonical_device_model(device_model), normalize_symptoms(symptoms)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+async def record_diagnostic_cache_stat(hit: bool, saved_cost: float = 0.0):
+    day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    inc = {"hits": 1, "saved_cost": saved_cost} if hit else {"misses": 1}
+    try:
+        await db.ai_diagnostic_cache_stats.update_one({"day": day}, {"$inc": inc}, upsert=True)
+    except Exception as e:
+        print(f"Error updating diagnostic cache stats: {e}")
+
+async def get_cached_diagnostic(cache_key: str) -> Optional[dict]:
+    entry = _diagnostic_lru.get(cache_key)
+    if entry and entry[0] > time.monotonic():
+        _diagnostic_lru.move_to_end(cache_key)
+        await record_diagnostic_cache_stat(True, entry[2])
+        return copy.deepcopy(entry[1])
+    
+    doc = await db.ai_diagnostic_cache.find_one(
+        {"cache_key": cache_key, "expire_at": {"$gt": datetime.now(timezone.utc)}},
+        {"_id": 0, "diagnostic": 1, "cost": 1}
+    )
+    if not doc:
+        return None
+    remember_diagnostic(cache_key, doc["diagnostic"], doc.get("cost", 0.0))
+    await record_diagnostic_cache_stat(True, doc.get("cost", 0.0))
+    return doc["diagnostic"]
+
+def remember_diagnostic(cache_key: str, diagnostic: dict, cost: float):
+    _diagnostic_lru[cache_key] = (time.monotonic() + DIAGNOSTIC_CACHE_LRU_SECONDS, copy.deepcopy(diagnostic), cost)
+    _diagnostic_lru.move_to_end(cache_key)
+    while len(_diagnostic_lru) > DIAGNOSTIC_CACHE_LRU_SIZE:
+        _diagnostic_lru.popitem(last=False)
+
+async def store_diagnostic(cache_key: str, ai: dict, device_model: str, symptoms: str, diagnostic: dict, cost: float):
+    now = datetime.now(timezone.utc)
+    remember_diagnostic(cache_key, diagnostic, cost)
+    try:
+        await db.ai_diagnostic_cache.update_one(
+            {"cache_key": cache_key},
+            {"$set": {
+                "provider": ai["provider"],
+                "model": ai["model"],
+                "device_key": canonical_device_model(device_model),
+                "symptoms_key": normalize_symptoms(symptoms),
+                "diagnostic": diagnostic,
+                "cost": cost,
+                "created_at": now,
+                "expire_at": now + timedelta(days=DIAGNOSTIC_CACHE_TTL_DAYS)
+            }},
+            upsert=True
+        )
+    except Exception as e:
+        print(f"Error caching diagnostic: {e}")
+
+async def get_diagnostic_cache_stats(days: int = 30) -> dict:
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+    hits = misses = 0
+    saved_cost = 0.0
+    async for doc in db.ai_diagnostic_cache_stats.find({"day": {"$gte": since}}, {"_id": 0}):
+        hits += doc.get("hits", 0)
+        misses += doc.get("misses", 0)
+        saved_cost += doc.get("saved_cost", 0.0)
+    return {
+        "days": days,
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        "saved_cost": round(saved_cost, 4),
+        "entries": await db.ai_diagnostic_cache.estimated_document_count()
+    }
+
 @api_router.post("/ai/generate-diagnostic")
 async def generate_diagnostic(
     request: dict,
@@ -4130,17 +6250,20 @@ async def generate_diagnostic(
         raise HTTPException(status_code=400, detail="Symptoms and device_model are required")
     
     # Get AI configuration
-    ai_global_config = await db["platform_settings"].find_one({"settings_id": "ai_config"})
-    if not ai_global_config:
-        raise HTTPException(status_code=500, detail="AI configuration not found")
-    
-    provider = ai_global_config.get("provider", "google_gemini")
-    api_key = ai_global_config.get("api_key")
-    model_name = ai_global_config.get("model", "gemini-2.5-flash")
+    ai = await get_ai_client()
     
-    if not api_key:
-        raise HTTPException(status_code=500, detail=f"{provider.title()} API key not configured")
+    # Same device + symptoms on the same provider/model: reuse the stored diagnostic
+    cache_key = diagnostic_cache_key(ai, device_model, symptoms)
+    if not request.get("refresh"):
+        cached = await get_cached_diagnostic(cache_key)
+        if cached:
+            return {
+                "diagnostic": cached,
+                "cached": True,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
     
+    usage = ai_usage_context("generate_diagnostic", current_user)
     try:
         # Build diagnostic-specific prompt
         diagnostic_prompt = f"""Ești expert tehnic GSM specializat în diagnostic și reparații.
@@ -4170,57 +6293,26 @@ GUIDELINES:
 - Nivel dificultate: ușor/mediu/greu
 - Impact garanție: da/nu/parțial"""
 
-        # Initialize AI provider
-        if provider == "google_gemini":
-            import google.generativeai as genai
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(model_name)
-            
-            response = model.generate_content(diagnostic_prompt)
-            response_text = response.text
-            
-        elif provider in ["openai", "azure_openai", "custom_llm"]:
-            import openai
-            
-            if provider == "azure_openai":
-                base_url = ai_global_config.get("openai_base_url", "")
-                organization = ai_global_config.get("openai_organization", "")
-                client = openai.OpenAI(api_key=api_key, base_url=base_url, organization=organization)
-            elif provider == "custom_llm":
-                custom_endpoint = ai_global_config.get("custom_endpoint_url", "")
-                client = openai.OpenAI(api_key=api_key, base_url=custom_endpoint)
-            else:
-                client = openai.OpenAI(api_key=api_key)
-            
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": "Ești expert tehnic GSM. Răspunzi ÎNTOTDEAUNA în format JSON structurat."},
-                    {"role": "user", "content": diagnostic_prompt}
-                ],
-                max_tokens=2000,
-                temperature=0.3
-            )
-            response_text = response.choices[0].message.content
-            
-        elif provider == "anthropic":
-            import anthropic
-            client = anthropic.Anthropic(api_key=api_key)
-            
-            response = client.messages.create(
-                model=model_name,
-                max_tokens=2000,
-                messages=[
-                    {"role": "user", "content": diagnostic_prompt}
-                ]
-            )
-            response_text = response.content[0].text
+        response_text = await ai_complete(
+            ai,
+            diagnostic_prompt,
+            system="Ești expert tehnic GSM. Răspunzi ÎNTOTDEAUNA în format JSON structurat.",
+            max_tokens=2000,
+            temperature=0.3,
+            usage=usage
+        )
         
         # Parse structured diagnostic data
         diagnostic_data = parse_diagnostic_response(response_text)
         
+        # Only cache answers that parsed into a real diagnostic
+        await record_diagnostic_cache_stat(False)
+        if diagnostic_data.get("reported_issue") and diagnostic_data.get("reported_issue") != "Diagnostic generat automat":
+            await store_diagnostic(cache_key, ai, device_model, symptoms, diagnostic_data, usage["total_cost"])
+        
         return {
             "diagnostic": diagnostic_data,
+            "cached": False,
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
         
@@ -4319,69 +6411,20 @@ async def generate_client_message(
             raise HTTPException(status_code=400, detail="Message type is required")
         
         # Get AI configuration
-        ai_global_config = await db["platform_settings"].find_one({"settings_id": "ai_config"})
-        if not ai_global_config:
-            raise HTTPException(status_code=500, detail="AI configuration not found")
-        
-        provider = ai_global_config.get("provider", "google_gemini")
-        api_key = ai_global_config.get("api_key")
-        model_name = ai_global_config.get("model", "gemini-2.5-flash")
-        
-        if not api_key:
-            raise HTTPException(status_code=500, detail=f"{provider.title()} API key not configured")
+        ai = await get_ai_client()
         
         # Build message generation prompt
         message_prompt = build_message_prompt(message_type, ticket_data, custom_context)
         
         # Generate message using AI
-        if provider == "google_gemini":
-            import google.generativeai as genai
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(model_name)
-            
-            response = model.generate_content(message_prompt)
-            response_text = response.text
-            
-        elif provider in ["openai", "azure_openai", "custom_llm"]:
-            import openai
-            
-            if provider == "azure_openai":
-                base_url = ai_global_config.get("openai_base_url", "")
-                organization = ai_global_config.get("openai_organization", "")
-                client = openai.OpenAI(api_key=api_key, base_url=base_url, organization=organization)
-            elif provider == "custom_llm":
-                custom_endpoint = ai_global_config.get("custom_endpoint_url", "")
-                client = openai.OpenAI(api_key=api_key, base_url=custom_endpoint)
-            else:
-                client = openai.OpenAI(api_key=api_key)
-            
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": "Ești specialist în comunicare profesională pentru service GSM. Generează mesaje clare, profesionale și prietenoase pentru clienți."},
-                    {"role": "user", "content": message_prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.7
-            )
-            response_text = response.choices[0].message.content
-            
-        elif provider == "anthropic":
-            import anthropic
-            client = anthropic.Anthropic(api_key=api_key)
-            
-            response = client.messages.create(
-                model=model_name,
-                max_tokens=1000,
-                temperature=0.7,
-                messages=[
-                    {"role": "user", "content": message_prompt}
-                ]
-            )
-            response_text = response.content[0].text
-        
-        else:
-            raise HTTPException(status_code=500, detail=f"Unsupported AI provider: {provider}")
+        response_text = await ai_complete(
+            ai,
+            message_prompt,
+            system="Ești specialist în comunicare profesională pentru service GSM. Generează mesaje clare, profesionale și prietenoase pentru clienți.",
+            max_tokens=1000,
+            temperature=0.7,
+            usage=ai_usage_context("generate_message", current_user)
+        )
         
         # Clean and format response
         message_content = clean_message_response(response_text)
@@ -4525,16 +6568,7 @@ async def analyze_statistics_with_nl(
             raise HTTPException(status_code=400, detail="Query is required")
         
         # Get AI configuration
-        ai_global_config = await db["platform_settings"].find_one({"settings_id": "ai_config"})
-        if not ai_global_config:
-            raise HTTPException(status_code=500, detail="AI configuration not found")
-        
-        provider = ai_global_config.get("provider", "google_gemini")
-        api_key = ai_global_config.get("api_key")
-        model_name = ai_global_config.get("model", "gemini-2.5-flash")
-        
-        if not api_key:
-            raise HTTPException(status_code=500, detail=f"{provider.title()} API key not configured")
+        ai = await get_ai_client()
         
         # Get relevant data for analysis
         analysis_data = await get_analysis_data(tenant_id)
@@ -4543,54 +6577,14 @@ async def analyze_statistics_with_nl(
         analysis_prompt = build_analysis_prompt(query, analysis_data)
         
         # Generate analysis using AI
-        if provider == "google_gemini":
-            import google.generativeai as genai
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(model_name)
-            
-            response = model.generate_content(analysis_prompt)
-            response_text = response.text
-            
-        elif provider in ["openai", "azure_openai", "custom_llm"]:
-            import openai
-            
-            if provider == "azure_openai":
-                base_url = ai_global_config.get("openai_base_url", "")
-                organization = ai_global_config.get("openai_organization", "")
-                client = openai.OpenAI(api_key=api_key, base_url=base_url, organization=organization)
-            elif provider == "custom_llm":
-                custom_endpoint = ai_global_config.get("custom_endpoint_url", "")
-                client = openai.OpenAI(api_key=api_key, base_url=custom_endpoint)
-            else:
-                client = openai.OpenAI(api_key=api_key)
-            
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": "Ești specialist în analiza datelor pentru service GSM. Analizezi statistici și oferi insights valoroase."},
-                    {"role": "user", "content": analysis_prompt}
-                ],
-                max_tokens=2000,
-                temperature=0.3
-            )
-            response_text = response.choices[0].message.content
-            
-        elif provider == "anthropic":
-            import anthropic
-            client = anthropic.Anthropic(api_key=api_key)
-            
-            response = client.messages.create(
-                model=model_name,
-                max_tokens=2000,
-                temperature=0.3,
-                messages=[
-                    {"role": "user", "content": analysis_prompt}
-                ]
-            )
-            response_text = response.content[0].text
-        
-        else:
-            raise HTTPException(status_code=500, detail=f"Unsupported AI provider: {provider}")
+        response_text = await ai_complete(
+            ai,
+            analysis_prompt,
+            system="Ești specialist în analiza datelor pentru service GSM. Analizezi statistici și oferi insights valoroase.",
+            max_tokens=2000,
+            temperature=0.3,
+            usage=ai_usage_context("analyze_statistics", current_user)
+        )
         
         # Parse and structure response
         analysis_result = parse_analysis_response(response_text, query)
@@ -4609,58 +6603,42 @@ async def analyze_statistics_with_nl(
 async def get_analysis_data(tenant_id):
     """Get relevant data for statistical analysis"""
     try:
-        # Get tickets data
-        tickets = await db["tickets"].find({"tenant_id": tenant_id}).to_list(length=None)
+        # Ticket aggregates come from the daily rollups
+        summary = merge_daily_stats(await load_daily_stats(tenant_id))
         
-        # Get clients data
-        clients = await db["clients"].find({"tenant_id": tenant_id}).to_list(length=None)
+        # Clients are materialized per tenant; only the count is needed
+        total_clients = await db["clients"].count_documents({"tenant_id": tenant_id})
         
         # Get AI usage data
-        ai_usage = await db["ai_usage"].find({"tenant_id": tenant_id}).to_list(length=None)
+        total_ai_calls = await db["ai_usage"].count_documents({"tenant_id": tenant_id})
+        ai_costs_row = await db["ai_usage"].aggregate([
+            {"$match": {"tenant_id": tenant_id}},
+            {"$group": {"_id": None, "total": {"$sum": {"$ifNull": ["$total_cost", 0]}}}}
+        ]).to_list(1)
+        ai_costs = ai_costs_row[0]["total"] if ai_costs_row else 0
         
         # Calculate basic statistics
-        total_tickets = len(tickets)
-        total_clients = len(clients)
-        
-        # Status breakdown
-        status_counts = {}
-        for ticket in tickets:
-            status = ticket.get("status", "Unknown")
-            status_counts[status] = status_counts.get(status, 0) + 1
-        
-        # Device model analysis
-        device_models = {}
-        for ticket in tickets:
-            model = ticket.get("device_model", "Unknown")
-            device_models[model] = device_models.get(model, 0) + 1
-        
-        # Cost analysis
-        total_revenue = sum(ticket.get("estimated_cost", 0) for ticket in tickets)
+        total_tickets = summary["tickets"]
+        total_revenue = summary["revenue"]
         avg_cost = total_revenue / total_tickets if total_tickets > 0 else 0
         
         # Time analysis
-        recent_tickets = [t for t in tickets if t.get("created_at")]
-        if recent_tickets:
-            recent_tickets.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-            latest_ticket = recent_tickets[0].get("created_at", "")
-        else:
-            latest_ticket = "N/A"
-        
-        # AI usage analysis
-        total_ai_calls = len(ai_usage)
-        ai_costs = sum(usage.get("total_cost", 0) for usage in ai_usage)
+        recent_tickets = await db["tickets"].find({"tenant_id": tenant_id}, {"_id": 0}).sort(
+            [("created_at", DESCENDING), ("ticket_id", DESCENDING)]
+        ).limit(10).to_list(10)
+        latest_ticket = recent_tickets[0].get("created_at", "N/A") if recent_tickets else "N/A"
         
         return {
             "total_tickets": total_tickets,
             "total_clients": total_clients,
             "total_revenue": total_revenue,
             "avg_cost": avg_cost,
-            "status_counts": status_counts,
-            "device_models": device_models,
+            "status_counts": summary["by_status"],
+            "device_models": summary["by_device"],
             "latest_ticket": latest_ticket,
             "total_ai_calls": total_ai_calls,
             "ai_costs": ai_costs,
-            "recent_tickets": recent_tickets[:10]  # Last 10 tickets
+            "recent_tickets": recent_tickets  # Last 10 tickets
         }
         
     except Exception as e:
@@ -4765,6 +6743,8 @@ def parse_analysis_response(response_text: str, query: str) -> dict:
         "formatted": True
     }
 
+AI_LATENCY_SAMPLE_LIMIT = 20000
+
 @api_router.get("/admin/ai-statistics")
 async def get_ai_statistics(current_user: dict = Depends(get_current_user)):
     """Get AI usage statistics (admin only)"""
@@ -4840,6 +6820,38 @@ async def get_ai_statistics(current_user: dict = Depends(get_current_user)):
     ]
     hourly_usage = await db["ai_usage_stats"].aggregate(hourly_usage_pipeline).to_list(24)
     
+    # Time to first token of streamed chat answers (last 24h)
+    ttft_ms = sorted([
+        doc["ttft_ms"] async for doc in db["ai_messages"].find(
+            {"ttft_ms": {"$exists": True}, "timestamp": {"$gte": yesterday.isoformat()}},
+            {"_id": 0, "ttft_ms": 1}
+        ).sort("timestamp", -1).limit(5000)
+    ])
+    
+    # Latency per provider/model of successful calls (last 24h)
+    latencies = {}
+    async for doc in db["ai_usage_stats"].find(
+        {"timestamp": {"$gte": yesterday.isoformat()}, "latency_ms": {"$exists": True}, "status": "completed"},
+        {"_id": 0, "provider": 1, "model": 1, "latency_ms": 1, "ttft_ms": 1}
+    ).sort("timestamp", -1).limit(AI_LATENCY_SAMPLE_LIMIT):
+        samples = latencies.setdefault((doc.get("provider"), doc.get("model")), {"latency": [], "ttft": []})
+        samples["latency"].append(doc["latency_ms"])
+        if doc.get("ttft_ms") is not None:
+            samples["ttft"].append(doc["ttft_ms"])
+    latency_by_model = []
+    for (provider, model_name), samples in latencies.items():
+        latency, ttft = sorted(samples["latency"]), sorted(samples["ttft"])
+        latency_by_model.append({
+            "provider": provider,
+            "model": model_name,
+            "calls": len(latency),
+            "latency_p50_ms": percentile(latency, 0.5),
+            "latency_p95_ms": percentile(latency, 0.95),
+            "ttft_p50_ms": percentile(ttft, 0.5),
+            "ttft_p95_ms": percentile(ttft, 0.95)
+        })
+    latency_by_model.sort(key=lambda row: row["calls"], reverse=True)
+    
     return {
         "last_24h": {
             "total_calls": total_calls_24h,
@@ -4851,7 +6863,14 @@ async def get_ai_statistics(current_user: dict = Depends(get_current_user)):
             "total_cost": round(total_cost_all, 4)
         },
         "tenant_usage": tenant_usage,
-        "hourly_usage": hourly_usage
+        "hourly_usage": hourly_usage,
+        "diagnostic_cache": await get_diagnostic_cache_stats(),
+        "streaming": {
+            "samples_24h": len(ttft_ms),
+            "ttft_p50_ms": percentile(ttft_ms, 0.5),
+            "ttft_p95_ms": percentile(ttft_ms, 0.95)
+        },
+        "latency_by_model": latency_by_model
     }
 
 @api_router.get("/admin/subscription-plans")
@@ -5554,6 +7573,170 @@ async def get_maintenance_status():
     }
 
 # ==================== LOGGING SYSTEM ====================
+# create_log only enqueues; a background writer drains the queue with
+# insert_many, flushing every LOG_BATCH_SIZE entries or LOG_FLUSH_INTERVAL_SECONDS.
+# When the queue is full LOG_QUEUE_POLICY decides: "drop_oldest" (default),
+# "drop_newest" or "block" (backpressure on the caller). Whatever is queued is
+# flushed on shutdown. Without a running writer (scripts, startup) create_log
+# writes directly.
+
+LOG_QUEUE_MAX = int(os.environ.get('LOG_QUEUE_MAX', 10000))
+LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', 200))
+LOG_FLUSH_INTERVAL_SECONDS = float(os.environ.get('LOG_FLUSH_INTERVAL_SECONDS', 1.0))
+LOG_QUEUE_POLICY = os.environ.get('LOG_QUEUE_POLICY', 'drop_oldest')
+_log_queue = asyncio.Queue(maxsize=LOG_QUEUE_MAX)
+_log_writer_task = None
+
+# Per-level retention. Each entry carries a BSON `expire_at` date and the
+# expire_at_ttl index deletes it in the background; unknown levels use "info".
+# Existing entries are migrated by migrate_log_retention.py.
+LOG_RETENTION_DAYS = {
+    "info": int(os.environ.get('LOG_RETENTION_INFO_DAYS', 30)),
+    "warning": int(os.environ.get('LOG_RETENTION_WARNING_DAYS', 90)),
+    "error": int(os.environ.get('LOG_RETENTION_ERROR_DAYS', 180)),
+    "critical": int(os.environ.get('LOG_RETENTION_CRITICAL_DAYS', 180)),
+}
+
+def log_expire_at(level: str, logged_at: datetime) -> datetime:
+    return logged_at + timedelta(days=LOG_RETENTION_DAYS.get(level, LOG_RETENTION_DAYS["info"]))
+
+# Hourly and daily counter buckets {bucket, start, counts: {level: {category: n}}}
+# kept in step with the log writer, so /admin/logs/stats never scans logs.
+# Hourly buckets back the sparklines; daily buckets live as long as the
+# longest retention so per-level totals line up with what the TTL keeps.
+LOG_COUNTER_HOURS = 24
+LOG_COUNTER_HOURLY_KEEP_DAYS = 7
+
+async def record_log_counters(entries: list):
+    buckets = {}
+    for entry in entries:
+        hour = entry["logged_at"].replace(minute=0, second=0, microsecond=0)
+        field = f"counts.{stats_key(entry.get('level'))}.{stats_key(entry.get('category'))}"
+        for bucket, start in (("hour", hour), ("day", hour.replace(hour=0))):
+            inc = buckets.setdefault((bucket, start), {})
+            inc[field] = inc.get(field, 0) + 1
+    
+    keep_days = {"hour": LOG_COUNTER_HOURLY_KEEP_DAYS, "day": max(LOG_RETENTION_DAYS.values()) + 1}
+    operations = [
+        UpdateOne(
+            {"bucket": bucket, "start": start},
+            {"$inc": inc, "$setOnInsert": {"expire_at": start + timedelta(days=keep_days[bucket])}},
+            upsert=True
+        )
+        for (bucket, start), inc in buckets.items()
+    ]
+    if operations:
+        try:
+            await db["log_counters"].bulk_write(operations, ordered=False)
+        except Exception as e:
+            print(f"Error updating log counters: {str(e)}")
+
+LOG_COUNTER_SPANS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+async def delete_logs_before(cutoff: datetime) -> int:
+    """Delete logs older than `cutoff` and keep log_counters in step: buckets
+    that end by the cutoff are dropped, and the hour/day buckets that straddle
+    it lose exactly the entries being deleted"""
+    hour = cutoff.replace(minute=0, second=0, microsecond=0)
+    straddling = {bucket: start for bucket, start in (("hour", hour), ("day", hour.replace(hour=0))) if start < cutoff}
+    
+    # Count before deleting; timestamp is indexed, created_at is an ISO string
+    decrements = {}
+    for bucket, start in straddling.items():
+        rows = await db["logs"].aggregate([
+            {"$match": {"timestamp": {"$gte": start.timestamp(), "$lt": cutoff.timestamp()}}},
+            {"$group": {"_id": {"level": "$level", "category": "$category"}, "count": {"$sum": 1}}}
+        ]).to_list(None)
+        inc = {}
+        for row in rows:
+            field = f"counts.{stats_key(row['_id'].get('level'))}.{stats_key(row['_id'].get('category'))}"
+            inc[field] = inc.get(field, 0) - row["count"]
+        if inc:
+            decrements[bucket] = inc
+    
+    result = await db["logs"].delete_many({"timestamp": {"$lt": cutoff.timestamp()}})
+    
+    try:
+        await db["log_counters"].delete_many({"$or": [
+            {"bucket": bucket, "start": {"$lte": cutoff - span}} for bucket, span in LOG_COUNTER_SPANS.items()
+        ]})
+        for bucket, inc in decrements.items():
+            await db["log_counters"].update_one({"bucket": bucket, "start": straddling[bucket]}, {"$inc": inc})
+    except Exception as e:
+        print(f"Error updating log counters: {str(e)}")
+    return result.deleted_count
+
+log_writer_stats = {"enqueued": 0, "flushed": 0, "dropped": 0, "failed": 0, "batches": 0}
+
+async def write_log_batch(batch: list):
+    if not batch:
+        return
+    try:
+        await db["logs"].insert_many(batch, ordered=False)
+        log_writer_stats["flushed"] += len(batch)
+        log_writer_stats["batches"] += 1
+    except Exception as e:
+        log_writer_stats["failed"] += len(batch)
+        print(f"Error writing log batch: {str(e)}")
+        return
+    await record_log_counters(batch)
+
+async def batch_writer_loop(queue: asyncio.Queue, batch_size: int, flush_interval: float, write_batch):
+    """Drain `queue` into write_batch, every batch_size items or flush_interval seconds"""
+    batch = []
+    try:
+        while True:
+            batch.append(await queue.get())
+            deadline = time.monotonic() + flush_interval
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            pending, batch = batch, []
+            await write_batch(pending)
+    except asyncio.CancelledError:
+        await write_batch(batch)
+        raise
+
+async def flush_batch_queue(queue: asyncio.Queue, batch_size: int, write_batch):
+    """Write everything still queued (used on shutdown)"""
+    while not queue.empty():
+        batch = []
+        while not queue.empty() and len(batch) < batch_size:
+            batch.append(queue.get_nowait())
+        await write_batch(batch)
+
+async def log_writer_loop():
+    await batch_writer_loop(_log_queue, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL_SECONDS, write_log_batch)
+
+async def flush_log_queue():
+    await flush_batch_queue(_log_queue, LOG_BATCH_SIZE, write_log_batch)
+
+async def enqueue_log(log_entry: dict):
+    if LOG_QUEUE_POLICY == "block":
+        await _log_queue.put(log_entry)
+    elif _log_queue.full() and LOG_QUEUE_POLICY == "drop_newest":
+        log_writer_stats["dropped"] += 1
+        return
+    else:
+        if _log_queue.full():
+            _log_queue.get_nowait()
+            log_writer_stats["dropped"] += 1
+        _log_queue.put_nowait(log_entry)
+    log_writer_stats["enqueued"] += 1
+
+def get_log_writer_stats() -> dict:
+    return {
+        **log_writer_stats,
+        "queued": _log_queue.qsize(),
+        "max_queue": LOG_QUEUE_MAX,
+        "policy": LOG_QUEUE_POLICY,
+        "running": _log_writer_task is not None and not _log_writer_task.done()
+    }
 
 async def create_log(
     log_type: str,  # "system" or "activity"
@@ -5568,6 +7751,7 @@ async def create_log(
     user_agent: str = None
 ):
     """Create a log entry in the database"""
+    now = datetime.now(timezone.utc)
     log_entry = {
         "log_id": str(uuid.uuid4()),
         "log_type": log_type,
@@ -5580,15 +7764,48 @@ async def create_log(
         "metadata": metadata or {},
         "ip_address": ip_address,
         "user_agent": user_agent,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "timestamp": datetime.now(timezone.utc).timestamp()
+        "created_at": now.isoformat(),
+        "timestamp": now.timestamp(),
+        "logged_at": now,
+        "expire_at": log_expire_at(level, now)
     }
     
+    if log_type == "activity":
+        remember_activity(activity_from_log(log_entry))
+    
+    if _log_writer_task is not None and not _log_writer_task.done():
+        await enqueue_log(log_entry)
+        return
+    
     try:
         await db["logs"].insert_one(log_entry)
     except Exception as e:
         # Don't fail the main operation if logging fails
         print(f"Error creating log: {str(e)}")
+        return
+    await record_log_counters([log_entry])
+
+LOGS_PAGE_SIZE = 100
+LOGS_MAX_PAGE_SIZE = 500
+LOG_COUNT_CACHE_SECONDS = int(os.environ.get('LOG_COUNT_CACHE_SECONDS', 60))
+_log_count_cache = {}  # filter key -> (expires_at, count)
+
+async def estimate_log_count(query: dict) -> int:
+    """Total for the log viewer header. Unfiltered uses collection metadata;
+    filtered counts are cached per filter for LOG_COUNT_CACHE_SECONDS."""
+    if not query:
+        return await db["logs"].estimated_document_count()
+    
+    key = tuple(sorted(query.items()))
+    cached = _log_count_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    
+    count = await db["logs"].count_documents(query)
+    if len(_log_count_cache) > 1000:
+        _log_count_cache.clear()
+    _log_count_cache[key] = (time.monotonic() + LOG_COUNT_CACHE_SECONDS, count)
+    return count
 
 @api_router.get("/admin/logs")
 async def get_logs(
@@ -5596,14 +7813,18 @@ async def get_logs(
     level: str = None,  # "info", "warning", "error", "critical"
     category: str = None,
     tenant_id: str = None,
-    limit: int = 100,
-    offset: int = 0,
+    cursor: Optional[str] = None,
+    limit: int = LOGS_PAGE_SIZE,
+    include_total: bool = True,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get logs (admin only)"""
+    """Get logs newest first, one page at a time (admin only).
+    Pass back `next_cursor` to get the following page; `total` is an estimate."""
     if current_user.get("user_type") != "admin":
         raise HTTPException(status_code=403, detail="Access denied")
     
+    limit = max(1, min(limit, LOGS_MAX_PAGE_SIZE))
+    
     # Build query
     query = {}
     if log_type:
@@ -5615,11 +7836,24 @@ async def get_logs(
     if tenant_id:
         query["tenant_id"] = tenant_id
     
-    # Get total count
-    total = await db["logs"].count_documents(query)
+    total = await estimate_log_count(query) if include_total else None
+    
+    # Keyset pagination: continue strictly after the last (timestamp, log_id) seen
+    if cursor:
+        last_timestamp, last_log_id = decode_cursor(cursor, 2)
+        query = {"$and": [query, {"$or": [
+            {"timestamp": {"$lt": last_timestamp}},
+            {"timestamp": last_timestamp, "log_id": {"$lt": last_log_id}}
+        ]}]}
     
-    # Get logs with pagination
-    logs = await db["logs"].find(query).sort("timestamp", -1).skip(offset).limit(limit).to_list(limit)
+    logs = await db["logs"].find(query).sort(
+        [("timestamp", DESCENDING), ("log_id", DESCENDING)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        next_cursor = encode_cursor(logs[-1]["timestamp"], logs[-1]["log_id"])
     
     # Convert ObjectId to string
     for log in logs:
@@ -5628,59 +7862,65 @@ async def get_logs(
     return {
         "logs": logs,
         "total": total,
+        "total_estimated": True,
         "limit": limit,
-        "offset": offset
+        "next_cursor": next_cursor
     }
 
 @api_router.get("/admin/logs/stats")
 async def get_logs_stats(current_user: dict = Depends(get_current_user)):
-    """Get log statistics (admin only)"""
+    """Get log statistics (admin only), read from the log_counters buckets"""
     if current_user.get("user_type") != "admin":
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Get counts by level
-    pipeline = [
-        {
-            "$group": {
-                "_id": "$level",
-                "count": {"$sum": 1}
-            }
-        }
-    ]
+    now = datetime.now(timezone.utc)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
     
+    # Per-level totals only count days still inside that level's retention
     level_stats = {}
-    async for doc in db["logs"].aggregate(pipeline):
-        level_stats[doc["_id"]] = doc["count"]
-    
-    # Get counts by category
-    pipeline = [
-        {
-            "$group": {
-                "_id": "$category",
-                "count": {"$sum": 1}
-            }
-        }
-    ]
-    
     category_stats = {}
-    async for doc in db["logs"].aggregate(pipeline):
-        category_stats[doc["_id"]] = doc["count"]
-    
-    # Get recent errors (last 24 hours)
-    yesterday = datetime.now(timezone.utc) - timedelta(days=1)
-    recent_errors = await db["logs"].count_documents({
-        "level": {"$in": ["error", "critical"]},
-        "created_at": {"$gte": yesterday.isoformat()}
-    })
+    oldest_day = today - timedelta(days=max(LOG_RETENTION_DAYS.values()))
+    async for doc in db["log_counters"].find({"bucket": "day", "start": {"$gte": oldest_day}}, {"_id": 0, "start": 1, "counts": 1}):
+        start = doc["start"].replace(tzinfo=timezone.utc)
+        for level_key, categories in doc.get("counts", {}).items():
+            level = stats_label(level_key)
+            retention = LOG_RETENTION_DAYS.get(level, LOG_RETENTION_DAYS["info"])
+            if start < today - timedelta(days=retention):
+                continue
+            for category_key, count in categories.items():
+                category = stats_label(category_key)
+                level_stats[level] = level_stats.get(level, 0) + count
+                category_stats[category] = category_stats.get(category, 0) + count
+    
+    # Hourly sparklines for the last LOG_COUNTER_HOURS hours (oldest first)
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    hours = [current_hour - timedelta(hours=offset) for offset in range(LOG_COUNTER_HOURS - 1, -1, -1)]
+    hourly_total = {hour: 0 for hour in hours}
+    hourly_errors = {hour: 0 for hour in hours}
+    async for doc in db["log_counters"].find({"bucket": "hour", "start": {"$gte": hours[0]}}, {"_id": 0, "start": 1, "counts": 1}):
+        start = doc["start"].replace(tzinfo=timezone.utc)
+        if start not in hourly_total:
+            continue
+        for level_key, categories in doc.get("counts", {}).items():
+            count = sum(categories.values())
+            hourly_total[start] += count
+            if stats_label(level_key) in ("error", "critical"):
+                hourly_errors[start] += count
     
-    # Total logs
-    total_logs = await db["logs"].count_documents({})
+    recent_errors = sum(hourly_errors.values())
+    total_logs = sum(level_stats.values())
     
     return {
         "total_logs": total_logs,
         "level_stats": level_stats,
         "category_stats": category_stats,
-        "recent_errors_24h": recent_errors
+        "hourly": {
+            "hours": [hour.isoformat() for hour in hours],
+            "total": [hourly_total[hour] for hour in hours],
+            "errors": [hourly_errors[hour] for hour in hours]
+        },
+        "recent_errors_24h": recent_errors,
+        "retention_days": LOG_RETENTION_DAYS
     }
 
 @api_router.delete("/admin/logs")
@@ -5688,29 +7928,28 @@ async def clear_logs(
     older_than_days: int = 30,
     current_user: dict = Depends(get_current_user)
 ):
-    """Clear old logs (admin only)"""
+    """Clear old logs (admin only). Routine cleanup happens through the
+    retention TTL index; this is for pruning earlier than LOG_RETENTION_DAYS."""
     if current_user.get("user_type") != "admin":
         raise HTTPException(status_code=403, detail="Access denied")
     
     cutoff_date = datetime.now(timezone.utc) - timedelta(days=older_than_days)
     
-    result = await db["logs"].delete_many({
-        "created_at": {"$lt": cutoff_date.isoformat()}
-    })
+    deleted_count = await delete_logs_before(cutoff_date)
     
     # Log this action
     await create_log(
         log_type="system",
         level="info",
         category="maintenance",
-        message=f"Cleared {result.deleted_count} logs older than {older_than_days} days",
+        message=f"Cleared {deleted_count} logs older than {older_than_days} days",
         user_id=current_user.get("user_id"),
         user_email=current_user.get("email")
     )
     
     return {
-        "message": f"Deleted {result.deleted_count} logs",
-        "deleted_count": result.deleted_count
+        "message": f"Deleted {deleted_count} logs",
+        "deleted_count": deleted_count
     }
 
 # ============ TENANT INTEGRATIONS ENDPOINTS ============
@@ -5983,6 +8222,7 @@ app.add_middleware(
     allow_origins=cors_origins,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging
@@ -5999,6 +8239,51 @@ logger.info(f"CORS Origins configured: {cors_origins}")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat()}
 
+@app.on_event("startup")
+async def ensure_indexes_on_startup():
+    try:
+        summary = await ensure_indexes()
+        failed = [name for name, result in summary.items() if not result["ok"]]
+        if failed:
+            logger.warning(f"Indexes not applied for: {', '.join(failed)}")
+        else:
+            logger.info(f"Indexes ensured for {len(summary)} collections")
+    except Exception as e:
+        # Never block boot on index maintenance
+        logger.error(f"Index bootstrap failed: {e}")
+
+_background_tasks = []
+
+@app.on_event("startup")
+async def start_background_jobs():
+    global _log_writer_task, _ai_usage_writer_task
+    _log_writer_task = asyncio.create_task(log_writer_loop())
+    _ai_usage_writer_task = asyncio.create_task(ai_usage_writer_loop())
+    _background_tasks.append(asyncio.create_task(tenant_stats_reconcile_loop()))
+    _background_tasks.append(asyncio.create_task(daily_stats_rollup_loop()))
+    _background_tasks.append(asyncio.create_task(cycle_stats_loop()))
+    _background_tasks.append(asyncio.create_task(preload_token_encodings()))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in _background_tasks:
+        task.cancel()
+    
+    # Stop the log writer, then flush anything still queued
+    if _log_writer_task:
+        _log_writer_task.cancel()
+        await asyncio.gather(_log_writer_task, return_exceptions=True)
+    await flush_log_queue()
+    
+    # Give streamed answers a moment to be saved, then write their usage
+    if _ai_stream_tasks:
+        await asyncio.wait(list(_ai_stream_tasks), timeout=5)
+    if _ai_usage_writer_task:
+        _ai_usage_writer_task.cancel()
+        await asyncio.gather(_ai_usage_writer_task, return_exceptions=True)
+    await flush_ai_usage_queue()
+    if _ai_client["client"]:
+        await close_ai_client(_ai_client["client"]["client"])
+    
+    _password_executor.shutdown(wait=False)
     client.close()
\ No newline at end of file
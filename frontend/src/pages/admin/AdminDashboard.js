@@ -23,6 +23,21 @@ import StatisticsAnalyzer from '@/components/StatisticsAnalyzer';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Minimal inline SVG trend line for the hourly log counters
+const Sparkline = ({ values = [], color = '#22d3ee', width = 120, height = 28 }) => {
+  if (values.length < 2) return null;
+  const max = Math.max(...values, 1);
+  const step = width / (values.length - 1);
+  const points = values
+    .map((value, index) => `${(index * step).toFixed(1)},${(height - (value / max) * (height - 2) - 1).toFixed(1)}`)
+    .join(' ');
+  return (
+    <svg width={width} height={height} className="mt-2">
+      <polyline points={points} fill="none" stroke={color} strokeWidth="1.5" />
+    </svg>
+  );
+};
+
 const AdminDashboard = () => {
   const navigate = useNavigate();
   const [activeTab, setActiveTab] = useState('overview');
@@ -110,6 +125,7 @@ const AdminDashboard = () => {
     tenant_id: ''
   });
   const [logsPage, setLogsPage] = useState(0);
+  const [logsCursors, setLogsCursors] = useState([null]);
   const [logsTotalCount, setLogsTotalCount] = useState(0);
   const logsLimit = 50;
 
@@ -122,6 +138,16 @@ const AdminDashboard = () => {
     fetchData();
   }, [activeTab]);
 
+  useEffect(() => {
+    if (activeTab === 'logs') fetchData();
+  }, [logsPage]);
+
+  useEffect(() => {
+    // Cursors belong to one filter combination
+    setLogsCursors([null]);
+    setLogsPage(0);
+  }, [logsFilter]);
+
   const fetchData = async () => {
     try {
       setLoading(true);
@@ -186,9 +212,9 @@ const AdminDashboard = () => {
       if (activeTab === 'logs') {
         // Fetch logs with filters
         const params = new URLSearchParams({
-          limit: logsLimit.toString(),
-          offset: (logsPage * logsLimit).toString()
+          limit: logsLimit.toString()
         });
+        if (logsCursors[logsPage]) params.append('cursor', logsCursors[logsPage]);
         if (logsFilter.log_type) params.append('log_type', logsFilter.log_type);
         if (logsFilter.level) params.append('level', logsFilter.level);
         if (logsFilter.category) params.append('category', logsFilter.category);
@@ -197,6 +223,12 @@ const AdminDashboard = () => {
         const logsRes = await axios.get(`${API}/admin/logs?${params}`, config);
         setLogs(logsRes.data.logs);
         setLogsTotalCount(logsRes.data.total);
+        const nextCursor = logsRes.data.next_cursor;
+        setLogsCursors((cursors) => {
+          const updated = cursors.slice(0, logsPage + 1);
+          if (nextCursor) updated.push(nextCursor);
+          return updated;
+        });
         
         // Fetch stats
         const statsRes = await axios.get(`${API}/admin/logs/stats`, config);
@@ -1772,7 +1804,47 @@ const AdminDashboard = () => {
                         </p>
                       </div>
                     </div>
+
+                    {aiStats?.diagnostic_cache && (
+                      <div className="grid grid-cols-2 gap-4 mt-4 pt-4 border-t border-slate-700">
+                        <div>
+                          <p className="text-slate-400 text-sm">Cache diagnostic (hit ratio, {aiStats.diagnostic_cache.days}z)</p>
+                          <p className="text-white text-xl font-bold">
+                            {((aiStats.diagnostic_cache.hit_ratio || 0) * 100).toFixed(1)}%
+                          </p>
+                        </div>
+                        <div>
+                          <p className="text-slate-400 text-sm">Cost economisit (cache)</p>
+                          <p className="text-green-400 text-xl font-bold">
+                            ${aiStats.diagnostic_cache.saved_cost?.toFixed(4) || '0.0000'}
+                          </p>
+                        </div>
+                      </div>
+                    )}
                     
+                    {/* Latency per provider/model */}
+                    {aiStats?.latency_by_model && aiStats.latency_by_model.length > 0 && (
+                      <div className="mt-4 pt-4 border-t border-slate-700">
+                        <h5 className="text-white font-medium mb-3">Latență pe Model (24h)</h5>
+                        <div className="space-y-2 max-h-32 overflow-y-auto">
+                          {aiStats.latency_by_model.map((row) => (
+                            <div key={`${row.provider}-${row.model}`} className="flex justify-between items-center bg-slate-700/30 rounded-lg p-2">
+                              <div>
+                                <p className="text-white text-sm font-medium">{row.model}</p>
+                                <p className="text-slate-400 text-xs">{row.provider} · {row.calls} calls</p>
+                              </div>
+                              <div className="text-right">
+                                <p className="text-cyan-400 text-sm font-medium">p50 {row.latency_p50_ms ?? '-'} ms · p95 {row.latency_p95_ms ?? '-'} ms</p>
+                                {row.ttft_p50_ms != null && (
+                                  <p className="text-slate-400 text-xs">TTFT p50 {row.ttft_p50_ms} ms · p95 {row.ttft_p95_ms} ms</p>
+                                )}
+                              </div>
+                            </div>
+                          ))}
+                        </div>
+                      </div>
+                    )}
+
                     {/* Tenant Usage Breakdown */}
                     {aiStats?.tenant_usage && aiStats.tenant_usage.length > 0 && (
                       <div className="mt-4 pt-4 border-t border-slate-700">
@@ -2076,6 +2148,7 @@ const AdminDashboard = () => {
                       <div>
                         <p className="text-slate-400 text-sm">Total Logs</p>
                         <p className="text-3xl font-bold text-white mt-1">{logsStats.total_logs}</p>
+                        <Sparkline values={logsStats.hourly?.total} color="#22d3ee" />
                       </div>
                       <FileText className="w-10 h-10 text-cyan-400" />
                     </div>
@@ -2088,6 +2161,7 @@ const AdminDashboard = () => {
                       <div>
                         <p className="text-slate-400 text-sm">Erori (24h)</p>
                         <p className="text-3xl font-bold text-red-400 mt-1">{logsStats.recent_errors_24h}</p>
+                        <Sparkline values={logsStats.hourly?.errors} color="#f87171" />
                       </div>
                       <AlertTriangle className="w-10 h-10 text-red-400" />
                     </div>
@@ -2266,15 +2340,15 @@ const AdminDashboard = () => {
                 </div>
 
                 {/* Pagination */}
-                {logsTotalCount > logsLimit && (
+                {(logsPage > 0 || logsCursors.length > logsPage + 1) && (
                   <div className="flex items-center justify-between mt-6 pt-4 border-t border-white/10">
                     <p className="text-slate-400 text-sm">
-                      Afișare {logsPage * logsLimit + 1} - {Math.min((logsPage + 1) * logsLimit, logsTotalCount)} din {logsTotalCount}
+                      Afișare {logsPage * logsLimit + 1} - {logsPage * logsLimit + logs.length} din ~{logsTotalCount}
                     </p>
                     <div className="flex gap-2">
                       <Button
                         size="sm"
-                        onClick={() => { setLogsPage(logsPage - 1); fetchData(); }}
+                        onClick={() => setLogsPage(logsPage - 1)}
                         disabled={logsPage === 0}
                         className="bg-slate-700 hover:bg-slate-600"
                       >
@@ -2282,8 +2356,8 @@ const AdminDashboard = () => {
                       </Button>
                       <Button
                         size="sm"
-                        onClick={() => { setLogsPage(logsPage + 1); fetchData(); }}
-                        disabled={(logsPage + 1) * logsLimit >= logsTotalCount}
+                        onClick={() => setLogsPage(logsPage + 1)}
+                        disabled={logsCursors.length <= logsPage + 1}
                         className="bg-slate-700 hover:bg-slate-600"
                       >
                         Următorul
@@ -143,12 +143,8 @@ const AIChatPage = () => {
     setInputMessage('');
     setIsLoading(true);
 
-    // Simulează delay-ul de typing AI (2-5 secunde)
-    const typingDelay = Math.random() * 3000 + 2000; // 2-5 secunde
-    await new Promise(resolve => setTimeout(resolve, typingDelay));
-
     try {
-      const response = await fetch(`${API}/ai/chat`, {
+      const response = await fetch(`${API}/ai/chat/stream`, {
         method: 'POST',
         headers: authHeaders,
         body: JSON.stringify({
@@ -171,27 +167,66 @@ const AIChatPage = () => {
         throw new Error('Failed to get AI response');
       }
 
-      const data = await response.json();
+      // Server-sent events: `meta`, then `data: {"delta": ...}` chunks, then `done`
+      const aiMessageId = Date.now() + 1;
+      let prefix = '';
+      let content = '';
+      let failed = false;
+      let streamConversationId = null;
+      const updateAiMessage = (timestamp) => {
+        setMessages(prev => prev.map(m => (m.id === aiMessageId ? { ...m, content: prefix + content, ...(timestamp ? { timestamp } : {}) } : m)));
+      };
 
-      // Persist returned conversation_id
-      if (data.conversation_id && data.conversation_id !== conversationId) {
-        setConversationId(data.conversation_id);
-        localStorage.setItem('fixgsm_ai_conversation_id', data.conversation_id);
-        fetchConversations();
-      }
-      
-      const aiMessage = {
-        id: Date.now() + 1,
-        type: 'ai',
-        content: (data.memorized ? '🧠 [Memorizat] ' : '') + (data.response || 'Îmi pare rău, nu am putut procesa cererea ta.'),
-        timestamp: data.timestamp || new Date().toISOString()
+      const handleEvent = (event, data) => {
+        if (event === 'meta') {
+          streamConversationId = data.conversation_id;
+          if (data.memorized) {
+            prefix = '🧠 [Memorizat] ';
+            toast.success('Cunoștință memorată pentru viitor');
+          }
+          setIsLoading(false);
+          setMessages(prev => [...prev, { id: aiMessageId, type: 'ai', content: prefix, timestamp: new Date().toISOString() }]);
+        } else if (event === 'error') {
+          failed = true;
+        } else if (event === 'done') {
+          if (!content) content = 'Îmi pare rău, nu am putut procesa cererea ta.';
+          updateAiMessage(data.timestamp);
+          // Switching conversation reloads messages, so only do it once the answer is saved
+          if (streamConversationId && streamConversationId !== conversationId) {
+            setConversationId(streamConversationId);
+            localStorage.setItem('fixgsm_ai_conversation_id', streamConversationId);
+            fetchConversations();
+          }
+        } else if (data.delta) {
+          content += data.delta;
+          updateAiMessage();
+        }
       };
 
-      if (data.memorized) {
-        toast.success('Cunoștință memorată pentru viitor');
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const raw = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          let event = 'message';
+          let payload = '';
+          raw.split('\n').forEach(line => {
+            if (line.startsWith('event: ')) event = line.slice(7);
+            else if (line.startsWith('data: ')) payload += line.slice(6);
+          });
+          if (payload) handleEvent(event, JSON.parse(payload));
+        }
       }
 
-      setMessages(prev => [...prev, aiMessage]);
+      if (failed) {
+        toast.error('Eroare la comunicarea cu AI-ul');
+      }
     } catch (error) {
       console.error('Error sending message:', error);
       
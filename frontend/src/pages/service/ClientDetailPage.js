@@ -24,10 +24,20 @@ const ClientDetailPage = () => {
   useEffect(() => {
     (async () => {
       try {
-        const res = await axios.get(`${API}/tickets`, config);
-        const all = Array.isArray(res.data) ? res.data : [];
         // clientId e compus ca name|phone când venim din ClientsPage
         const [idName, idPhone] = decodeURIComponent(clientId).split('|');
+        // Filtrăm pe server (telefon, altfel nume) și urmăm X-Next-Cursor prin toate paginile
+        const all = [];
+        let cursor = null;
+        do {
+          const params = new URLSearchParams({ limit: '200' });
+          if (idPhone && idPhone !== '-') params.append('client_phone', idPhone);
+          else if (idName && idName !== '-') params.append('search', idName);
+          if (cursor) params.append('cursor', cursor);
+          const res = await axios.get(`${API}/tickets?${params.toString()}`, config);
+          all.push(...(Array.isArray(res.data) ? res.data : []));
+          cursor = res.headers['x-next-cursor'] || null;
+        } while (cursor);
         const related = all.filter(t => (t.client_name || '-') === idName && (t.client_phone || '-') === idPhone);
         setTickets(related);
         setEdit({ name: idName || '', phone: idPhone || '', email: '' });
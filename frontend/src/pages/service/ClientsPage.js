@@ -14,6 +14,9 @@ const ClientsPage = () => {
   const navigate = useNavigate();
   const [searchTerm, setSearchTerm] = useState('');
   const [currentPage, setCurrentPage] = useState(1);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [searchResults, setSearchResults] = useState(null);
   const PAGE_SIZE = 15;
 
   const token = localStorage.getItem('fixgsm_token');
@@ -25,11 +28,20 @@ const ClientsPage = () => {
         // încercăm endpoint-ul /tenant/clients
         const res = await axios.get(`${API}/tenant/clients`, config);
         setClients(Array.isArray(res.data) ? res.data : (res.data?.clients || []));
+        setNextCursor(res.headers['x-next-cursor'] || null);
       } catch (e) {
         // Fallback: derivăm clienți din tichete dacă endpoint-ul nu există (404)
         try {
-          const ticketsRes = await axios.get(`${API}/tickets`, config);
-          const tickets = Array.isArray(ticketsRes.data) ? ticketsRes.data : [];
+          // /tickets e paginat: urmăm X-Next-Cursor până la ultima pagină
+          const tickets = [];
+          let cursor = null;
+          do {
+            const params = new URLSearchParams({ limit: '200' });
+            if (cursor) params.append('cursor', cursor);
+            const ticketsRes = await axios.get(`${API}/tickets?${params.toString()}`, config);
+            tickets.push(...(Array.isArray(ticketsRes.data) ? ticketsRes.data : []));
+            cursor = ticketsRes.headers['x-next-cursor'] || null;
+          } while (cursor);
           const map = {};
           tickets.forEach(t => {
             const name = t.client_name || '-';
@@ -64,7 +76,44 @@ const ClientsPage = () => {
 
   useEffect(() => { setCurrentPage(1); }, [searchTerm]);
 
-  const filtered = clients.filter(c => {
+  // Căutarea rulează pe server, ca să găsească și clienții din paginile neîncărcate
+  useEffect(() => {
+    const query = searchTerm.trim();
+    if (query.length < 2) {
+      setSearchResults(null);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const res = await axios.get(`${API}/tenant/clients/search?query=${encodeURIComponent(query)}&limit=50`, config);
+        if (!cancelled) setSearchResults(Array.isArray(res.data) ? res.data : []);
+      } catch (_ignored) {
+        // Fără endpoint de căutare: filtrăm doar ce e încărcat
+        if (!cancelled) setSearchResults(null);
+      }
+    }, 300);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchTerm]);
+
+  const loadMoreClients = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const res = await axios.get(`${API}/tenant/clients?cursor=${encodeURIComponent(nextCursor)}`, config);
+      setClients(prev => [...prev, ...res.data]);
+      setNextCursor(res.headers['x-next-cursor'] || null);
+    } catch (_ignored) {
+      setNextCursor(null);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const filtered = searchResults ?? clients.filter(c => {
     const q = searchTerm.toLowerCase();
     return (
       (c.first_name || '').toLowerCase().includes(q) ||
@@ -172,6 +221,18 @@ const ClientsPage = () => {
                 </div>
               </div>
             )}
+            {nextCursor && (
+              <div className="p-4 text-center border-t border-white/10">
+                <Button
+                  onClick={loadMoreClients}
+                  disabled={loadingMore}
+                  className="bg-white/10 hover:bg-white/20 text-white rounded-xl"
+                  data-testid="load-more-clients"
+                >
+                  {loadingMore ? 'Se încarcă...' : 'Încarcă mai mulți clienți'}
+                </Button>
+              </div>
+            )}
           </CardContent>
         </Card>
       </div>
@@ -34,6 +34,9 @@ const ServiceDashboard = () => {
   const [dialogOpen, setDialogOpen] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
   const [selectedLocation, setSelectedLocation] = useState('all');
+  const [debouncedSearch, setDebouncedSearch] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [currentPage, setCurrentPage] = useState(1);
   const PAGE_SIZE = 15;
   const [formData, setFormData] = useState({
@@ -65,6 +68,7 @@ const ServiceDashboard = () => {
   const [selectedTicketForMessage, setSelectedTicketForMessage] = useState(null);
   const statusDropdownRef = useRef(null);
   const actionsDropdownRef = useRef(null);
+  const ticketsRequestRef = useRef(0);
 
   const token = localStorage.getItem('fixgsm_token');
   const userName = localStorage.getItem('fixgsm_name');
@@ -75,11 +79,22 @@ const ServiceDashboard = () => {
 
   useEffect(() => {
     fetchData();
-  }, [selectedLocation]);
+  }, []);
+
+  // Search and location run on the server, so older pages are searched too
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(searchTerm.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  useEffect(() => {
+    fetchTickets();
+  }, [selectedLocation, debouncedSearch]);
+
   // Reset pagination when filters/search change
   useEffect(() => {
     setCurrentPage(1);
-  }, [searchTerm, selectedLocation]);
+  }, [debouncedSearch, selectedLocation]);
 
   useEffect(() => {
     const handleCreateTicket = () => {
@@ -123,25 +138,69 @@ const ServiceDashboard = () => {
 
   const fetchData = async () => {
     try {
-      const locationParam = selectedLocation !== 'all' ? `?location_id=${selectedLocation}` : '';
-      const [statsRes, ticketsRes, locationsRes, statusesRes] = await Promise.all([
+      const [statsRes, locationsRes, statusesRes] = await Promise.all([
         axios.get(`${API}/tenant/dashboard-stats`, config),
-        axios.get(`${API}/tickets${locationParam}`, config),
         axios.get(`${API}/tenant/locations`, config),
         axios.get(`${API}/tenant/custom-statuses`, config)
       ]);
       setStats(statsRes.data);
-      setTickets(ticketsRes.data);
       setLocations(locationsRes.data);
       setStatuses(statusesRes.data.statuses || []);
     } catch (error) {
       console.error('Error fetching data:', error);
       toast.error('Eroare la încărcarea datelor');
+    }
+  };
+
+  const ticketParams = (cursor) => {
+    const params = new URLSearchParams();
+    if (selectedLocation !== 'all') params.append('location_id', selectedLocation);
+    if (debouncedSearch) params.append('search', debouncedSearch);
+    if (cursor) params.append('cursor', cursor);
+    return params.toString();
+  };
+
+  const fetchTickets = async () => {
+    // Ignore responses for filters that have since changed
+    const requestId = ++ticketsRequestRef.current;
+    try {
+      const res = await axios.get(`${API}/tickets?${ticketParams()}`, config);
+      if (requestId !== ticketsRequestRef.current) return;
+      setTickets(res.data);
+      setNextCursor(res.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error fetching tickets:', error);
+      toast.error('Eroare la încărcarea datelor');
     } finally {
-      setLoading(false);
+      if (requestId === ticketsRequestRef.current) setLoading(false);
     }
   };
 
+  const loadMoreTickets = async () => {
+    if (!nextCursor) return false;
+    setLoadingMore(true);
+    const requestId = ticketsRequestRef.current;
+    try {
+      const res = await axios.get(`${API}/tickets?${ticketParams(nextCursor)}`, config);
+      if (requestId !== ticketsRequestRef.current) return false;
+      setTickets(prev => [...prev, ...res.data]);
+      setNextCursor(res.headers['x-next-cursor'] || null);
+      return res.data.length > 0;
+    } catch (error) {
+      console.error('Error loading more tickets:', error);
+      toast.error('Eroare la încărcarea datelor');
+      return false;
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const goToNextPage = async () => {
+    // The last loaded page continues from the server's cursor
+    if (currentPage === totalPages && !(await loadMoreTickets())) return;
+    setCurrentPage(p => p + 1);
+  };
+
   // Client search functionality
   const searchClients = async (query) => {
     console.log('DEBUG: Searching clients for query:', query);
@@ -216,6 +275,8 @@ const ServiceDashboard = () => {
       setClientSearchResults([]);
       setShowClientDropdown(false);
       fetchData();
+      setCurrentPage(1);
+      fetchTickets();
     } catch (error) {
       console.error('Error creating ticket:', error);
       toast.error('Eroare la crearea fișei');
@@ -276,6 +337,8 @@ const ServiceDashboard = () => {
     try {
       await axios.put(`${API}/tickets/${ticketId}`, { status: newStatus }, config);
       toast.success(`Status actualizat la "${newStatus}"`);
+      // Update in place so the loaded pages and current page are kept
+      setTickets(prev => prev.map(ticket => (ticket.ticket_id === ticketId ? { ...ticket, status: newStatus } : ticket)));
       fetchData();
       setOpenStatusDropdown(null);
     } catch (error) {
@@ -392,19 +455,10 @@ const ServiceDashboard = () => {
     return labels[category] || category;
   };
 
-  const filteredTickets = tickets.filter(ticket => {
-    const searchLower = searchTerm.toLowerCase();
-    return (
-      ticket.ticket_id.toLowerCase().includes(searchLower) ||
-      ticket.client_name.toLowerCase().includes(searchLower) ||
-      ticket.device_model.toLowerCase().includes(searchLower) ||
-      ticket.client_phone.includes(searchTerm)
-    );
-  });
-
-  const totalPages = Math.max(1, Math.ceil(filteredTickets.length / PAGE_SIZE));
+  // Pages of PAGE_SIZE over the tickets loaded so far; more are fetched on demand
+  const totalPages = Math.max(1, Math.ceil(tickets.length / PAGE_SIZE));
   const startIndex = (currentPage - 1) * PAGE_SIZE;
-  const visibleTickets = filteredTickets.slice(startIndex, startIndex + PAGE_SIZE);
+  const visibleTickets = tickets.slice(startIndex, startIndex + PAGE_SIZE);
   const formatLei = (value) => new Intl.NumberFormat('ro-RO', { minimumFractionDigits: 0, maximumFractionDigits: 2 }).format(value);
   const toText = (value) => {
     if (value === null || value === undefined) return '-';
@@ -1030,10 +1084,10 @@ const ServiceDashboard = () => {
         )}
 
         {/* Tickets Table */}
-        {filteredTickets.length === 0 ? (
+        {tickets.length === 0 ? (
           <Card className="glass-effect rounded-3xl border border-white/10 shadow-2xl shadow-black/20">
             <CardContent className="py-16 text-center text-slate-400 text-xl" data-testid="no-tickets">
-              {searchTerm ? 'Nu s-au găsit fișe' : 'Nu există fișe de service. Creează prima fișă!'}
+              {debouncedSearch ? 'Nu s-au găsit fișe' : 'Nu există fișe de service. Creează prima fișă!'}
             </CardContent>
           </Card>
         ) : (
@@ -1123,10 +1177,10 @@ const ServiceDashboard = () => {
                 </table>
               </div>
               {/* Pagination */}
-              {totalPages > 1 && (
+              {(totalPages > 1 || nextCursor) && (
                 <div className="flex items-center justify-between p-4">
                   <div className="text-slate-400 text-sm">
-                    Afișate {startIndex + 1}-{Math.min(startIndex + PAGE_SIZE, filteredTickets.length)} din {filteredTickets.length}
+                    Afișate {startIndex + 1}-{Math.min(startIndex + PAGE_SIZE, tickets.length)} din {tickets.length}{nextCursor ? '+' : ''}
                   </div>
                   <div className="flex items-center gap-2">
                     <Button
@@ -1138,12 +1192,12 @@ const ServiceDashboard = () => {
                       Înapoi
                     </Button>
                     <div className="text-slate-300 text-sm">
-                      Pagina {currentPage} / {totalPages}
+                      Pagina {currentPage} / {totalPages}{nextCursor ? '+' : ''}
                     </div>
                     <Button
                       className="bg-gradient-to-r from-cyan-500 to-blue-500 hover:from-cyan-600 hover:to-blue-600 rounded-xl h-9"
-                      disabled={currentPage === totalPages}
-                      onClick={(e) => { e.stopPropagation(); setCurrentPage(p => Math.min(totalPages, p + 1)); }}
+                      disabled={loadingMore || (currentPage === totalPages && !nextCursor)}
+                      onClick={(e) => { e.stopPropagation(); goToNextPage(); }}
                     >
                       Înainte
                     </Button>
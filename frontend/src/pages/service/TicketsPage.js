@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import DashboardLayout from '@/components/layout/DashboardLayout';
@@ -24,9 +24,15 @@ const TicketsPage = () => {
   const [locations, setLocations] = useState([]);
   const [statuses, setStatuses] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [dialogOpen, setDialogOpen] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
+  const [debouncedSearch, setDebouncedSearch] = useState('');
   const [selectedLocation, setSelectedLocation] = useState('all');
+  const [selectedStatus, setSelectedStatus] = useState('all');
+  const [urgentOnly, setUrgentOnly] = useState(false);
+  const ticketsRequestRef = useRef(0);
   const [formData, setFormData] = useState({
     client_name: '',
     client_phone: '',
@@ -55,7 +61,17 @@ const TicketsPage = () => {
 
   useEffect(() => {
     fetchData();
-  }, [selectedLocation]);
+  }, []);
+
+  // Search and filters run on the server, so older pages are searched too
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(searchTerm.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  useEffect(() => {
+    fetchTickets();
+  }, [selectedLocation, selectedStatus, urgentOnly, debouncedSearch]);
 
   // Close dropdown when clicking outside
   useEffect(() => {
@@ -74,20 +90,58 @@ const TicketsPage = () => {
 
   const fetchData = async () => {
     try {
-      const locationParam = selectedLocation !== 'all' ? `?location_id=${selectedLocation}` : '';
-      const [ticketsRes, locationsRes, statusesRes] = await Promise.all([
-        axios.get(`${API}/tickets${locationParam}`, config),
+      const [locationsRes, statusesRes] = await Promise.all([
         axios.get(`${API}/tenant/locations`, config),
         axios.get(`${API}/tenant/custom-statuses`, config)
       ]);
-      setTickets(ticketsRes.data);
       setLocations(locationsRes.data);
       setStatuses(statusesRes.data.statuses || []);
     } catch (error) {
       console.error('Error fetching data:', error);
       toast.error('Eroare la încărcarea datelor');
+    }
+  };
+
+  const ticketParams = (cursor) => {
+    const params = new URLSearchParams();
+    if (selectedLocation !== 'all') params.append('location_id', selectedLocation);
+    if (selectedStatus !== 'all') params.append('status', selectedStatus);
+    if (urgentOnly) params.append('urgent', 'true');
+    if (debouncedSearch) params.append('search', debouncedSearch);
+    if (cursor) params.append('cursor', cursor);
+    return params.toString();
+  };
+
+  const fetchTickets = async () => {
+    // Ignore responses for filters that have since changed
+    const requestId = ++ticketsRequestRef.current;
+    try {
+      const res = await axios.get(`${API}/tickets?${ticketParams()}`, config);
+      if (requestId !== ticketsRequestRef.current) return;
+      setTickets(res.data);
+      setNextCursor(res.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error fetching tickets:', error);
+      toast.error('Eroare la încărcarea datelor');
     } finally {
-      setLoading(false);
+      if (requestId === ticketsRequestRef.current) setLoading(false);
+    }
+  };
+
+  const loadMoreTickets = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    const requestId = ticketsRequestRef.current;
+    try {
+      const res = await axios.get(`${API}/tickets?${ticketParams(nextCursor)}`, config);
+      if (requestId !== ticketsRequestRef.current) return;
+      setTickets(prev => [...prev, ...res.data]);
+      setNextCursor(res.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error loading more tickets:', error);
+      toast.error('Eroare la încărcarea datelor');
+    } finally {
+      setLoadingMore(false);
     }
   };
 
@@ -164,7 +218,7 @@ const TicketsPage = () => {
       setSelectedClient(null);
       setClientSearchResults([]);
       setShowClientDropdown(false);
-      fetchData();
+      fetchTickets();
     } catch (error) {
       console.error('Error creating ticket:', error);
       toast.error('Eroare la crearea fișei');
@@ -193,16 +247,6 @@ const TicketsPage = () => {
     return location?.location_name || 'N/A';
   };
 
-  const filteredTickets = tickets.filter(ticket => {
-    const searchLower = searchTerm.toLowerCase();
-    return (
-      ticket.ticket_id.toLowerCase().includes(searchLower) ||
-      ticket.client_name.toLowerCase().includes(searchLower) ||
-      ticket.device_model.toLowerCase().includes(searchLower) ||
-      ticket.client_phone.includes(searchTerm)
-    );
-  });
-
   return (
     <DashboardLayout>
       <div className="p-6 space-y-6">
@@ -597,6 +641,28 @@ const TicketsPage = () => {
                   </Select>
                 </div>
               )}
+              <Select value={selectedStatus} onValueChange={setSelectedStatus}>
+                <SelectTrigger className="bg-slate-800/50 border-slate-700 text-white w-full md:w-56 h-12 rounded-xl focus:border-cyan-500 focus:ring-cyan-500/20 transition-all duration-300" data-testid="status-filter">
+                  <SelectValue />
+                </SelectTrigger>
+                <SelectContent className="bg-slate-800 border-slate-700 rounded-xl">
+                  <SelectItem value="all" className="text-white">Toate statusurile</SelectItem>
+                  {statuses.map((status) => (
+                    <SelectItem key={status.label} value={status.label} className="text-white">
+                      {status.label}
+                    </SelectItem>
+                  ))}
+                </SelectContent>
+              </Select>
+              <Button
+                type="button"
+                onClick={() => setUrgentOnly(!urgentOnly)}
+                className={`h-12 rounded-xl ${urgentOnly ? 'bg-red-500/80 hover:bg-red-500 text-white' : 'bg-white/10 hover:bg-white/20 text-slate-300'}`}
+                data-testid="urgent-filter"
+              >
+                <AlertTriangle className="w-4 h-4 mr-2" />
+                Urgente
+              </Button>
             </div>
           </CardContent>
         </Card>
@@ -604,10 +670,10 @@ const TicketsPage = () => {
         {/* Tickets Table */}
         {loading ? (
           <div className="text-white text-center py-12">Se încarcă...</div>
-        ) : filteredTickets.length === 0 ? (
+        ) : tickets.length === 0 ? (
           <Card className="glass-effect rounded-3xl border border-white/10 shadow-2xl shadow-black/20">
             <CardContent className="py-16 text-center text-slate-400 text-xl" data-testid="no-tickets">
-              {searchTerm ? 'Nu s-au găsit fișe' : 'Nu există fișe de service. Creează prima fișă!'}
+              {debouncedSearch || selectedStatus !== 'all' || urgentOnly ? 'Nu s-au găsit fișe' : 'Nu există fișe de service. Creează prima fișă!'}
             </CardContent>
           </Card>
         ) : (
@@ -625,7 +691,7 @@ const TicketsPage = () => {
                     </tr>
                   </thead>
                   <tbody>
-                    {filteredTickets.map((ticket) => (
+                    {tickets.map((ticket) => (
                       <tr
                         key={ticket.ticket_id}
                         className="border-b border-white/5 hover:bg-white/5 cursor-pointer transition-all duration-300"
@@ -666,6 +732,18 @@ const TicketsPage = () => {
                   </tbody>
                 </table>
               </div>
+              {nextCursor && (
+                <div className="p-6 text-center border-t border-white/10">
+                  <Button
+                    onClick={loadMoreTickets}
+                    disabled={loadingMore}
+                    className="bg-white/10 hover:bg-white/20 text-white rounded-xl"
+                    data-testid="load-more-tickets"
+                  >
+                    {loadingMore ? 'Se încarcă...' : 'Încarcă mai multe'}
+                  </Button>
+                </div>
+              )}
             </CardContent>
           </Card>
         )}
@@ -0,0 +1,28 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# server.py reads these at import time; tests swap server.db for mongomock
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "fixgsm_test")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """server.db on an empty in-memory database, with the per-process caches reset"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import server
+
+    database = mongomock_motor.AsyncMongoMockClient()["fixgsm_test"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "_seeded_ticket_counters", set())
+    monkeypatch.setattr(server, "_ticket_number_blocks", {})
+    monkeypatch.setattr(server, "_ticket_number_locks", {})
+    monkeypatch.setattr(server, "_knowledge_indexes", server.OrderedDict())
+    monkeypatch.setattr(server, "_knowledge_builds", {})
+    monkeypatch.setattr(server, "_credentials_backfill", {"done": False, "checked_at": 0.0})
+    return database
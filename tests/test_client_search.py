@@ -0,0 +1,30 @@
+import server
+
+
+def test_fold_text_strips_romanian_diacritics():
+    assert server.fold_text("Ștefan Țăran Îndrăzneț Â") == "stefan taran indraznet a"
+    assert server.fold_text(None) == ""
+
+
+def test_phone_digits_uses_national_form():
+    assert server.phone_digits("+40 722 123 456") == "0722123456"
+    assert server.phone_digits("0040722123456") == "0722123456"
+    assert server.phone_digits("40722123456") == "0722123456"
+    assert server.phone_digits("0722-123-456") == "0722123456"
+
+
+def test_client_query_tokens_keeps_a_spaced_phone_number_whole():
+    assert server.client_query_tokens("0722 123 456") == ["0722123456"]
+    assert server.client_query_tokens("+40 (722) 123.456") == ["0722123456"]
+
+
+def test_client_query_tokens_splits_folded_words_and_drops_short_ones():
+    assert server.client_query_tokens("Ion Ștefănescu") == ["ion", "stefanescu"]
+    assert server.client_query_tokens("a popescu-ionescu") == ["popescu", "ionescu"]
+    assert server.client_query_tokens("x" * 40) == ["x" * server.CLIENT_SEARCH_MAX_TOKEN]
+
+
+def test_query_tokens_match_the_stored_search_tokens():
+    stored = set(server.client_search_tokens("Ion Ștefănescu", "+40 722 123 456"))
+    for query in ("ștef", "ion ste", "0722 12", "722123"):
+        assert set(server.client_query_tokens(query)) <= stored
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+OWNER = {"user_id": "t1", "user_type": "tenant_owner", "tenant_id": "t1", "email": "owner@service.ro"}
+
+
+def test_claim_credential_refuses_an_email_owned_by_someone_else(db):
+    async def scenario():
+        await server.ensure_indexes()
+        mine = await server.claim_credential("Owner@Service.ro", "tenant_owner", "t1", "t1")
+        again = await server.claim_credential("owner@service.ro ", "tenant_owner", "t1", "t1")
+        theirs = await server.claim_credential("owner@service.ro", "employee", "u2", "t2")
+        return mine, again, theirs, await db.credentials.count_documents({})
+
+    assert asyncio.run(scenario()) == (True, True, False, 1)
+
+
+def test_company_email_change_moves_the_owner_login(db):
+    async def scenario():
+        await server.ensure_indexes()
+        await db.tenants.insert_one({"tenant_id": "t1", "email": "owner@service.ro"})
+        await server.upsert_credential("owner@service.ro", "tenant_owner", "t1", "t1")
+        await server.upsert_credential("taken@service.ro", "employee", "u2", "t2")
+
+        with pytest.raises(HTTPException) as taken:
+            await server.update_company_info(server.CompanyInfoUpdate(email="taken@service.ro"), OWNER)
+        await server.update_company_info(server.CompanyInfoUpdate(email="New@Service.ro"), OWNER)
+        return (
+            taken.value.status_code,
+            await server.resolve_credential("new@service.ro"),
+            await server.resolve_credential("owner@service.ro"),
+        )
+
+    status_code, new, old = asyncio.run(scenario())
+    assert status_code == 400
+    assert (new["principal_type"], new["principal_id"]) == ("tenant_owner", "t1")
+    assert old is None
+
+
+def test_legacy_lookup_stops_once_the_backfill_has_run(db, monkeypatch):
+    monkeypatch.setattr(server, "CREDENTIALS_LEGACY_FALLBACK", "auto")
+
+    async def scenario():
+        await db.users.insert_many([
+            {"user_id": "u1", "tenant_id": "t1", "email": "Ana@Service.ro"},
+            {"user_id": "u2", "tenant_id": "t1", "email": "dan@service.ro"},
+        ])
+        before = await server.resolve_credential("ana@service.ro")
+        await db.job_state.insert_one({"job_id": "credentials_backfill", "completed_at": "2026-01-01T00:00:00+00:00"})
+        server._credentials_backfill["checked_at"] = 0.0
+        after = await server.resolve_credential("dan@service.ro")
+        return before, after
+
+    before, after = asyncio.run(scenario())
+    # Found through the case-insensitive legacy lookup, then stored
+    assert before["principal_id"] == "u1"
+    assert after is None
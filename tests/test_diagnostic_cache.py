@@ -0,0 +1,39 @@
+import server
+
+
+def test_canonical_device_model_ignores_brand_spacing_and_suffix_order():
+    assert server.canonical_device_model("Apple iPhone12 Pro-Max") == "iphone 12 max pro"
+    assert server.canonical_device_model("iphone 12 max pro") == "iphone 12 max pro"
+    assert server.canonical_device_model("Samsung Galaxy S21") == "s 21"
+
+
+def test_canonical_device_model_reads_plus_as_a_model_suffix():
+    assert server.canonical_device_model("Galaxy Note 10+") == "note 10 plus"
+    assert server.canonical_device_model("Galaxy Note 10+") != server.canonical_device_model("Note 10")
+    assert server.canonical_device_model("iPhone 8+") == server.canonical_device_model("iPhone 8 Plus")
+    assert server.canonical_device_model("iPhone 8+") != server.canonical_device_model("iPhone 8")
+
+
+def test_normalize_symptoms_folds_diacritics_and_drops_stop_words():
+    assert server.normalize_symptoms("Telefonul NU se încarcă!") == "nu incarca"
+
+
+def test_normalize_symptoms_keeps_frequency_and_intensity_qualifiers():
+    assert server.normalize_symptoms("se stinge uneori") != server.normalize_symptoms("se stinge")
+    assert server.normalize_symptoms("nu se încarcă deloc") != server.normalize_symptoms("nu se încarcă")
+    assert server.normalize_symptoms("nu mai merge") != server.normalize_symptoms("nu merge")
+    assert server.normalize_symptoms("se încălzește foarte tare") == "incalzeste foarte tare"
+
+
+def test_normalize_symptoms_keeps_negation_with_its_word():
+    first = server.normalize_symptoms("camera nu merge, ecranul merge")
+    second = server.normalize_symptoms("ecranul nu merge, camera merge")
+    assert first == "camera nu merge ecranul merge"
+    assert first != second
+
+
+def test_diagnostic_cache_key_depends_on_provider_and_model():
+    ai = {"provider": "openai", "model": "gpt-4o-mini"}
+    key = server.diagnostic_cache_key(ai, "iPhone 12", "nu porneste")
+    assert key == server.diagnostic_cache_key(ai, "Apple iPhone12", "Nu pornește")
+    assert key != server.diagnostic_cache_key({**ai, "model": "gpt-4o"}, "iPhone 12", "nu porneste")
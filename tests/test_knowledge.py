@@ -0,0 +1,53 @@
+import asyncio
+
+import server
+
+
+def note(knowledge_id, title, content):
+    return {"tenant_id": "t1", "knowledge_id": knowledge_id, "title": title, "content": content,
+            "updated_at": f"2026-01-01T00:00:{knowledge_id[-2:]}"}
+
+
+def test_rare_terms_and_titles_rank_first(db):
+    notes = [
+        note("k01", "Baterie umflată", "Baterie umflată la iPhone 11, înlocuită cu una nouă."),
+        note("k02", "Ecran spart", "Ecran spart, schimbat ecranul complet; bateria verificată."),
+        note("k03", "Port încărcare", "Portul de încărcare era plin de scame; curățat."),
+    ] + [note(f"k{i:02d}", f"Reparație {i}", "Ecran schimbat, verificat funcționarea.") for i in range(10, 40)]
+
+    async def scenario():
+        await db.ai_knowledge.insert_many(notes)
+        return (
+            await server.retrieve_knowledge("t1", "baterie umflata"),
+            await server.retrieve_knowledge("t1", "ecran schimbat"),
+            await server.retrieve_knowledge("t1", "scame port", top_k=1),
+        )
+
+    battery, screen, port = asyncio.run(scenario())
+    assert battery[0]["knowledge_id"] == "k01"
+    assert all(result["knowledge_id"] != "k03" for result in screen)
+    assert [result["knowledge_id"] for result in port] == ["k03"]
+
+
+def test_retrieval_is_limited_to_the_tenant_and_the_token_budget(db):
+    notes = [note(f"k{i:02d}", "Difuzor", "difuzor " * 400) for i in range(10, 15)]
+    notes.append({**note("k99", "Difuzor", "difuzor"), "tenant_id": "t2"})
+
+    async def scenario():
+        await db.ai_knowledge.insert_many(notes)
+        return await server.retrieve_knowledge("t1", "difuzor", token_budget=300)
+
+    results = asyncio.run(scenario())
+    assert results and all(result["knowledge_id"] != "k99" for result in results)
+    used = sum(server.estimate_tokens(r["title"]) + server.estimate_tokens(r["snippet"]) for r in results)
+    assert used <= 300
+
+
+def test_notes_added_after_the_build_are_searchable(db):
+    async def scenario():
+        await db.ai_knowledge.insert_one(note("k10", "Ecran", "ecran schimbat"))
+        await server.get_knowledge_index("t1")
+        server.index_knowledge(note("k11", "Microfon", "microfon curatat"))
+        return await server.retrieve_knowledge("t1", "microfon")
+
+    assert [result["knowledge_id"] for result in asyncio.run(scenario())] == ["k11"]
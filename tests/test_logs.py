@@ -0,0 +1,48 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import server
+
+CUTOFF = datetime(2026, 3, 10, 14, 30, tzinfo=timezone.utc)
+
+
+def log_entry(minutes):
+    logged_at = CUTOFF + timedelta(minutes=minutes)
+    return {"log_id": str(minutes), "level": "info", "category": "api",
+            "timestamp": logged_at.timestamp(), "logged_at": logged_at}
+
+
+def test_clearing_logs_keeps_counter_buckets_exact(db):
+    entries = [log_entry(minutes) for minutes in (-2 * 24 * 60, -20 * 60, -45, -10, 5, 20, 3 * 60)]
+
+    async def scenario():
+        await db.logs.insert_many([dict(entry) for entry in entries])
+        await server.record_log_counters(entries)
+        deleted = await server.delete_logs_before(CUTOFF)
+        buckets = await db.log_counters.find({}, {"_id": 0, "bucket": 1, "start": 1, "counts": 1}).to_list(None)
+        return deleted, buckets
+
+    deleted, buckets = asyncio.run(scenario())
+    assert deleted == 4
+    counts = {(bucket["bucket"], bucket["start"].replace(tzinfo=timezone.utc)): bucket["counts"]["info"]["api"]
+              for bucket in buckets}
+    assert counts == {
+        # The cutoff's day and hour keep only the entries that were not deleted
+        ("day", datetime(2026, 3, 10, tzinfo=timezone.utc)): 3,
+        ("hour", datetime(2026, 3, 10, 14, tzinfo=timezone.utc)): 2,
+        ("hour", datetime(2026, 3, 10, 17, tzinfo=timezone.utc)): 1,
+    }
+
+
+def test_clearing_on_a_bucket_boundary_keeps_the_next_bucket(db):
+    boundary = datetime(2026, 3, 10, 14, tzinfo=timezone.utc)
+    entries = [log_entry(minutes) for minutes in (-31, -29)]
+
+    async def scenario():
+        await db.logs.insert_many([dict(entry) for entry in entries])
+        await server.record_log_counters(entries)
+        await server.delete_logs_before(boundary)
+        return await db.log_counters.find({"bucket": "hour"}, {"_id": 0, "start": 1, "counts": 1}).to_list(None)
+
+    hours = asyncio.run(scenario())
+    assert [(bucket["start"].hour, bucket["counts"]["info"]["api"]) for bucket in hours] == [(14, 1)]
@@ -0,0 +1,34 @@
+import asyncio
+
+import server
+
+
+def test_ticket_ids_come_from_reserved_blocks(db, monkeypatch):
+    monkeypatch.setattr(server, "TICKET_ID_BLOCK_SIZE", 5)
+
+    async def scenario():
+        ids = await asyncio.gather(*(server.generate_ticket_id("t1") for _ in range(12)))
+        counter = await db.counters.find_one({"counter_id": "ticket_number", "tenant_id": "t1"})
+        return ids, counter["value"]
+
+    ids, counter = asyncio.run(scenario())
+    first = server.LEGACY_TICKET_NUMBER_MAX + 1
+    assert sorted(ids, key=lambda ticket_id: int(ticket_id[3:])) == [f"BMP{n}" for n in range(first, first + 12)]
+    # Three blocks of five reserved; the last one is still partly unused
+    assert counter == server.LEGACY_TICKET_NUMBER_MAX + 15
+
+
+def test_workers_never_hand_out_the_same_number(db, monkeypatch):
+    monkeypatch.setattr(server, "TICKET_ID_BLOCK_SIZE", 3)
+
+    async def scenario():
+        worker_a = await asyncio.gather(*(server.generate_ticket_id("t1") for _ in range(4)))
+        # A second process has its own blocks but shares the counter
+        server._ticket_number_blocks.clear()
+        worker_b = await asyncio.gather(*(server.generate_ticket_id("t1") for _ in range(4)))
+        other_tenant = await server.generate_ticket_id("t2")
+        return worker_a, worker_b, other_tenant
+
+    worker_a, worker_b, other_tenant = asyncio.run(scenario())
+    assert not set(worker_a) & set(worker_b)
+    assert other_tenant == f"BMP{server.LEGACY_TICKET_NUMBER_MAX + 1}"
@@ -0,0 +1,39 @@
+import asyncio
+
+from fastapi import Response
+
+import server
+
+OWNER = {"user_id": "t1", "user_type": "tenant_owner", "tenant_id": "t1"}
+
+
+def ticket(number, client_name, client_phone, device_model, tenant_id="t1"):
+    doc = {"ticket_id": f"BMP{number}", "tenant_id": tenant_id, "location_id": "l1", "created_by_user_id": "t1",
+           "client_name": client_name, "client_phone": client_phone, "device_model": device_model,
+           "imei": "", "visual_aspect": "", "reported_issue": "", "service_operations": "", "access_code": "",
+           "colors": "", "defect_cause": "", "observations": "", "estimated_cost": 0, "urgent": False,
+           "status": "Dispozitiv Receptionat", "created_at": f"2026-01-01T00:00:{number % 60:02d}+00:00"}
+    return {**doc, "search_tokens": server.ticket_search_tokens(doc)}
+
+
+def search(db, *queries):
+    async def scenario():
+        await server.ensure_indexes()
+        await db.tickets.insert_many([
+            ticket(1001, "Ion Ștefănescu", "+40 722 123 456", "Apple iPhone12 Pro"),
+            ticket(1002, "Maria Pop", "0733 000 111", "Samsung Galaxy S21"),
+            ticket(1003, "Ion Popa", "0744 999 888", "Xiaomi Redmi Note 10", tenant_id="t2"),
+        ])
+        return [await server.get_tickets(Response(), search=query, current_user=OWNER) for query in queries]
+
+    return [[result["ticket_id"] for result in results] for results in asyncio.run(scenario())]
+
+
+def test_search_matches_word_prefixes_across_fields(db):
+    assert search(db, "stef", "ion iphone 12", "0722 123", "bmp1002", "1002") == [
+        ["BMP1001"], ["BMP1001"], ["BMP1001"], ["BMP1002"], ["BMP1002"]
+    ]
+
+
+def test_search_stays_within_the_tenant(db):
+    assert search(db, "pop", "redmi") == [["BMP1002"], []]